@@ -37,11 +37,20 @@ LANGS = {
         'split_method_table': '按表格单元分块',
         'block_size': '每个文本块的最大字符数 (100-5000)：',
         'overlap': '重叠率(%)：',
+        'block_unit': '块大小单位：',
+        'block_unit_chars': '字符',
+        'block_unit_tokens': 'Token',
+        'snap_boundaries': '在句子边界处切分',
         'start_split': '开始分块',
         'splitting': '分块中...',
         'progress': '进度：',
         'split_done': '分块完成！',
         'split_fail': '分块失败',
+        'preview_split': '预览分块',
+        'preview_fail': '预览失败',
+        'preview_chunks': '分块数：',
+        'preview_length': '长度（最小 / 平均 / 最大）：',
+        'preview_tokens': 'Token 总数：',
         # 分块管理页面相关
         'chunk_manage': '分块管理',
         'chunk_content': '分块内容',
@@ -92,6 +101,10 @@ LANGS = {
         'test_success': '连接成功',
         'test_fail': '连接失败',
         'generate_qa_count': '生成QA对数量',
+        'qa_dedup': '重复分块',
+        'qa_dedup_none': '照常生成',
+        'qa_dedup_skip': '跳过',
+        'qa_dedup_reuse': '复用已有QA',
         'generate_by_llm': '大模型生成',
         'model_generate': '模型生成',
         'operation': '操作',
@@ -155,11 +168,20 @@ LANGS = {
         'split_method_table': 'By Table Cell',
         'block_size': 'Max block size (100-5000):',
         'overlap': 'Overlap(%):',
+        'block_unit': 'Block size unit:',
+        'block_unit_chars': 'Characters',
+        'block_unit_tokens': 'Tokens',
+        'snap_boundaries': 'Cut at sentence boundaries',
         'start_split': 'Start Split',
         'splitting': 'Splitting...',
         'progress': 'Progress:',
         'split_done': 'Split Done!',
         'split_fail': 'Split Failed',
+        'preview_split': 'Preview',
+        'preview_fail': 'Preview Failed',
+        'preview_chunks': 'Chunks: ',
+        'preview_length': 'Length (min / mean / max): ',
+        'preview_tokens': 'Total tokens: ',
         # Chunk management related
         'chunk_manage': 'Chunk Management',
         'chunk_content': 'Chunk Content',
@@ -210,6 +232,10 @@ LANGS = {
         'test_success': 'Test Success',
         'test_fail': 'Test Failed',
         'generate_qa_count': 'QA Pairs to Generate',
+        'qa_dedup': 'Duplicate Chunks',
+        'qa_dedup_none': 'Generate Anyway',
+        'qa_dedup_skip': 'Skip',
+        'qa_dedup_reuse': 'Reuse Existing QA',
         'generate_by_llm': 'Generate by LLM',
         'model_generate': 'Model Generate',
         'operation': 'Operation',
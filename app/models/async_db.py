@@ -0,0 +1,55 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Sequence, TypeVar, Union
+
+from app.models.connection import DATABASE_PATH, get_connection
+
+# 专用于数据库访问的线程数；SQLite 写入本身串行，多出的线程用于并发读
+DB_THREADS = int(os.getenv("DB_THREADS", 4))
+
+Params = Union[Sequence[Any], dict]
+T = TypeVar("T")
+
+class AsyncDatabase:
+    """供 async 接口使用的数据访问层：所有 SQLite 调用都在专用线程池中执行，不阻塞事件循环
+
+    每个线程复用 connection.py 中预先调好 PRAGMA 的长连接；
+    run() 把一段需要多条语句的同步逻辑整体放到线程中执行，成功时提交，异常时回滚。
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, workers: int = DB_THREADS):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+
+    def _call(self, fn: Callable[..., T], args, kwargs) -> T:
+        conn = get_connection(self.path)
+        try:
+            result = fn(conn, *args, **kwargs)
+            conn.commit()
+            return result
+        finally:
+            # 未提交的事务（出错时）在归还时回滚
+            conn.close()
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """在数据库线程中执行 fn(conn, *args, **kwargs) 并返回其结果"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, fn, args, kwargs))
+
+    async def fetch_one(self, sql: str, params: Params = ()) -> Optional[Any]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetch_all(self, sql: str, params: Params = ()) -> List[Any]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql: str, params: Params = ()) -> int:
+        """执行一条写语句，返回 lastrowid"""
+        return await self.run(lambda conn: conn.execute(sql, params).lastrowid)
+
+    async def executemany(self, sql: str, rows: Iterable[Params]) -> int:
+        """批量执行一条写语句，返回影响的行数"""
+        return await self.run(lambda conn: conn.executemany(sql, rows).rowcount)
+
+async_db = AsyncDatabase()
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+from itertools import islice
+from typing import Callable, Iterable, List, Optional, Sequence
+
+# 数据库文件路径
+DATABASE_PATH = os.getenv("DATABASE_PATH", "dataset_bit.db")
+# 连接打开时设置一次的性能参数
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# 页缓存大小，负数表示 KiB
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64 * 1024))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+# 每个线程最多保留的空闲连接数，超出的连接归还时直接关闭
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", 4))
+# 批量写入时每次 executemany 的行数
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 1000))
+
+_local = threading.local()
+
+class PooledConnection(sqlite3.Connection):
+    """可复用的连接：close() 回滚未提交的事务后放回所属线程的空闲列表，不真正关闭
+
+    with 语句结束时先按 sqlite3 的语义提交或回滚，再归还连接。
+    """
+    _idle: Optional[list] = None
+
+    def close(self):
+        idle, self._idle = self._idle, None
+        if idle is None:
+            # 已归还过，或已超出空闲上限被真正关闭
+            return
+        if self.in_transaction:
+            self.rollback()
+        if len(idle) >= SQLITE_POOL_SIZE:
+            super().close()
+        else:
+            idle.append(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        result = super().__exit__(exc_type, exc_value, traceback)
+        self.close()
+        return result
+
+def _open(path: str) -> PooledConnection:
+    conn = sqlite3.connect(path, factory=PooledConnection, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    return conn
+
+def get_connection(path: str = DATABASE_PATH, row_factory=sqlite3.Row) -> PooledConnection:
+    """取出当前线程的一个空闲连接，没有时新建并设置好 PRAGMA
+
+    连接在用完（close 或 with 结束）前为调用方独占，同一线程中嵌套或交替执行的请求拿到的是不同连接。
+    """
+    pools = getattr(_local, "pools", None)
+    if pools is None:
+        pools = _local.pools = {}
+    idle = pools.setdefault(path, [])
+    conn = idle.pop() if idle else _open(path)
+    conn._idle = idle
+    conn.row_factory = row_factory
+    return conn
+
+def iter_batches(rows: Iterable[Sequence], batch_size: int = WRITE_BATCH_SIZE) -> Iterable[List[Sequence]]:
+    """把行序列（可以是边算边产出的迭代器）切成不超过 batch_size 行的列表"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def insert_many(cursor, sql: str, rows: Iterable[Sequence], batch_size: int = WRITE_BATCH_SIZE,
+                on_batch: Optional[Callable[[int], None]] = None) -> List[int]:
+    """用 executemany 分批执行一条普通 INSERT，返回与输入顺序一致的新行 id
+
+    事务由调用方提交：第一条 INSERT 起本连接一直持有写锁，同一批插入的自增 id 连续，
+    按批次最后一行的 last_insert_rowid 倒推整批 id。不适用于 INSERT OR IGNORE 等可能跳过行的语句。
+    on_batch 在每批写入后以累计行数调用，用于上报进度。
+    """
+    ids: List[int] = []
+    for batch in iter_batches(rows, batch_size):
+        cursor.executemany(sql, batch)
+        last = cursor.connection.execute("SELECT last_insert_rowid()").fetchone()[0]
+        ids.extend(range(last - len(batch) + 1, last + 1))
+        if on_batch:
+            on_batch(len(ids))
+    return ids
+
+def _reset_after_fork():
+    # 子进程不复用父进程打开的连接
+    _local.__dict__.clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,78 +1,21 @@
-import sqlite3
 from datetime import datetime
 import os
 
+from app.models.connection import DATABASE_PATH, get_connection
+from app.models.migrations import run_migrations
+
 class Database:
-    def __init__(self, db_path='dataset_bit.db'):
+    def __init__(self, db_path=DATABASE_PATH):
         self.db_path = db_path
         self.init_db()
 
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return get_connection(self.db_path)
 
     def init_db(self):
+        # 表结构由版本化迁移统一维护
         conn = self.get_connection()
-        c = conn.cursor()
-
-        # 创建文件表
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                filename TEXT NOT NULL,
-                filepath TEXT NOT NULL,
-                filetype TEXT NOT NULL,
-                upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'pending'
-            )
-        ''')
-
-        # 创建文本片段表
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS segments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_id INTEGER,
-                content TEXT NOT NULL,
-                segment_index INTEGER NOT NULL,
-                created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (file_id) REFERENCES files (id)
-            )
-        ''')
-
-        # 创建问答对表
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS qa_pairs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                accuracy_score REAL DEFAULT 0,
-                completeness_score REAL DEFAULT 0,
-                relevance_score REAL DEFAULT 0,
-                clarity_score REAL DEFAULT 0,
-                total_score REAL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 创建评分历史记录表
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS score_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                qa_id INTEGER NOT NULL,
-                accuracy_score REAL NOT NULL,
-                completeness_score REAL NOT NULL,
-                relevance_score REAL NOT NULL,
-                clarity_score REAL NOT NULL,
-                total_score REAL NOT NULL,
-                feedback TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (qa_id) REFERENCES qa_pairs (id)
-            )
-        ''')
-
-        conn.commit()
+        run_migrations(conn)
         conn.close()
 
     def add_file(self, filename, filepath, filetype):
@@ -0,0 +1,71 @@
+import logging
+import re
+from typing import Dict, List, Tuple
+
+from app.models.queries import (
+    COPY_QA_SQL, DATASETS_SQL, DELETE_FILE_QA_SQL, DELETE_FILE_SEGMENTS_SQL, DELETE_SEGMENT_QA_SQL,
+    SEGMENT_COUNT_SQL, SEGMENT_FINGERPRINTS_SQL, SEGMENT_PAGE_SQL, SEGMENT_QA_SQL, duplicates_sql, export_sql,
+)
+from app.utils.fingerprint import simhash_band_sql
+
+logger = logging.getLogger(__name__)
+
+# 需要走索引的大表；files 按行数很少，允许全表扫描。查询中的别名按 FROM / JOIN 子句解析回表名
+LARGE_TABLES = {"text_segments", "qa_pairs"}
+
+# 查重条件：内容摘要与 SimHash 各分段的表达式索引
+_DUPLICATE_CONDITIONS = ["content_hash = ?"] + [f"{band} = ?" for band in simhash_band_sql()]
+_DUPLICATE_PARAMS = (1, "") + (0,) * (len(_DUPLICATE_CONDITIONS) - 1)
+
+# 热点查询：语句取自 main.py 实际执行的 app/models/queries.py，参数只用于生成执行计划
+HOT_QUERIES: List[Tuple[str, str, tuple]] = [
+    ("分块计数", SEGMENT_COUNT_SQL, (1,)),
+    ("分块分页", SEGMENT_PAGE_SQL, (1, 10, 0)),
+    ("分块摘要", SEGMENT_FINGERPRINTS_SQL, (1,)),
+    ("复用分块", COPY_QA_SQL, (2, 2, 1)),
+    ("分块问答", SEGMENT_QA_SQL, (1,)),
+    ("删除分块问答", DELETE_SEGMENT_QA_SQL, (1,)),
+    ("删除文件问答", DELETE_FILE_QA_SQL, (1,)),
+    ("删除文件分块", DELETE_FILE_SEGMENTS_SQL, (1,)),
+    ("查重", duplicates_sql(_DUPLICATE_CONDITIONS), _DUPLICATE_PARAMS),
+    ("查重（已有问答）", duplicates_sql(_DUPLICATE_CONDITIONS, with_qa=True), _DUPLICATE_PARAMS),
+    ("问答数统计", DATASETS_SQL, ()),
+    ("导出", export_sql(2), (1, 2)),
+    ("按分数导出", export_sql(2, with_score=True), (1, 2, 3)),
+]
+
+_SCAN = re.compile(r'^SCAN (\w+)')
+# 临时自动索引说明缺少对应的索引，每次执行都要现建
+_AUTOMATIC_INDEX = re.compile(r'^SEARCH (\w+) USING AUTOMATIC')
+# FROM / JOIN 后的表名及可选的别名
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_KEYWORDS = {"WHERE", "ON", "USING", "JOIN", "LEFT", "INNER", "CROSS", "NATURAL", "GROUP", "ORDER", "LIMIT", "SET"}
+
+def _table_names(sql: str) -> Dict[str, str]:
+    """语句中出现的 {表名或别名: 表名}，执行计划中的 SCAN / SEARCH 步骤使用别名"""
+    names = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        names[table] = table
+        if alias and alias.upper() not in _KEYWORDS:
+            names[alias] = table
+    return names
+
+def full_scans(conn) -> List[Tuple[str, str]]:
+    """对每条热点查询执行 EXPLAIN QUERY PLAN，返回在大表上全表（或全索引）扫描或临时建自动索引的 (查询名, 计划步骤)"""
+    problems = []
+    for name, sql, params in HOT_QUERIES:
+        names = _table_names(sql)
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall():
+            detail = row[3]
+            match = _SCAN.match(detail) or _AUTOMATIC_INDEX.match(detail)
+            if match and names.get(match.group(1), match.group(1)) in LARGE_TABLES:
+                problems.append((name, detail))
+    return problems
+
+def log_query_plans(conn) -> None:
+    """启动时检查热点查询的执行计划，退化为全表扫描的查询记录警告"""
+    try:
+        for name, detail in full_scans(conn):
+            logger.warning(f"热点查询“{name}”未使用索引: {detail}")
+    except Exception as e:
+        logger.warning(f"检查查询计划失败: {str(e)}")
@@ -0,0 +1,196 @@
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from app.utils.fingerprint import simhash_band_sql
+
+logger = logging.getLogger(__name__)
+
+def _add_columns(c, table: str, columns: Dict[str, str]) -> None:
+    """补齐旧库缺少的列（只在迁移时检查一次表结构）"""
+    c.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in c.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+def _baseline(c) -> None:
+    """当前表结构：新库直接建表，由旧版启动代码建出的库补齐缺少的列"""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT '待处理',
+            file_hash TEXT,
+            encoding TEXT,
+            split_params TEXT,
+            text_version INTEGER
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS text_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            segment_index INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            start_offset INTEGER,
+            end_offset INTEGER,
+            token_count INTEGER,
+            content_hash TEXT,
+            simhash INTEGER,
+            FOREIGN KEY (file_id) REFERENCES files (id)
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS qa_pairs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            segment_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            file_id INTEGER,
+            score INTEGER,
+            FOREIGN KEY (segment_id) REFERENCES text_segments (id)
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER,
+            content TEXT NOT NULL,
+            segment_index INTEGER NOT NULL,
+            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (file_id) REFERENCES files (id)
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            api_base TEXT,
+            api_key TEXT,
+            model_name TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            language TEXT DEFAULT 'zh',
+            theme TEXT DEFAULT 'light',
+            score_api_url TEXT,
+            score_api_key TEXT,
+            score_model_name TEXT
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS score_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            qa_id INTEGER NOT NULL,
+            accuracy_score REAL,
+            completeness_score REAL,
+            relevance_score REAL,
+            clarity_score REAL,
+            total_score REAL,
+            feedback TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (qa_id) REFERENCES qa_pairs (id)
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS saved_filters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            filter_conditions TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    c.execute("""
+        INSERT INTO settings (api_base, api_key, model_name, language, theme, score_api_url, score_api_key, score_model_name)
+        SELECT '', '', '', 'zh', 'light', '', '', '' WHERE NOT EXISTS (SELECT 1 FROM settings)
+    """)
+    # ALTER TABLE 不能加非常量默认值，旧库的 created_at 留空
+    _add_columns(c, "files", {"file_path": "TEXT", "file_type": "TEXT", "file_size": "INTEGER",
+                              "created_at": "TIMESTAMP", "updated_at": "TIMESTAMP", "status": "TEXT DEFAULT '待处理'",
+                              "file_hash": "TEXT", "encoding": "TEXT", "split_params": "TEXT", "text_version": "INTEGER"})
+    _add_columns(c, "text_segments", {"start_offset": "INTEGER", "end_offset": "INTEGER", "token_count": "INTEGER",
+                                      "content_hash": "TEXT", "simhash": "INTEGER"})
+    _add_columns(c, "qa_pairs", {"segment_id": "INTEGER", "file_id": "INTEGER", "score": "INTEGER"})
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_file_hash ON files (file_hash)")
+
+def _backfill_qa_file_id(c) -> None:
+    """一条 UPDATE 按分块补全问答对的 file_id；分块已不在 text_segments 时再查旧的 segments 表"""
+    c.execute("""
+        UPDATE qa_pairs SET file_id = COALESCE(
+            (SELECT s.file_id FROM text_segments s WHERE s.id = qa_pairs.segment_id),
+            (SELECT s.file_id FROM segments s WHERE s.id = qa_pairs.segment_id),
+            file_id
+        )
+        WHERE (file_id IS NULL OR file_id = '') AND segment_id IS NOT NULL
+    """)
+
+def _duplicate_indexes(c) -> None:
+    """查重用的内容摘要索引与 SimHash 分段表达式索引"""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_text_segments_content_hash ON text_segments (content_hash)")
+    for i, band in enumerate(simhash_band_sql()):
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_text_segments_simhash_{i} ON text_segments ({band})")
+
+def _hot_query_indexes(c) -> None:
+    """热点查询所需的索引：
+      text_segments (file_id, segment_index)：按文件取分块、计数、删除，并直接按序返回，无需再排序
+      qa_pairs (segment_id)：按分块取/删问答对，隐含的 rowid 使 ORDER BY id 也走索引
+      qa_pairs (file_id, score)：按文件删除、统计问答数（覆盖索引，不回表），导出时按分数过滤
+      files (created_at)：文件列表按上传时间倒序
+    """
+    c.execute("CREATE INDEX IF NOT EXISTS idx_text_segments_file_id_segment_index ON text_segments (file_id, segment_index)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_qa_pairs_segment_id ON qa_pairs (segment_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_qa_pairs_file_id_score ON qa_pairs (file_id, score)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_created_at ON files (created_at)")
+
+# 按编号顺序执行，每条只执行一次；已发布的迁移不再修改，结构变化一律追加新编号
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "baseline", _baseline),
+    (2, "backfill_qa_file_id", _backfill_qa_file_id),
+    (3, "duplicate_indexes", _duplicate_indexes),
+    (4, "hot_query_indexes", _hot_query_indexes),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn) -> int:
+    """数据库当前的结构版本，尚未建 schema_version 表时为 0"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version'").fetchone():
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def run_migrations(conn) -> List[int]:
+    """执行尚未应用的迁移，返回本次应用的版本号
+
+    已是最新版本时只读一次 schema_version 就返回，不执行任何 DDL，也不扫描数据表。
+    每条迁移与其版本记录在同一个 IMMEDIATE 事务中提交：多个进程同时启动时只有一个会执行，
+    中途失败则整条回滚，下次启动重试。
+    """
+    if schema_version(conn) >= LATEST_VERSION:
+        return []
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            migrate(conn.cursor())
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"数据库迁移 {version} ({name}) 失败", exc_info=True)
+            raise
+        logger.info(f"已应用数据库迁移 {version} ({name})")
+        applied.append(version)
+    return applied
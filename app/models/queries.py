@@ -0,0 +1,69 @@
+from typing import List
+
+# 热点查询语句：main.py 直接执行这里的语句，indexes.HOT_QUERIES 对同一语句检查执行计划，两边不会各改各的
+
+# 读取分块内容所需的列，配合 TextSpanReader.segment_text 使用
+SEGMENT_COLUMNS = """s.id, s.file_id, s.segment_index, s.content, s.start_offset, s.end_offset, s.token_count,
+    f.file_path, f.file_type, f.file_hash, f.text_version"""
+
+SEGMENT_COUNT_SQL = "SELECT COUNT(*) FROM text_segments WHERE file_id = ?"
+
+SEGMENT_PAGE_SQL = f"""
+    SELECT {SEGMENT_COLUMNS}
+    FROM text_segments s JOIN files f ON f.id = s.file_id
+    WHERE s.file_id = ?
+    ORDER BY s.segment_index
+    LIMIT ? OFFSET ?
+"""
+
+SEGMENT_FINGERPRINTS_SQL = """
+    SELECT id, segment_index, content_hash, simhash FROM text_segments
+    WHERE file_id = ? ORDER BY segment_index
+"""
+
+# 参数：(新文件 id, 新文件 id, 源文件 id)
+COPY_QA_SQL = """
+    INSERT INTO qa_pairs (segment_id, question, answer, file_id, score)
+    SELECT dst.id, q.question, q.answer, ?, q.score
+    FROM qa_pairs q
+    JOIN text_segments src ON q.segment_id = src.id
+    JOIN text_segments dst ON dst.file_id = ? AND dst.segment_index = src.segment_index
+    WHERE src.file_id = ?
+    ORDER BY q.id
+"""
+
+SEGMENT_QA_SQL = "SELECT id, question, answer, score FROM qa_pairs WHERE segment_id = ? ORDER BY id ASC"
+
+DELETE_SEGMENT_QA_SQL = "DELETE FROM qa_pairs WHERE segment_id = ?"
+
+DELETE_FILE_QA_SQL = "DELETE FROM qa_pairs WHERE file_id = ?"
+
+DELETE_FILE_SEGMENTS_SQL = "DELETE FROM text_segments WHERE file_id = ?"
+
+DATASETS_SQL = """
+    SELECT f.id, f.filename, COUNT(q.id) as qa_count, f.created_at as created_at
+    FROM files f
+    LEFT JOIN qa_pairs q ON f.id = q.file_id
+    GROUP BY f.id, f.filename, f.created_at
+    ORDER BY f.created_at DESC
+"""
+
+def duplicates_sql(conditions: List[str], with_qa: bool = False) -> str:
+    """查找重复分块的候选：conditions 为按摘要或指纹分段匹配的条件（任一满足即可），参数依次为排除的分块 id 与各条件的值"""
+    qa_filter = "AND EXISTS (SELECT 1 FROM qa_pairs q WHERE q.segment_id = text_segments.id)" if with_qa else ""
+    return f"""
+        SELECT id, file_id, segment_index, content_hash, simhash FROM text_segments
+        WHERE id != ? AND ({' OR '.join(conditions)}) {qa_filter}
+    """
+
+def export_sql(file_count: int, with_score: bool = False) -> str:
+    """导出选中文件的问答对，参数依次为各文件 id 与（with_score 时）最低分数"""
+    sql = f"""
+        SELECT q.question, q.answer, f.filename, q.score
+        FROM qa_pairs q
+        JOIN files f ON q.file_id = f.id
+        WHERE q.file_id IN ({','.join('?' * file_count)})
+    """
+    if with_score:
+        sql += " AND q.score >= ?"
+    return sql + " ORDER BY f.id, q.id"
@@ -8,7 +8,7 @@ import threading
 import time
 from uuid import uuid4
 
-from app.services.file_service import FileService
+from app.services.file_service import FileService, FileTooLargeError
 from app.services.llm_service import LLMService
 from app.services.db_service import DBService
 
@@ -35,17 +35,17 @@ def smart_split_task(file_id, task_id, method, min_tokens, max_tokens, overlap_r
             file_info["file_path"],
             method=method,
             min_length=min_tokens,
-            max_length=max_tokens
+            max_length=max_tokens,
+            file_hash=file_info.get("file_hash"),
+            semantic=semantic
         )
         total_blocks = len(segments)
         PROCESS_TASKS[task_id]["total"] = total_blocks
-        segment_ids = []
-        # 3. 保存分块到数据库，并实时上报进度
-        for i, seg in enumerate(segments):
-            seg_id = db_service.save_text_segments(file_id, [seg])
-            segment_ids.extend(seg_id)
-            PROCESS_TASKS[task_id]["current"] = i + 1
-            PROCESS_TASKS[task_id]["progress"] = (i + 1) / total_blocks
+        # 3. 保存分块到数据库：一个事务内分批写入，每批写完上报一次进度
+        def report(done):
+            PROCESS_TASKS[task_id]["current"] = done
+            PROCESS_TASKS[task_id]["progress"] = done / total_blocks
+        db_service.save_text_segments(file_id, segments, on_progress=report)
         # 4. 更新文件状态
         db_service.update_file_status(file_id, "已完成")
         PROCESS_TASKS[task_id]["status"] = "done"
@@ -60,7 +60,7 @@ async def upload_file(file: UploadFile = File(...)):
     try:
         # 保存文件
         file_info = file_service.save_file(file)
-        file_size = os.path.getsize(file_info["filepath"])
+        file_size = file_info["size"]
         file_type = os.path.splitext(file.filename)[1][1:].lower()
         
         # 保存到数据库
@@ -68,7 +68,8 @@ async def upload_file(file: UploadFile = File(...)):
             filename=file.filename,
             file_path=file_info["filepath"],
             file_type=file_type,
-            file_size=file_size
+            file_size=file_size,
+            file_hash=file_info["sha256"]
         )
         
         return {
@@ -81,6 +82,8 @@ async def upload_file(file: UploadFile = File(...)):
                 "file_size": file_size
             }
         }
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"文件上传失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,143 +1,69 @@
-import sqlite3
 import json
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 import logging
 from datetime import datetime
 import csv
 import io
 
+from app.models.connection import DATABASE_PATH, get_connection, insert_many
+from app.models.migrations import run_migrations
+from app.utils.fingerprint import simhash
+from app.utils.text_extractor import TextSpanReader
+from app.utils.text_splitter import chunk_hash
+from app.utils.tokenizer import count_tokens
+
 logger = logging.getLogger(__name__)
 
 class DBService:
-    def __init__(self, db_path: str = "dataset_bit.db"):
+    def __init__(self, db_path: str = DATABASE_PATH):
         """初始化数据库服务"""
         self.db_path = db_path
         self.init_db()
 
     def init_db(self):
-        """初始化数据库表"""
+        """按 schema_version 执行尚未应用的迁移，与 main.py 共用同一套表结构"""
         try:
             with self.get_conn() as conn:
-                cursor = conn.cursor()
-                
-                # 创建文件表
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    filename TEXT NOT NULL,
-                    file_path TEXT NOT NULL,
-                    file_type TEXT NOT NULL,
-                    file_size INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-
-                # 创建文本段落表
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS text_segments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    segment_index INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (file_id) REFERENCES files (id)
-                )
-                """)
-
-                # 创建问答对表
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS qa_pairs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question TEXT NOT NULL,
-                    answer TEXT NOT NULL,
-                    accuracy_score REAL,
-                    completeness_score REAL,
-                    relevance_score REAL,
-                    clarity_score REAL,
-                    total_score REAL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-
-                # 创建评分历史表
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS score_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    qa_id INTEGER NOT NULL,
-                    accuracy_score REAL,
-                    completeness_score REAL,
-                    relevance_score REAL,
-                    clarity_score REAL,
-                    total_score REAL,
-                    feedback TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (qa_id) REFERENCES qa_pairs (id)
-                )
-                """)
-
-                # 创建保存的筛选条件表
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS saved_filters (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    filter_conditions TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-
-                # 检查是否需要添加file_id字段
-                cursor.execute("PRAGMA table_info(qa_pairs)")
-                columns = [row[1] for row in cursor.fetchall()]
-                if 'file_id' not in columns:
-                    cursor.execute("ALTER TABLE qa_pairs ADD COLUMN file_id INTEGER")
-                    # 补全历史数据
-                    cursor.execute("""
-                    UPDATE qa_pairs 
-                    SET file_id = (
-                        SELECT file_id 
-                        FROM text_segments 
-                        WHERE text_segments.id = qa_pairs.segment_id
-                    )
-                    WHERE file_id IS NULL
-                    """)
-
-                conn.commit()
+                run_migrations(conn)
         except Exception as e:
             logger.error(f"数据库初始化失败: {str(e)}")
             raise
 
     def get_conn(self):
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+        # 复用线程内的长连接，with 结束时提交并归还
+        return get_connection(self.db_path, row_factory=None)
 
-    def save_file(self, filename: str, file_path: str, file_type: str, file_size: int) -> int:
+    def save_file(self, filename: str, file_path: str, file_type: str, file_size: int,
+                  file_hash: Optional[str] = None) -> int:
         """保存文件信息"""
         try:
             with self.get_conn() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                INSERT INTO files (filename, file_path, file_type, file_size)
-                VALUES (?, ?, ?, ?)
-                """, (filename, file_path, file_type, file_size))
+                INSERT INTO files (filename, file_path, file_type, file_size, file_hash)
+                VALUES (?, ?, ?, ?, ?)
+                """, (filename, file_path, file_type, file_size, file_hash))
                 conn.commit()
                 return cursor.lastrowid
         except Exception as e:
             logger.error(f"保存文件信息失败: {str(e)}")
             raise
 
-    def save_text_segments(self, file_id: int, segments: List[str]) -> List[int]:
-        """保存文本段落"""
+    def save_text_segments(self, file_id: int, segments: List[str], start_index: int = 0,
+                           on_progress: Optional[Callable[[int], None]] = None) -> List[int]:
+        """保存文本段落，在一个事务中分批写入，返回与 segments 顺序一致的 id
+
+        segment_index 从 start_index 起编号；on_progress 在每批写入后以已写入的段落数调用。
+        """
         try:
-            segment_ids = []
             with self.get_conn() as conn:
                 cursor = conn.cursor()
-                for i, segment in enumerate(segments):
-                    cursor.execute("""
-                    INSERT INTO text_segments (file_id, content, segment_index)
-                    VALUES (?, ?, ?)
-                    """, (file_id, segment, i))
-                    segment_ids.append(cursor.lastrowid)
+                rows = ((file_id, segment, i, count_tokens(segment), chunk_hash(segment), simhash(segment))
+                        for i, segment in enumerate(segments, start_index))
+                segment_ids = insert_many(cursor, """
+                    INSERT INTO text_segments (file_id, content, segment_index, token_count, content_hash, simhash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """, rows, on_batch=on_progress)
                 conn.commit()
             return segment_ids
         except Exception as e:
@@ -147,18 +73,16 @@ class DBService:
     def save_qa_pairs(self, qa_pairs: List[Dict[str, Any]]) -> List[int]:
         """保存问答对"""
         try:
-            qa_ids = []
             with self.get_conn() as conn:
                 cursor = conn.cursor()
-                for qa in qa_pairs:
-                    cursor.execute("""
+                qa_ids = insert_many(cursor, """
                     INSERT INTO qa_pairs (
                         question, answer,
                         accuracy_score, completeness_score,
                         relevance_score, clarity_score, total_score
                     )
                     VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
+                    """, ((
                         qa["question"],
                         qa["answer"],
                         qa.get("accuracy_score", 0),
@@ -166,8 +90,7 @@ class DBService:
                         qa.get("relevance_score", 0),
                         qa.get("clarity_score", 0),
                         qa.get("total_score", 0)
-                    ))
-                    qa_ids.append(cursor.lastrowid)
+                    ) for qa in qa_pairs))
                 conn.commit()
             return qa_ids
         except Exception as e:
@@ -232,7 +155,10 @@ class DBService:
         try:
             with self.get_conn() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT * FROM files WHERE id = ?", (file_id,))
+                cursor.execute("""
+                SELECT id, filename, file_path, file_type, file_size, created_at, updated_at, file_hash
+                FROM files WHERE id = ?
+                """, (file_id,))
                 row = cursor.fetchone()
                 if row:
                     return {
@@ -242,7 +168,8 @@ class DBService:
                         "file_type": row[3],
                         "file_size": row[4],
                         "created_at": row[5],
-                        "updated_at": row[6]
+                        "updated_at": row[6],
+                        "file_hash": row[7]
                     }
                 return None
         except Exception as e:
@@ -255,18 +182,22 @@ class DBService:
             with self.get_conn() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
-                SELECT id, content, segment_index, created_at
-                FROM text_segments
-                WHERE file_id = ?
-                ORDER BY segment_index
+                SELECT s.id, s.content, s.segment_index, s.created_at, s.start_offset, s.end_offset,
+                       f.file_path, f.file_type, f.file_hash, f.text_version
+                FROM text_segments s JOIN files f ON f.id = s.file_id
+                WHERE s.file_id = ?
+                ORDER BY s.segment_index
                 """, (file_id,))
-                rows = cursor.fetchall()
-                return [{
-                    "id": row[0],
-                    "content": row[1],
-                    "segment_index": row[2],
-                    "created_at": row[3]
-                } for row in rows]
+                columns = [description[0] for description in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                # 按偏移保存的分块从提取文本缓存中读取内容
+                with TextSpanReader() as reader:
+                    return [{
+                        "id": row["id"],
+                        "content": reader.segment_text(row),
+                        "segment_index": row["segment_index"],
+                        "created_at": row["created_at"]
+                    } for row in rows]
         except Exception as e:
             logger.error(f"获取文本段落失败: {str(e)}")
             raise
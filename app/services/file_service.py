@@ -1,18 +1,33 @@
 import os
-from docx import Document
-import PyPDF2
-from typing import List, Dict, Any
+import hashlib
+import tarfile
+import uuid
+import zipfile
+from typing import List, Dict, Any, AsyncIterator, BinaryIO, Callable, Optional
 import logging
+import aiofiles
+from python_multipart.multipart import MultipartParser, parse_options_header
+from app.utils.text_extractor import get_extracted_text
+from app.utils.semantic_splitter import semantic_split
 
 logger = logging.getLogger(__name__)
 
+# 上传时每次读写的分块大小（字节），以及单个文件的大小上限，可通过环境变量调整
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 500 * 1024 * 1024))
+# 请求体中除文件内容外的 multipart 边界、字段头等开销上限（字节）
+MULTIPART_OVERHEAD = 64 * 1024
+
+class FileTooLargeError(ValueError):
+    """上传文件超过大小上限"""
+
 class FileService:
     def __init__(self, upload_folder: str = "uploads"):
         self.upload_folder = upload_folder
         os.makedirs(upload_folder, exist_ok=True)
 
     def save_file(self, file) -> Dict[str, Any]:
-        """保存上传的文件"""
+        """保存上传的文件，按内容摘要存放"""
         try:
             # 检查文件类型
             file_ext = os.path.splitext(file.filename)[1].lower()
@@ -21,50 +36,233 @@ class FileService:
 
             # 生成安全的文件名
             safe_filename = ''.join(c for c in file.filename if c.isalnum() or c in '._-')
-            file_path = os.path.join(self.upload_folder, safe_filename)
-
-            # 保存文件
-            with open(file_path, "wb") as f:
-                content = file.file.read()
-                f.write(content)
 
+            # 分块写入，边写边计算摘要，避免整个文件读入内存
+            saved = self.store_stream(file.file, file_ext[1:])
             return {
                 "filename": safe_filename,
-                "filepath": file_path,
+                "filepath": saved["file_path"],
                 "filetype": file_ext[1:],  # 去掉点号
-                "size": len(content)
+                "size": saved["size"],
+                "sha256": saved["sha256"]
             }
         except Exception as e:
             logger.error(f"文件保存失败: {str(e)}")
             raise
 
-    def extract_text(self, file_path: str) -> str:
-        """从文件中提取文本内容"""
+    async def save_multipart_upload(self, stream: AsyncIterator[bytes], content_type: str,
+                                    content_length: Optional[int] = None, field: str = "file",
+                                    allowed_types: Optional[List[str]] = None, max_size: int = MAX_UPLOAD_SIZE,
+                                    on_progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+        """直接从请求体流中解析 multipart/form-data，把名为 field 的文件字段分块写入临时文件
+
+        不经过框架对请求体的整体缓存：Content-Length 超限时不读取内容直接拒绝，
+        实际收到的字节数或文件内容超过 max_size 时立即中止并抛出 FileTooLargeError。
+        扩展名不在 allowed_types 中、请求不是 multipart 或缺少文件字段时抛出 ValueError。
+        on_progress(已收到的请求体字节数) 在每收到一段数据后调用。
+        返回 filename、file_type、file_path（临时路径，由调用方存放或删除）、size、sha256。
+        """
+        body_limit = max_size + MULTIPART_OVERHEAD if max_size else None
+        if body_limit and content_length and content_length > body_limit:
+            raise FileTooLargeError(f"文件超过大小上限 {max_size} 字节")
+        mime, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if mime != b"multipart/form-data" or not boundary:
+            raise ValueError("请求必须是 multipart/form-data")
+
+        # 解析器的回调是同步的：文件内容先收集到 pending，每写入一段请求体后再异步落盘
+        headers: Dict[bytes, bytes] = {}
+        header = {"field": b"", "value": b""}
+        upload: Dict[str, Any] = {"filename": None, "active": False}
+        pending: List[bytes] = []
+
+        def on_part_begin():
+            headers.clear()
+
+        def on_header_field(data, start, end):
+            header["field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            header["value"] += data[start:end]
+
+        def on_header_end():
+            headers[header["field"].lower()] = header["value"]
+            header["field"] = header["value"] = b""
+
+        def on_headers_finished():
+            _, params = parse_options_header(headers.get(b"content-disposition", b""))
+            if upload["filename"] is not None or params.get(b"name") != field.encode() or b"filename" not in params:
+                return
+            filename = params[b"filename"].decode("utf-8", errors="replace")
+            file_type = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+            if allowed_types is not None and file_type not in allowed_types:
+                raise ValueError("不支持的文件类型")
+            upload.update(filename=filename, file_type=file_type, active=True)
+
+        def on_part_data(data, start, end):
+            if upload["active"]:
+                pending.append(data[start:end])
+
+        def on_part_end():
+            upload["active"] = False
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+        tmp_path = self._tmp_path()
+        received = size = 0
+        hasher = hashlib.sha256()
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in stream:
+                    received += len(chunk)
+                    if body_limit and received > body_limit:
+                        raise FileTooLargeError(f"文件超过大小上限 {max_size} 字节")
+                    parser.write(chunk)
+                    for piece in pending:
+                        size += len(piece)
+                        if max_size and size > max_size:
+                            raise FileTooLargeError(f"文件超过大小上限 {max_size} 字节")
+                        hasher.update(piece)
+                        await f.write(piece)
+                    pending.clear()
+                    if on_progress:
+                        on_progress(received)
+                parser.finalize()
+            if upload["filename"] is None:
+                raise ValueError(f"缺少上传文件字段 {field}")
+        except Exception:
+            self._remove_partial(tmp_path)
+            raise
+
+        return {
+            "filename": upload["filename"],
+            "file_type": upload["file_type"],
+            "file_path": tmp_path,
+            "size": size,
+            "sha256": hasher.hexdigest()
+        }
+
+    def store_stream(self, stream: BinaryIO, file_ext: str, max_size: int = MAX_UPLOAD_SIZE) -> Dict[str, Any]:
+        """从可读的二进制流分块写入并按内容摘要存放，超过 max_size 时抛出 FileTooLargeError"""
+        tmp_path = self._tmp_path()
+        size = 0
+        hasher = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+                    size += len(chunk)
+                    if max_size and size > max_size:
+                        raise FileTooLargeError(f"文件超过大小上限 {max_size} 字节")
+                    hasher.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            self._remove_partial(tmp_path)
+            raise
+
+        sha256 = hasher.hexdigest()
+        return {
+            "file_path": self.store_by_digest(tmp_path, sha256, file_ext),
+            "size": size,
+            "sha256": sha256
+        }
+
+    def save_archive_members(self, archive_path: str, allowed_types: List[str],
+                             max_size: int = MAX_UPLOAD_SIZE,
+                             on_member: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+        """逐个读取 zip/tar 压缩包中的成员并按内容摘要存放
+
+        只保留扩展名在 allowed_types 中的普通文件，成员以流的方式读取，不解压整个压缩包；
+        超过 max_size 的成员被跳过。返回 {"files": [...], "skipped": [...]}，
+        files 中每项包含 filename、file_type、file_path、size、sha256。
+        on_member(已保存数量) 在每个成员保存后调用。
+        """
+        saved: List[Dict[str, Any]] = []
+        skipped: List[Dict[str, str]] = []
+
+        def save_member(name: str, open_member: Callable[[], BinaryIO]) -> None:
+            file_type = os.path.splitext(name)[1][1:].lower()
+            if file_type not in allowed_types:
+                skipped.append({"filename": name, "reason": "不支持的文件类型"})
+                return
+            try:
+                with open_member() as stream:
+                    info = self.store_stream(stream, file_type, max_size)
+            except FileTooLargeError:
+                skipped.append({"filename": name, "reason": "文件超过大小上限"})
+                return
+            saved.append({"filename": name, "file_type": file_type, **info})
+            if on_member:
+                on_member(len(saved))
+
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    save_member(member.filename, lambda member=member: archive.open(member))
+        else:
+            # 以流模式读取 tar（含 gz/bz2/xz 压缩），成员按顺序只读一遍
+            try:
+                archive = tarfile.open(archive_path, mode="r|*")
+            except tarfile.TarError:
+                raise ValueError("不支持的压缩包格式，仅支持 zip 与 tar")
+            with archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    save_member(member.name, lambda member=member: archive.extractfile(member))
+        logger.info(f"压缩包已解包: {archive_path}，保存 {len(saved)} 个文件，跳过 {len(skipped)} 个")
+        return {"files": saved, "skipped": skipped}
+
+    def digest_path(self, sha256: str, file_ext: str) -> str:
+        """内容寻址的存放路径：uploads/<摘要前两位>/<摘要>.<扩展名>"""
+        return os.path.join(self.upload_folder, sha256[:2], f"{sha256}.{file_ext}")
+
+    def store_by_digest(self, tmp_path: str, sha256: str, file_ext: str) -> str:
+        """将临时文件移动到内容寻址位置；相同内容已存在时丢弃临时文件"""
+        target = self.digest_path(sha256, file_ext)
+        if os.path.exists(target):
+            self._remove_partial(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+        return target
+
+    def _tmp_path(self) -> str:
+        return os.path.join(self.upload_folder, f".upload-{uuid.uuid4().hex}.tmp")
+
+    def _remove_partial(self, file_path: str) -> None:
+        """删除写入失败留下的残缺文件"""
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def extract_text(self, file_path: str, file_hash: Optional[str] = None) -> str:
+        """从文件中提取文本内容，结果按内容摘要缓存"""
         try:
             file_ext = os.path.splitext(file_path)[1].lower()
-            
-            if file_ext in ['.txt', '.md']:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            
-            elif file_ext == '.docx':
-                doc = Document(file_path)
-                return '\n'.join([paragraph.text for paragraph in doc.paragraphs])
-            
-            elif file_ext == '.pdf':
-                with open(file_path, 'rb') as pdf_file:
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    return '\n'.join([page.extract_text() for page in pdf_reader.pages])
-            
-            else:
+            if file_ext not in ['.txt', '.md', '.docx', '.pdf']:
                 raise ValueError("不支持的文件类型")
+            return get_extracted_text(file_path, file_ext[1:], file_hash)
         except Exception as e:
             logger.error(f"文本提取失败: {str(e)}")
             raise
 
     def split_text(self, text: str, method: str = "paragraph", 
-                  min_length: int = 100, max_length: int = 2000) -> List[str]:
-        """分割文本内容"""
+                  min_length: int = 100, max_length: int = 2000,
+                  semantic: bool = False) -> List[str]:
+        """分割文本内容
+
+        method 为 smart 且 semantic 为 True 时按语义分块，min_length、max_length 按 token 数计算。
+        """
         try:
             segments = []
             
@@ -90,8 +288,12 @@ class FileService:
                 if current_segment:
                     segments.append('\n'.join(current_segment))
             
+            elif method == "smart" and semantic:
+                # 语义分块：在相邻句相似度低谷处切分，块长已由 token 预算约束，不再按字符数过滤
+                return semantic_split(text, min_tokens=min_length, max_tokens=max_length)
+
             elif method == "smart":
-                # 占位：用段落分割，后续可实现智能分块
+                # 未启用语义分块时按段落分割
                 raw_segments = text.split('\n\n')
                 segments = [s.strip() for s in raw_segments if s.strip()]
             else:
@@ -109,18 +311,20 @@ class FileService:
             raise
 
     def process_file(self, file_path: str, method: str = "paragraph",
-                    min_length: int = 100, max_length: int = 2000) -> List[str]:
+                    min_length: int = 100, max_length: int = 2000,
+                    file_hash: Optional[str] = None, semantic: bool = False) -> List[str]:
         """处理文件：提取文本并分割"""
         try:
-            # 提取文本
-            text = self.extract_text(file_path)
+            # 提取文本（命中缓存时不再解析原文件）
+            text = self.extract_text(file_path, file_hash)
             
             # 分割文本
             segments = self.split_text(
                 text,
                 method=method,
                 min_length=min_length,
-                max_length=max_length
+                max_length=max_length,
+                semantic=semantic
             )
             
             return segments
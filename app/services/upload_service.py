@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Any, Optional, AsyncIterator
+
+import aiofiles
+
+from app.services.file_service import FileService, FileTooLargeError, MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 未完成的断点续传会话保留时长（秒），超时后分片文件被清理
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
+# 后台清理过期会话的间隔（秒）
+UPLOAD_SESSION_CLEANUP_INTERVAL = int(os.getenv("UPLOAD_SESSION_CLEANUP_INTERVAL", 3600))
+
+class UploadSessionError(ValueError):
+    """断点续传请求与会话状态不一致，offset 为服务端已接收的字节数"""
+
+    def __init__(self, message: str, offset: int = 0):
+        super().__init__(message)
+        self.offset = offset
+
+class UploadService:
+    """断点续传上传：创建会话、按字节区间追加分片、查询已接收偏移、合并为正式文件
+
+    分片数据保存在 uploads/.sessions/<upload_id>.part，会话信息保存在同名 .json 中，
+    服务重启后仍可继续上传。
+    """
+
+    def __init__(self, file_service: FileService, ttl: int = UPLOAD_SESSION_TTL):
+        self.file_service = file_service
+        self.ttl = ttl
+        self.session_dir = os.path.join(file_service.upload_folder, ".sessions")
+        os.makedirs(self.session_dir, exist_ok=True)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def create_session(self, filename: str, file_type: str, file_size: Optional[int] = None) -> Dict[str, Any]:
+        """创建上传会话"""
+        if file_size is not None and MAX_UPLOAD_SIZE and file_size > MAX_UPLOAD_SIZE:
+            raise FileTooLargeError(f"文件超过大小上限 {MAX_UPLOAD_SIZE} 字节")
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        session = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "file_type": file_type,
+            "file_size": file_size,
+            "created_at": time.time()
+        }
+        with open(self._meta_path(upload_id), "w", encoding="utf-8") as f:
+            json.dump(session, f, ensure_ascii=False)
+        open(self._part_path(upload_id), "wb").close()
+        logger.info(f"创建上传会话 {upload_id}: {filename}")
+        return {**session, "offset": 0}
+
+    def get_session(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话信息及已接收的字节数，会话不存在或已过期时返回 None"""
+        if not self._valid_id(upload_id):
+            return None
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                session = json.load(f)
+            session["offset"] = os.path.getsize(self._part_path(upload_id))
+        except (OSError, ValueError):
+            return None
+        return session
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """从 offset 处追加一段数据，返回追加后的偏移
+
+        offset 必须等于已接收字节数；连接中断时已写入的部分会保留，客户端查询偏移后续传即可。
+        """
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            session = self.get_session(upload_id)
+            if not session:
+                raise KeyError(upload_id)
+            received = session["offset"]
+            if offset != received:
+                raise UploadSessionError("偏移与已接收字节数不一致", received)
+            limit = session["file_size"] or MAX_UPLOAD_SIZE
+            async with aiofiles.open(self._part_path(upload_id), "ab") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if limit and received + len(chunk) > limit:
+                        raise UploadSessionError("数据超出声明的文件大小", received)
+                    await f.write(chunk)
+                    received += len(chunk)
+            return received
+
+    async def finalize(self, upload_id: str) -> Dict[str, Any]:
+        """合并完成的会话：计算摘要并移动到内容寻址位置"""
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            session = self.get_session(upload_id)
+            if not session:
+                raise KeyError(upload_id)
+            if session["file_size"] is not None and session["offset"] != session["file_size"]:
+                raise UploadSessionError("文件尚未上传完整", session["offset"])
+            part_path = self._part_path(upload_id)
+            sha256 = await asyncio.to_thread(self._hash_file, part_path)
+            file_path = self.file_service.store_by_digest(part_path, sha256, session["file_type"])
+            self._remove(self._meta_path(upload_id))
+        self._locks.pop(upload_id, None)
+        return {
+            "filename": session["filename"],
+            "file_type": session["file_type"],
+            "file_path": file_path,
+            "size": session["offset"],
+            "sha256": sha256
+        }
+
+    def abort(self, upload_id: str) -> bool:
+        """放弃会话并删除分片"""
+        if not self.get_session(upload_id):
+            return False
+        self._remove(self._part_path(upload_id))
+        self._remove(self._meta_path(upload_id))
+        self._locks.pop(upload_id, None)
+        return True
+
+    def cleanup_expired(self) -> int:
+        """清理超过 TTL 未活动的会话（包括缺少会话信息的残留分片），返回清理的数量"""
+        now = time.time()
+        removed = 0
+        upload_ids = {os.path.splitext(name)[0] for name in os.listdir(self.session_dir)
+                      if os.path.splitext(name)[1] in (".json", ".part")}
+        for upload_id in upload_ids:
+            part_path = self._part_path(upload_id)
+            try:
+                last_active = os.path.getmtime(part_path if os.path.exists(part_path) else self._meta_path(upload_id))
+            except OSError:
+                continue
+            if now - last_active > self.ttl:
+                self._remove(part_path)
+                self._remove(self._meta_path(upload_id))
+                self._locks.pop(upload_id, None)
+                removed += 1
+        if removed:
+            logger.info(f"已清理 {removed} 个过期上传会话")
+        return removed
+
+    async def run_cleanup(self, interval: int = UPLOAD_SESSION_CLEANUP_INTERVAL) -> None:
+        """后台任务：立即清理一次过期会话，之后每隔 interval 秒清理一次，直到任务被取消
+
+        不依赖新会话触发清理，长时间没有上传时放弃的分片也会按 TTL 删除。
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.cleanup_expired)
+            except Exception as e:
+                logger.error(f"清理过期上传会话失败: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def _hash_file(self, file_path: str) -> str:
+        hasher = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def _valid_id(self, upload_id: str) -> bool:
+        return len(upload_id) == 32 and all(c in "0123456789abcdef" for c in upload_id)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.session_dir, f"{upload_id}.json")
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.session_dir, f"{upload_id}.part")
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,62 @@
+import os
+import re
+import sys
+from typing import List
+
+import numpy as np
+
+_UTF32 = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
+_WHITESPACE = re.compile(r'\s+')
+# 指纹位数与分段数：海明距离不超过 SIMHASH_BANDS - 1 的两个指纹至少有一段完全相同，
+# 按段建索引即可找出全部近似重复候选
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+SIMHASH_BAND_MASK = (1 << SIMHASH_BAND_BITS) - 1
+# 视为近似重复的最大海明距离，超过 SIMHASH_BANDS - 1 时分段索引不再保证找全
+NEAR_DUPLICATE_DISTANCE = min(int(os.getenv("NEAR_DUPLICATE_DISTANCE", 3)), SIMHASH_BANDS - 1)
+# 特征为连续 3 个字符的片段
+_SHINGLE = 3
+
+def simhash(text: str) -> int:
+    """计算文本的 64 位 SimHash，按 SQLite INTEGER 的有符号范围返回
+
+    先转小写并把连续空白压成一个空格，页眉页脚等样板内容排版略有差异时指纹仍相同或相近；
+    特征为字符三元组，各自做 64 位混合哈希后按位投票，全程在 numpy 中向量化完成。
+    """
+    normalized = _WHITESPACE.sub(' ', text.lower()).strip()
+    if not normalized:
+        return 0
+    codes = np.frombuffer(normalized.encode(_UTF32, 'surrogatepass'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < _SHINGLE:
+        codes = np.concatenate((codes, np.zeros(_SHINGLE - len(codes), dtype=np.uint64)))
+    # 码点不超过 21 位，三个码点拼成一个 63 位整数
+    features = (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+    hashes = _mix64(features)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+    value = int(np.packbits(votes, bitorder='little').view('<u8')[0])
+    return to_signed(value)
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 的终混函数，把结构相近的特征打散到整个 64 位空间"""
+    with np.errstate(over='ignore'):
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def to_signed(value: int) -> int:
+    """把 64 位无符号整数换成同一位模式的有符号整数，以便存入 SQLite"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个指纹之间不同的位数"""
+    return ((a ^ b) & ((1 << SIMHASH_BITS) - 1)).bit_count()
+
+def simhash_bands(value: int) -> List[int]:
+    """指纹按 16 位切成的各段，与 text_segments 上的分段索引表达式一一对应"""
+    return [(value >> (i * SIMHASH_BAND_BITS)) & SIMHASH_BAND_MASK for i in range(SIMHASH_BANDS)]
+
+def simhash_band_sql(column: str = "simhash") -> List[str]:
+    """各段在 SQL 中的表达式，建索引与查询必须写法一致才能命中表达式索引"""
+    return [f"(({column} >> {i * SIMHASH_BAND_BITS}) & {SIMHASH_BAND_MASK})" for i in range(SIMHASH_BANDS)]
@@ -0,0 +1,147 @@
+import math
+import os
+import sys
+from typing import List, Tuple
+
+import numpy as np
+
+from app.utils.text_splitter import sentence_boundaries
+from app.utils.tokenizer import count_tokens, token_starts
+
+_UTF32 = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
+# 特征哈希空间 2^20，句子编号与特征桶合并成一个整数键
+_HASH_BITS = 20
+_HASH_SIZE = 1 << _HASH_BITS
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# 单字特征与二元组特征的区分位（码点不超过 21 位）
+_UNIGRAM_FLAG = np.uint64(1 << 42)
+# 计算交界相似度时两侧各取的句子数
+SEMANTIC_WINDOW = int(os.getenv("SEMANTIC_WINDOW", 3))
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """按句末标点与换行切分句子，返回去掉首尾空白后的各句字符区间，跳过空句"""
+    spans = []
+    start = 0
+    for end in sentence_boundaries(text).tolist() + [len(text)]:
+        sentence = text[start:end]
+        stripped = sentence.strip()
+        if stripped:
+            left = start + sentence.index(stripped[0])
+            spans.append((left, left + len(stripped)))
+        start = end
+    return spans
+
+def adjacent_similarity(text: str, spans: List[Tuple[int, int]], window: int = SEMANTIC_WINDOW) -> np.ndarray:
+    """各句与下一句交界处的余弦相似度，长度为句数减一
+
+    每句用字符单字与二元组做特征哈希，按 TF-IDF 加权（对数词频）并归一化；
+    第 i 个交界比较其前 window 句之和与其后 window 句之和，单句用词差异带来的噪声被平滑掉。
+    向量以“序号 * 哈希空间 + 桶号”的有序整数键稀疏表示：每句的特征按偏移复制到它参与的各个交界，
+    合并同键后用一次 searchsorted 对齐两侧的公共特征，全程向量化，不逐句循环。
+    """
+    count = len(spans)
+    if count < 2:
+        return np.zeros(0)
+    owner, bucket, weight = _sentence_features(text, spans)
+    gaps = count - 1
+    left_keys, left_weight, left_norm = _window_vectors(owner, bucket, weight, range(0, window), gaps)
+    right_keys, right_weight, right_norm = _window_vectors(owner, bucket, weight, range(-1, -window - 1, -1), gaps)
+    index = np.minimum(np.searchsorted(left_keys, right_keys), len(left_keys) - 1)
+    shared = left_keys[index] == right_keys
+    gap = (right_keys[shared] >> np.uint64(_HASH_BITS)).astype(np.int64)
+    dots = np.bincount(gap, right_weight[shared] * left_weight[index[shared]], minlength=gaps)
+    denom = left_norm * right_norm
+    return np.divide(dots, denom, out=np.zeros(gaps), where=denom > 0)
+
+def _lower_keep_length(text: str) -> str:
+    """转小写且不改变长度，保证码点与 spans 中的字符位置一一对应
+
+    个别字符（如 'İ'）小写后是多个码点，整体 lower() 会使其后的位置错开；
+    出现这种情况时逐字符转换，只取每个字符小写形式的首个码点。
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return ''.join(ch.lower()[0] for ch in text)
+
+def _sentence_features(text: str, spans: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """逐句的稀疏特征：(句序号, 桶号, 归一化后的 TF-IDF 权重)"""
+    count = len(spans)
+    codes = np.frombuffer(_lower_keep_length(text).encode(_UTF32, 'surrogatepass'), dtype=np.uint32).astype(np.uint64)
+    # 标出每个字符所属的句子，句间空白为 -1
+    starts = np.array([s for s, _ in spans], dtype=np.int64)
+    ends = np.array([e for _, e in spans], dtype=np.int64)
+    marks = np.zeros(len(codes) + 1, dtype=np.int64)
+    marks[starts] += 1
+    marks[ends] -= 1
+    inside = np.cumsum(marks[:-1]) > 0
+    first = np.zeros(len(codes), dtype=np.int64)
+    first[starts] = 1
+    sentence = np.cumsum(first) - 1
+    sentence[~inside] = -1
+
+    uni_pos = np.flatnonzero(inside)
+    pair_pos = np.flatnonzero(inside[:-1] & (sentence[:-1] == sentence[1:]))
+    features = np.concatenate((codes[uni_pos] | _UNIGRAM_FLAG,
+                               (codes[pair_pos] << np.uint64(21)) | codes[pair_pos + 1]))
+    owners = np.concatenate((sentence[uni_pos], sentence[pair_pos])).astype(np.uint64)
+    buckets = (features * _HASH_MULTIPLIER) >> np.uint64(64 - _HASH_BITS)
+    keys, tf = np.unique((owners << np.uint64(_HASH_BITS)) | buckets, return_counts=True)
+
+    bucket = (keys & np.uint64(_HASH_SIZE - 1)).astype(np.int64)
+    owner = (keys >> np.uint64(_HASH_BITS)).astype(np.int64)
+    df = np.bincount(bucket, minlength=_HASH_SIZE)
+    weight = (1 + np.log(tf)) * (np.log((1 + count) / (1 + df[bucket])) + 1)
+    norms = np.sqrt(np.bincount(owner, weight * weight, minlength=count))
+    return owner, bucket, weight / norms[owner]
+
+def _window_vectors(owner: np.ndarray, bucket: np.ndarray, weight: np.ndarray,
+                    shifts: range, gaps: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """把每句特征复制到 owner + shift 号交界并合并，返回 (有序键, 权重, 各交界的范数)"""
+    targets = np.concatenate([owner + shift for shift in shifts])
+    valid = (targets >= 0) & (targets < gaps)
+    keys = (targets[valid].astype(np.uint64) << np.uint64(_HASH_BITS)) | \
+        np.tile(bucket, len(shifts))[valid].astype(np.uint64)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse, np.tile(weight, len(shifts))[valid])
+    gap = (keys >> np.uint64(_HASH_BITS)).astype(np.int64)
+    return keys, summed, np.sqrt(np.bincount(gap, summed * summed, minlength=gaps))
+
+def semantic_split(text: str, min_tokens: int = 512, max_tokens: int = 1024) -> List[str]:
+    """语义分块：在相邻句相似度的低谷处切分，每块 token 数尽量落在 [min_tokens, max_tokens] 内
+
+    从当前句起，先算出块长不少于 min_tokens、不超过 max_tokens 的候选切点范围，
+    在范围内选相似度最低（话题转换最明显）的位置切开；剩余文本不超过上限时整体作为最后一块。
+    单句超过 max_tokens 时按 token 数硬切。全部在本地计算，不调用模型。
+    """
+    spans = split_sentences(text)
+    if not spans:
+        return []
+    max_tokens = max(1, max_tokens)
+    min_tokens = max(0, min(min_tokens, max_tokens))
+    # 在末尾补一个负无穷，表示文末总是最好的切点
+    similarity = np.append(adjacent_similarity(text, spans), -math.inf)
+    tokens = np.array([count_tokens(text[s:e]) for s, e in spans], dtype=np.int64)
+    total = np.concatenate(([0], np.cumsum(tokens)))
+
+    chunks = []
+    a = 0
+    while a < len(spans):
+        if tokens[a] > max_tokens:
+            chunks.extend(_split_long_sentence(text[spans[a][0]:spans[a][1]], max_tokens))
+            a += 1
+            continue
+        # 候选终点 j（不含）：total[j] - total[a] 落在 [min_tokens, max_tokens]
+        hi = int(np.searchsorted(total, total[a] + max_tokens, side='right')) - 1
+        lo = max(int(np.searchsorted(total, total[a] + min_tokens, side='left')), a + 1)
+        lo = min(lo, hi)
+        j = lo + int(np.argmin(similarity[lo - 1:hi]))
+        chunks.append(text[spans[a][0]:spans[j - 1][1]])
+        a = j
+    return chunks
+
+def _split_long_sentence(sentence: str, max_tokens: int) -> List[str]:
+    starts = token_starts(sentence) + [len(sentence)]
+    pieces = (sentence[starts[k]:starts[min(k + max_tokens, len(starts) - 1)]]
+              for k in range(0, len(starts) - 1, max_tokens))
+    return [piece for piece in pieces if piece.strip()]
@@ -0,0 +1,128 @@
+import mmap
+import os
+from concurrent.futures import Executor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from app.utils.fingerprint import simhash
+from app.utils.text_extractor import iter_extracted_text, text_cache_path
+from app.utils.text_splitter import PARALLEL_REGION_SIZE, chunk_hash, find_region_cut, iter_chunk_spans
+from app.utils.tokenizer import count_tokens
+
+# 在缓存文件中寻找区域切点时每次解码的字节数
+REGION_SEARCH_WINDOW = 1024 * 1024
+
+# 子进程内的进度队列，由进程池的 initializer 设置
+_progress_queue = None
+
+def segment_row(start: int, end: int, text: str) -> Tuple[int, int, int, str, int]:
+    """一个分块的写库字段：(起始字节偏移, 结束字节偏移, token 数, 内容摘要, SimHash 指纹)"""
+    return start, end, count_tokens(text), chunk_hash(text), simhash(text)
+
+def iter_segment_rows(file_path: str, file_type: str, file_hash: str, encoding: Optional[str],
+                      method: str, block_size: int, overlap: int, block_unit: str = "chars", snap: bool = True,
+                      on_progress: Optional[Callable[[int, int], None]] = None,
+                      on_encoding: Optional[Callable[[Optional[str]], None]] = None) -> Iterator[Tuple[int, int, int, str, int]]:
+    """提取并分块，逐个产出 (起始字节偏移, 结束字节偏移, token 数, 内容摘要, SimHash 指纹)
+
+    提取与分块串成流水线，内容本身不产出，需要时按偏移从提取文本缓存中读回。
+    """
+    pieces = iter_extracted_text(file_path, file_type, file_hash, on_progress=on_progress,
+                                 encoding=encoding, on_encoding=on_encoding)
+    for chunk in iter_chunk_spans(pieces, method, block_size, overlap, block_unit=block_unit, snap=snap):
+        yield segment_row(chunk.start, chunk.end, chunk.text)
+
+def init_worker(progress_queue) -> None:
+    """进程池 initializer：保存用于上报进度的队列"""
+    global _progress_queue
+    _progress_queue = progress_queue
+
+def split_file(file_id: int, file_path: str, file_type: str, file_hash: str, encoding: Optional[str],
+               method: str, block_size: int, overlap: int, block_unit: str = "chars",
+               snap: bool = True) -> Tuple[List[Tuple[int, int, int, str, int]], dict]:
+    """在子进程中分块单个文件，返回 (分块行列表, 编码检测结果)
+
+    编码检测结果与 iter_segment_rows 的 on_encoding 回报一致：没有重新提取时为空，
+    否则为 {"encoding": 编码}，文件中途改换过编码时编码为 None。
+
+    提取进度以 (file_id, 已处理量, 总量) 写入进度队列，由主进程汇总。
+    """
+    def report(done, total):
+        if _progress_queue is not None:
+            _progress_queue.put((file_id, done, total))
+    detected = {}
+    rows = list(iter_segment_rows(file_path, file_type, file_hash, encoding, method, block_size, overlap,
+                                  block_unit, snap, on_progress=report,
+                                  on_encoding=lambda enc: detected.update(encoding=enc)))
+    return rows, detected
+
+def plan_regions(cache_path: str, method: str, region_size: int = PARALLEL_REGION_SIZE) -> List[Tuple[int, int]]:
+    """在提取文本缓存中按块边界划分并行分块的区域，返回各区域的字节区间
+
+    只解码每个目标位置之后的一小段文本来寻找切点，不把整份缓存读入内存。
+    """
+    regions = []
+    with open(cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        size = len(view)
+        start = 0
+        pos = region_size
+        while size - start > region_size and pos < size:
+            # 窗口两端都对齐到 UTF-8 字符边界
+            pos = _char_boundary(view, pos, 1)
+            end = _char_boundary(view, min(pos + REGION_SEARCH_WINDOW, size), -1)
+            text = str(view[pos:end], 'utf-8', 'surrogatepass')
+            cut = find_region_cut(text, method)
+            if cut is None:
+                pos = end
+                continue
+            regions.append((start, pos + len(text[:cut[0]].encode('utf-8', 'surrogatepass'))))
+            start = pos + len(text[:cut[1]].encode('utf-8', 'surrogatepass'))
+            pos = start + region_size
+        regions.append((start, size))
+    return regions
+
+def _char_boundary(view, pos: int, direction: int) -> int:
+    while 0 < pos < len(view) and 0x80 <= view[pos] < 0xC0:
+        pos += direction
+    return pos
+
+def split_region(cache_path: str, start: int, end: int, method: str, block_size: int, overlap: int,
+                 block_unit: str = "chars", snap: bool = True) -> List[Tuple[int, int, int, str, int]]:
+    """在子进程中分块缓存的一个区域，返回的字节偏移已换算为整份缓存中的位置"""
+    with open(cache_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8', 'surrogatepass')
+    return [segment_row(chunk.start + start, chunk.end + start, chunk.text)
+            for chunk in iter_chunk_spans([text], method, block_size, overlap, block_unit=block_unit, snap=snap)]
+
+def iter_parallel_rows(pool: Executor, cache_path: str, method: str, block_size: int, overlap: int,
+                       block_unit: str = "chars", snap: bool = True,
+                       on_progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Tuple[int, int, int, str, int]]:
+    """把缓存划分为区域提交到进程池并行分块，按区域顺序产出分块行，与 iter_segment_rows 的结果一致
+
+    区域在块边界处切开，分块窗口从不跨块，接缝处无需额外处理重叠；
+    调用方按产出顺序编号即得到连续的 segment_index。
+    """
+    regions = plan_regions(cache_path, method)
+    futures = [pool.submit(split_region, cache_path, start, end, method, block_size, overlap, block_unit, snap)
+               for start, end in regions]
+    try:
+        for done, future in enumerate(futures, 1):
+            yield from future.result()
+            if on_progress:
+                on_progress(done, len(futures))
+    finally:
+        for future in futures:
+            future.cancel()
+
+def iter_parallel_segment_rows(pool: Executor, file_path: str, file_type: str, file_hash: str,
+                               encoding: Optional[str], method: str, block_size: int, overlap: int,
+                               block_unit: str = "chars", snap: bool = True,
+                               on_progress: Optional[Callable[[int, int], None]] = None,
+                               on_encoding: Optional[Callable[[Optional[str]], None]] = None) -> Iterator[Tuple[int, int, int, str, int]]:
+    """iter_segment_rows 的并行版本：提取文本尚未缓存时先完整提取一遍写入缓存，再按区域并行分块"""
+    cache_path = text_cache_path(file_hash, file_type)
+    if not os.path.exists(cache_path):
+        for _ in iter_extracted_text(file_path, file_type, file_hash, on_progress=on_progress,
+                                     encoding=encoding, on_encoding=on_encoding):
+            pass
+    yield from iter_parallel_rows(pool, cache_path, method, block_size, overlap, block_unit, snap, on_progress)
@@ -0,0 +1,442 @@
+import os
+import mmap
+import shutil
+import uuid
+import codecs
+import hashlib
+import logging
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+import PyPDF2
+from chardet.universaldetector import UniversalDetector
+
+from app.utils.text_splitter import iter_normalized
+
+logger = logging.getLogger(__name__)
+
+# 各类型提取器的版本号，提取逻辑变化时递增，旧的缓存随之失效
+EXTRACTOR_VERSIONS = {'txt': 3, 'md': 3, 'docx': 3, 'pdf': 2}
+
+# 提取文本的磁盘缓存目录，可以随时清空
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", os.path.join("cache", "extracted"))
+# 已保存分块所引用的提取文本：分块只记录字节偏移，内容从这里读取，
+# 与按摘要存放的上传原文件一样长期保留，不随缓存清理或提取器升级丢失
+TEXT_STORE_DIR = os.getenv("TEXT_STORE_DIR", os.path.join("uploads", ".text"))
+
+# PDF 并行提取的进程数，以及每个分片包含的页数，可通过环境变量调整
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", 32))
+
+# 进度回调：on_progress(已处理, 总量)
+ProgressCallback = Optional[Callable[[int, int], None]]
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+    return _pdf_pool
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """在子进程中提取 [start, end) 页的文本"""
+    reader = PyPDF2.PdfReader(file_path)
+    return [reader.pages[i].extract_text() or '' for i in range(start, end)]
+
+def iter_pdf_pages(file_path: str, workers: Optional[int] = None,
+                   on_progress: ProgressCallback = None) -> Iterator[str]:
+    """按页序产出 PDF 每一页的文本
+
+    页数超过一个分片时，按页区间分发到进程池并行提取，再按原顺序产出；
+    前面的分片一完成即可开始产出，调用方无需等待整份文档提取完毕。
+    workers 为 1 时在当前进程内顺序提取。
+    """
+    reader = PyPDF2.PdfReader(file_path)
+    total = len(reader.pages)
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    if workers <= 1 or total <= PDF_PAGES_PER_SHARD:
+        for i, page in enumerate(reader.pages):
+            yield page.extract_text() or ''
+            if on_progress:
+                on_progress(i + 1, total)
+        return
+
+    pool = _get_pdf_pool()
+    futures = [
+        pool.submit(_extract_pdf_pages, file_path, start, min(start + PDF_PAGES_PER_SHARD, total))
+        for start in range(0, total, PDF_PAGES_PER_SHARD)
+    ]
+    logger.debug(f"PDF 分 {len(futures)} 片并行提取: {file_path} ({total} 页)")
+    done = 0
+    try:
+        for future in futures:
+            for text in future.result():
+                yield text
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+    finally:
+        # 调用方提前停止消费时，取消尚未开始的分片
+        for future in futures:
+            future.cancel()
+
+# DOCX 正文所在的压缩包成员及 WordprocessingML 命名空间
+_DOCX_BODY = 'word/document.xml'
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# 流式读取文本文件时每次读取的字节数
+READ_CHUNK_SIZE = 1024 * 1024
+
+# 编码检测只读取文件开头的样本字节数
+ENCODING_SAMPLE_SIZE = int(os.getenv("ENCODING_SAMPLE_SIZE", 64 * 1024))
+
+# 带 BOM 的编码；UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，需先判断
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# chardet 常把 GBK 文本识别为 GB2312，按超集解码以免丢字
+_ENCODING_SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'ascii': 'utf-8'}
+
+def read_file_content(file_path, file_type):
+    """提取文件的纯文本内容"""
+    return ''.join(iter_file_text(file_path, file_type))
+
+def iter_file_text(file_path: str, file_type: str, on_progress: ProgressCallback = None,
+                   encoding: Optional[str] = None,
+                   on_encoding: Optional[Callable[[Optional[str]], None]] = None) -> Iterator[str]:
+    """逐段产出文件的纯文本，片段依次拼接即为完整文本
+
+    txt/md 按固定字节数增量解码，docx 逐段落产出，pdf 逐页产出（页间以空行分隔），
+    下游分块可以边提取边处理。on_progress(已处理, 总量) 报告提取进度。
+    txt/md 已知编码时通过 encoding 传入以跳过检测，检测到的编码通过 on_encoding 回报（见 _iter_plain_text）。
+    """
+    if file_type in ['txt', 'md']:
+        yield from _iter_plain_text(file_path, encoding, on_progress, on_encoding)
+    elif file_type == 'docx':
+        for i, line in enumerate(iter_docx_lines(file_path, on_progress)):
+            yield line if i == 0 else '\n' + line
+    elif file_type == 'pdf':
+        # 页与页之间用两个换行分隔，便于后续分段
+        for i, text in enumerate(iter_pdf_pages(file_path, on_progress=on_progress)):
+            yield text if i == 0 else '\n\n' + text
+
+def iter_docx_lines(file_path: str, on_progress: ProgressCallback = None) -> Iterator[str]:
+    """按文档顺序产出 DOCX 的段落与表格行
+
+    直接从压缩包中流式解析 word/document.xml，不构建完整的文档对象；
+    表格每行输出为一行 "| 单元格 | 单元格 |"，单元格内的多个段落以空格连接。
+    on_progress 按已解压的 XML 字节数报告进度。
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        total = archive.getinfo(_DOCX_BODY).file_size
+        with archive.open(_DOCX_BODY) as f:
+            level = 0
+            body = None
+            table_depth = 0
+            paragraphs: List[List[str]] = []  # 文本框等嵌套段落时按栈处理
+            cell: List[str] = []
+            row: List[str] = []
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    level += 1
+                    if tag == _W + 'p':
+                        paragraphs.append([])
+                    elif tag == _W + 'tbl':
+                        table_depth += 1
+                    elif tag == _W + 'body':
+                        body = elem
+                    elif table_depth == 1 and tag == _W + 'tr':
+                        row = []
+                    elif table_depth == 1 and tag == _W + 'tc':
+                        cell = []
+                    continue
+
+                level -= 1
+                if tag == _W + 't':
+                    if paragraphs and elem.text:
+                        paragraphs[-1].append(elem.text)
+                elif tag == _W + 'tab':
+                    if paragraphs:
+                        paragraphs[-1].append('\t')
+                elif tag in (_W + 'br', _W + 'cr'):
+                    if paragraphs:
+                        paragraphs[-1].append('\n')
+                elif tag == _W + 'p':
+                    text = ''.join(paragraphs.pop())
+                    if paragraphs:
+                        if text:
+                            paragraphs[-1].append('\n' + text)
+                    elif table_depth:
+                        if text:
+                            cell.append(text)
+                    else:
+                        yield text
+                elif tag == _W + 'tbl':
+                    table_depth -= 1
+                elif table_depth == 1 and tag == _W + 'tc':
+                    row.append(' '.join(cell).replace('\n', ' ').strip())
+                elif table_depth == 1 and tag == _W + 'tr':
+                    yield '| ' + ' | '.join(row) + ' |'
+                    if on_progress:
+                        on_progress(f.tell(), total)
+
+                # body 的直接子元素处理完后即释放，内存占用与文档大小无关
+                if level == 2 and body is not None:
+                    body.clear()
+                    if on_progress:
+                        on_progress(f.tell(), total)
+
+def detect_encoding(file_path: str, sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
+    """只读取文件开头的样本判断编码，不随文件大小变慢"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size)
+        at_eof = not f.read(1)
+    return detect_sample_encoding(sample, final=at_eof)
+
+def detect_sample_encoding(sample: bytes, final: bool = False) -> str:
+    """依次尝试 BOM、UTF-8 快速校验，最后对样本运行 chardet
+
+    final 为 False 表示样本在文件中间截断，末尾不完整的多字节序列不视为错误。
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=final)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    detector = UniversalDetector()
+    detector.feed(sample)
+    encoding = (detector.close()['encoding'] or 'utf-8').lower()
+    return _ENCODING_SUPERSETS.get(encoding, encoding)
+
+def _iter_plain_text(file_path: str, encoding: Optional[str] = None, on_progress: ProgressCallback = None,
+                     on_encoding: Optional[Callable[[Optional[str]], None]] = None) -> Iterator[str]:
+    """增量解码文本文件；encoding 为空时按样本检测
+
+    按 UTF-8 解码到中途遇到非法字节时，对出错位置之后的样本重新检测编码并继续解码，
+    已产出的内容不受影响。整份文件由同一编码解码时通过 on_encoding 回报该编码，供调用方保存；
+    中途改换过编码时回报 None：任何单一编码都不能正确解码整份文件，调用方不应保存编码，下次重新检测。
+    """
+    if encoding is None:
+        encoding = detect_encoding(file_path)
+    if encoding != 'utf-8':
+        yield from _iter_decoded(file_path, encoding, 'ignore', on_progress)
+        if on_encoding:
+            on_encoding(encoding)
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    total = os.path.getsize(file_path)
+    done = 0
+    switched = False
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            done += len(chunk)
+            pending = decoder.getstate()[0]
+            try:
+                text = decoder.decode(chunk)
+            except UnicodeDecodeError as e:
+                data = pending + chunk
+                valid = data[:e.start].decode('utf-8')
+                if valid:
+                    yield valid
+                rest = data[e.start:] + f.read(max(0, ENCODING_SAMPLE_SIZE - (len(data) - e.start)))
+                done = f.tell()
+                encoding = detect_sample_encoding(rest[:ENCODING_SAMPLE_SIZE], final=done == total)
+                if encoding == 'utf-8':
+                    encoding = 'gb18030'
+                logger.info(f"{file_path} 在第 {done - len(rest)} 字节处不是 UTF-8，改用 {encoding} 解码")
+                switched = True
+                decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+                text = decoder.decode(rest)
+                if text:
+                    yield text
+                for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                    done += len(chunk)
+                    text = decoder.decode(chunk)
+                    if text:
+                        yield text
+                    if on_progress:
+                        on_progress(done, total)
+                break
+            if text:
+                yield text
+            if on_progress:
+                on_progress(done, total)
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+    if on_encoding:
+        on_encoding(None if switched else encoding)
+
+def _iter_decoded(file_path: str, encoding: str, errors: str = 'strict',
+                  on_progress: ProgressCallback = None) -> Iterator[str]:
+    """以增量解码器按块读取文本文件"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    total = os.path.getsize(file_path)
+    done = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            done += len(chunk)
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+            if on_progress:
+                on_progress(done, total)
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def file_digest(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的 SHA-256"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def text_cache_path(file_hash: str, file_type: str, version: Optional[int] = None) -> str:
+    """缓存文件路径，由内容摘要与提取器版本（默认为当前版本）共同决定"""
+    if version is None:
+        version = EXTRACTOR_VERSIONS.get(file_type, 0)
+    return os.path.join(TEXT_CACHE_DIR, file_hash[:2], f"{file_hash}.{file_type}.v{version}.txt")
+
+def text_store_path(file_hash: str, file_type: str, version: int) -> str:
+    """分块所引用的提取文本的持久存放路径"""
+    return os.path.join(TEXT_STORE_DIR, file_hash[:2], f"{file_hash}.{file_type}.v{version}.txt")
+
+def persist_extracted_text(file_hash: str, file_type: str, version: Optional[int] = None) -> str:
+    """把缓存中的提取文本固定到持久目录并返回其路径，已存在时直接返回
+
+    优先建硬链接，不额外占用磁盘；缓存之后被清理或重写（原子替换为新文件）都不影响已固定的文本。
+    """
+    if version is None:
+        version = EXTRACTOR_VERSIONS.get(file_type, 0)
+    path = text_store_path(file_hash, file_type, version)
+    if os.path.exists(path):
+        return path
+    cache_path = text_cache_path(file_hash, file_type, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            os.link(cache_path, tmp_path)
+        except OSError:
+            # 跨文件系统等无法建硬链接时复制
+            shutil.copyfile(cache_path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+def get_extracted_text(file_path: str, file_type: str, file_hash: Optional[str] = None) -> str:
+    """返回提取后的完整文本，优先读取磁盘缓存"""
+    return ''.join(iter_extracted_text(file_path, file_type, file_hash))
+
+def iter_extracted_text(file_path: str, file_type: str, file_hash: Optional[str] = None,
+                        on_progress: ProgressCallback = None, encoding: Optional[str] = None,
+                        on_encoding: Optional[Callable[[Optional[str]], None]] = None) -> Iterator[str]:
+    """逐段产出提取后的文本，优先读取磁盘缓存，未命中时边提取边写入缓存
+
+    缓存以内容摘要和提取器版本为键，相同内容的文件共享同一份缓存，
+    调整分块参数重新分块时不再重复解析 PDF/DOCX。
+    缓存中保存换行统一为 \\n 之后的文本，分块的字节偏移即指向这份文本。
+    """
+    if file_hash is None:
+        file_hash = file_digest(file_path)
+    cache_path = text_cache_path(file_hash, file_type)
+    if os.path.exists(cache_path):
+        yield from _iter_decoded(cache_path, 'utf-8', 'surrogatepass', on_progress)
+        return
+
+    # 先写临时文件，完整提取后再原子替换，避免并发读到写了一半的缓存
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', errors='surrogatepass', newline='') as f:
+            for text in iter_normalized(iter_file_text(file_path, file_type, on_progress, encoding, on_encoding)):
+                f.write(text)
+                yield text
+        os.replace(tmp_path, cache_path)
+        logger.debug(f"已缓存提取文本: {cache_path}")
+    finally:
+        # 提取失败或调用方提前停止时丢弃不完整的缓存
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class TextSpanReader:
+    """按字节区间从持久保存的提取文本中读取分块内容
+
+    文本文件以 mmap 只读映射，通过 memoryview 切片直接解码，不把整份文本读入内存；
+    同一个 reader 内每份文本只映射一次，用完调用 close()（或使用 with）。
+    """
+
+    def __init__(self):
+        self._views = {}
+
+    def read(self, file_path: str, file_type: str, file_hash: str, version: int, start: int, end: int) -> str:
+        path = text_store_path(file_hash, file_type, version)
+        entry = self._views.get(path)
+        if entry is None:
+            entry = self._views[path] = self._map(path, file_path, file_type, file_hash, version)
+        return str(entry[1][start:end], 'utf-8', 'surrogatepass')
+
+    def segment_text(self, row) -> str:
+        """分块内容：有偏移的从持久保存的提取文本读取，旧数据（无偏移）直接使用 content 列
+
+        row 需包含 content、start_offset、end_offset 以及所属文件的
+        file_path、file_type、file_hash、text_version。
+        提取文本已无法取回时，content 列仍有内容的分块退回使用 content。
+        """
+        if row["start_offset"] is None:
+            return row["content"]
+        try:
+            return self.read(row["file_path"], row["file_type"], row["file_hash"], row["text_version"],
+                             row["start_offset"], row["end_offset"])
+        except FileNotFoundError:
+            if row["content"]:
+                return row["content"]
+            raise
+
+    def _map(self, path: str, file_path: str, file_type: str, file_hash: str, version: int):
+        if not os.path.exists(path):
+            # 固定到持久目录之前保存的分块：从缓存补固定；缓存也已清理时，版本未变则重新提取，结果与分块时一致
+            if not os.path.exists(text_cache_path(file_hash, file_type, version)):
+                if version != EXTRACTOR_VERSIONS.get(file_type, 0):
+                    raise FileNotFoundError(f"提取文本已丢失且提取器版本已变化，请重新分块: {file_path}")
+                logger.info(f"提取文本缺失，重新提取: {file_path}")
+                for _ in iter_extracted_text(file_path, file_type, file_hash):
+                    pass
+            persist_extracted_text(file_hash, file_type, version)
+        f = open(path, 'rb')
+        if os.fstat(f.fileno()).st_size == 0:
+            f.close()
+            return None, memoryview(b'')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        return mapped, memoryview(mapped)
+
+    def close(self) -> None:
+        for mapped, view in self._views.values():
+            view.release()
+            if mapped is not None:
+                mapped.close()
+        self._views.clear()
+
+    def __enter__(self) -> "TextSpanReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,444 @@
+import hashlib
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.utils.tokenizer import token_starts
+
+# 段落分隔：包含至少两个换行的空白段，从第一个换行开始吞掉其后全部空白，
+# 与 (?:\n\s*){2,} 匹配的范围相同；以换行字面量开头，正则引擎可以快速定位候选位置
+PARAGRAPH_SPLITTER = re.compile(r'\n[^\S\n]*\n\s*')
+# 标题分隔：下一行去掉首尾空白后以若干 # 加空白开头时，匹配该行之前的换行
+HEADING_SPLITTER = re.compile(r'\n(?=[^\S\n]*#+[^\S\n]+\S)')
+# 从行内第一个非空白字符起判断是否为标题行
+HEADING_LINE = re.compile(r'#+[^\S\n]+\S')
+# 表格分隔：换行后紧跟竖线
+TABLE_SPLITTER = re.compile(r'\n\|')
+# 智能分块：一次扫描同时找出段落分隔与标题分隔，段落分隔优先；公共的换行前缀提到分支之外
+AUTO_SPLITTER = re.compile(r'\n(?:(?P<paragraph>[^\S\n]*\n\s*)|(?=[^\S\n]*#+[^\S\n]+\S))')
+# 各分块方式的块分隔符及块首尾空白的处理方式，用于寻找并行分块的区域切点
+_REGION_SPLITTERS = {
+    "paragraph": (PARAGRAPH_SPLITTER, 'keep'),
+    "heading": (HEADING_SPLITTER, 'strip'),
+    "table": (TABLE_SPLITTER, 'strip'),
+    "auto": (AUTO_SPLITTER, 'auto'),
+}
+
+# 滑动窗口吸附的句子边界：这些字符之后的位置
+SENTENCE_ENDINGS = '。！？.!?\n'
+_SENTENCE_CODES = np.array([ord(ch) for ch in SENTENCE_ENDINGS], dtype=np.uint32)
+SENTENCE_ENDING = re.compile('[' + re.escape(SENTENCE_ENDINGS) + ']')
+_UTF32 = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
+# 窗口终点只在不短于半个窗口的范围内吸附，避免为凑边界切出过短的块
+SNAP_MIN_RATIO = 0.5
+# 超过该长度（字符数，对缓存文件为字节数）的文本按块边界切成若干区域，在多个进程中并行分块
+PARALLEL_SPLIT_MIN_SIZE = int(os.getenv("PARALLEL_SPLIT_MIN_SIZE", 32 * 1024 * 1024))
+PARALLEL_REGION_SIZE = int(os.getenv("PARALLEL_REGION_SIZE", 8 * 1024 * 1024))
+
+class Chunk(NamedTuple):
+    """一个分块：文本及其在（换行统一后的）全文 UTF-8 编码中的字节区间 [start, end)"""
+    text: str
+    start: int
+    end: int
+
+def chunk_hash(text: str) -> str:
+    """分块内容摘要，重新分块时据此识别未变化的分块"""
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def split_by_length_within_block(block, block_size, overlap_rate, snap=True):
+    return list(iter_length_windows(block, block_size, overlap_rate, snap))
+
+def iter_length_windows(block, block_size, overlap_rate, snap=True):
+    """按固定长度滑动窗口切分单个块，相邻窗口按 overlap_rate（百分比）重叠
+
+    snap 为 True 时窗口起止点吸附到句子边界，见 _snapped_window_bounds。
+    """
+    windows = _snapped_window_bounds(block, None, block_size, overlap_rate) if snap \
+        else _iter_window_bounds(block, block_size, overlap_rate)
+    for start, end in windows:
+        yield block[start:end]
+
+def _window_step(block_size: int, overlap_rate: int) -> int:
+    overlap_rate = max(0, min(overlap_rate, 99))
+    return max(1, int(block_size * (1 - overlap_rate / 100)))
+
+def _iter_token_window_bounds(block: str, starts: List[int], block_size: int,
+                              overlap_rate: int) -> Iterator[Tuple[int, int]]:
+    """按 token 数滑动窗口，starts 为各 token 的起始字符位置，窗口边界总落在 token 边界上"""
+    step = _window_step(block_size, overlap_rate)
+    k = 0
+    while k < len(starts):
+        i = starts[k]
+        end = starts[k + block_size] if k + block_size < len(starts) else len(block)
+        if block[i:end].strip():
+            yield i, end
+        k += step
+
+def _iter_window_bounds(block: str, block_size: int, overlap_rate: int) -> Iterator[Tuple[int, int]]:
+    """产出滑动窗口在块内的字符区间，跳过全是空白的窗口"""
+    step = _window_step(block_size, overlap_rate)
+    i = 0
+    while i < len(block):
+        end = min(i + block_size, len(block))
+        if block[i:end].strip():
+            yield i, end
+        i += step
+
+def sentence_boundaries(block: str) -> np.ndarray:
+    """块内全部句子边界（句末标点或换行之后）的字符位置，升序"""
+    codes = np.frombuffer(block.encode(_UTF32, 'surrogatepass'), dtype=np.uint32)
+    # 边界字符只有几个，逐个比较再合并比 np.isin 快
+    mask = codes == _SENTENCE_CODES[0]
+    for code in _SENTENCE_CODES[1:]:
+        mask |= codes == code
+    return np.flatnonzero(mask) + 1
+
+def _snapped_window_bounds(block: str, starts: Optional[List[int]], block_size: int,
+                           overlap_rate: int) -> Iterator[Tuple[int, int]]:
+    """吸附句子边界的滑动窗口，产出块内字符区间
+
+    starts 为 None 时以字符计长度，否则以 token 计（starts 为各 token 的起始字符位置）。
+    窗口终点取窗口内最靠后、且不短于 SNAP_MIN_RATIO 个窗口的边界，找不到时按长度硬切；
+    下一窗口从上一终点回退重叠长度处起，再前移到其后第一个不越过上一终点的边界。
+    每个窗口的起点依赖上一个窗口吸附后的终点，只能逐个推进。
+    """
+    if starts is None:
+        return _snapped_char_window_bounds(block, block_size, overlap_rate)
+    return _snapped_token_window_bounds(block, starts, block_size, overlap_rate)
+
+def _snapped_char_window_bounds(block: str, block_size: int, overlap_rate: int) -> Iterator[Tuple[int, int]]:
+    """按字符计长度的吸附窗口：不预先扫描整个块，只在每个窗口用到的范围内搜索边界
+
+    终点在倒序文本中搜索（即从窗口终点往回找第一个边界），起点在重叠范围内向后搜索；
+    每个窗口至多两次正则搜索，扫描的字符数不超过窗口长度。
+    """
+    size = len(block)
+    reverse = block[::-1]
+    search = SENTENCE_ENDING.search
+    overlap_size = block_size - _window_step(block_size, overlap_rate)
+    min_size = int(block_size * SNAP_MIN_RATIO)
+    begin = 0
+    while True:
+        limit = begin + block_size
+        match = None
+        if limit >= size:
+            end = size
+        else:
+            # 倒序文本中的第一个匹配即原文 [begin + min_size, limit) 中最靠后的边界字符
+            match = search(reverse, size - limit, size - begin - min_size)
+            end = size - match.start() if match else limit
+        if block[begin:end].strip():
+            yield begin, end
+        if end >= size:
+            return
+        nxt = max(end - overlap_size, begin + 1)
+        if match is None and nxt > begin + min_size:
+            # 回退后的范围在找终点时已经扫描过，其中没有边界
+            begin = nxt
+        else:
+            match = search(block, nxt - 1, end)
+            begin = match.end() if match else nxt
+
+def _snapped_token_window_bounds(block: str, starts: List[int], block_size: int,
+                                 overlap_rate: int) -> Iterator[Tuple[int, int]]:
+    """按 token 计长度的吸附窗口：边界只保留恰好落在 token 起点上的，换算为 token 序号，
+    每个窗口在该数组上各做一次 searchsorted 找终点与起点"""
+    positions = sentence_boundaries(block)
+    size = len(starts)
+    token_pos = np.asarray(starts, dtype=np.int64)
+    index = np.searchsorted(token_pos, positions)
+    aligned = index < size
+    aligned[aligned] = token_pos[index[aligned]] == positions[aligned]
+    bounds = index[aligned]
+    count = len(bounds)
+    overlap_size = block_size - _window_step(block_size, overlap_rate)
+    min_size = int(block_size * SNAP_MIN_RATIO)
+    char_pos = starts + [len(block)]
+    begin = 0
+    while True:
+        limit = begin + block_size
+        if limit >= size:
+            end = size
+        else:
+            k = int(bounds.searchsorted(limit, 'right')) - 1
+            bound = bounds.item(k) if k >= 0 else -1
+            end = bound if bound > begin + min_size else limit
+        i, j = char_pos[begin], char_pos[end]
+        if block[i:j].strip():
+            yield i, j
+        if end >= size:
+            return
+        nxt = max(end - overlap_size, begin + 1)
+        k = int(bounds.searchsorted(nxt))
+        bound = bounds.item(k) if k < count else end + 1
+        begin = bound if bound <= end else nxt
+
+def split_by_heading(content):
+    # 以标题为分块起点，返回每个标题块
+    return list(iter_heading_blocks([content]))
+
+def split_content(content, method, block_size, overlap, snap=True, workers=None):
+    """分块整篇文本；超过 PARALLEL_SPLIT_MIN_SIZE 时按块边界切成区域，在 workers 个进程中并行分块"""
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(content) >= PARALLEL_SPLIT_MIN_SIZE:
+        return parallel_split_content(content, method, block_size, overlap, snap, workers)
+    return list(iter_chunks([content], method, block_size, overlap, snap))
+
+def parallel_split_content(content, method, block_size, overlap, snap=True, workers=None,
+                           region_size=PARALLEL_REGION_SIZE):
+    """按安全的块边界把文本切成区域，多进程分块后按顺序拼接，结果与单进程分块一致
+
+    分块窗口从不跨块，区域又恰好在块边界处切开，因此各区域可以独立分块，
+    接缝处既不会丢失重叠部分，也不会产生跨区域的窗口。
+    """
+    content = ''.join(iter_normalized([content]))
+    regions = split_regions(content, method, region_size)
+    if len(regions) == 1:
+        return list(iter_chunks([content], method, block_size, overlap, snap))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_split_region_text, (content[start:end] for start, end in regions),
+                           repeat(method), repeat(block_size), repeat(overlap), repeat(snap))
+        return [chunk for chunks in results for chunk in chunks]
+
+def _split_region_text(text, method, block_size, overlap, snap):
+    return list(iter_chunks([text], method, block_size, overlap, snap))
+
+def find_region_cut(text: str, method: str, pos: int = 0) -> Optional[Tuple[int, int]]:
+    """在 text[pos:] 中找第一个可以安全切开并行分块的块边界，返回 (前一区域终点, 后一区域起点)
+
+    切点是分块方式对应分隔符的一次匹配，需满足：
+    分隔符之后还有文本（段落分隔吞掉的空白没有被截断）；
+    对 paragraph、auto，分隔符前的空白中没有换行且再往前是非空白字符，保证整篇扫描时的匹配也从这里开始；
+    对 auto，段落分隔只在块尾没有空白或其后紧接标题行时可用，因为区域末尾的块总会去掉尾随空白。
+    找不到时返回 None。
+    """
+    splitter, mode = _REGION_SPLITTERS.get(method, (PARAGRAPH_SPLITTER, 'keep'))
+    for match in splitter.finditer(text, pos):
+        if match.end() >= len(text):
+            break
+        if mode == 'strip':
+            return match.start(), match.end()
+        i = match.start() - 1
+        while i >= pos and text[i] != '\n' and text[i].isspace():
+            i -= 1
+        if i < pos or text[i].isspace():
+            continue
+        if (mode == 'auto' and i < match.start() - 1 and match.lastgroup == 'paragraph'
+                and not HEADING_LINE.match(text, match.end())):
+            continue
+        return match.start(), match.end()
+    return None
+
+def split_regions(text: str, method: str, region_size: int) -> List[Tuple[int, int]]:
+    """把文本切成约 region_size 个字符的区域，返回各区域的字符区间，区域之间的分隔符不属于任何区域"""
+    regions = []
+    start = 0
+    while len(text) - start > region_size:
+        cut = find_region_cut(text, method, start + region_size)
+        if cut is None:
+            break
+        regions.append((start, cut[0]))
+        start = cut[1]
+    regions.append((start, len(text)))
+    return regions
+
+def iter_chunks(pieces: Iterable[str], method: str, block_size: int, overlap: int,
+                snap: bool = True, block_unit: str = "chars") -> Iterator[str]:
+    """从文本片段流中逐个产出分块
+
+    pieces 依次拼接即为完整文档（可以是按页、按段或按固定大小读出的片段），
+    结果与对拼接后的整篇文本调用 split_content 一致，但内存占用只与单个块的大小相关。
+    """
+    for chunk in iter_chunk_spans(pieces, method, block_size, overlap, offsets=False, block_unit=block_unit,
+                                  snap=snap):
+        yield chunk.text
+
+def iter_chunk_spans(pieces: Iterable[str], method: str, block_size: int, overlap: int,
+                     offsets: bool = True, block_unit: str = "chars", snap: bool = True) -> Iterator[Chunk]:
+    """与 iter_chunks 相同，额外给出每个分块在换行统一后全文中的 UTF-8 字节区间
+
+    分块都是全文的连续片段，保存区间即可在需要时从提取文本缓存中按偏移读回内容。
+    offsets 为 False 时不计算区间（start、end 均为 0），省去编码开销。
+    block_unit 为 "tokens" 时 block_size 按 token 数计算，超长块的窗口在 token 边界处切开。
+    snap 为 True 时超长块的窗口吸附到句子边界，为 False 时按固定长度切分。
+    """
+    pieces = iter_normalized(pieces)
+    if method == "paragraph":
+        # 只保留完整段落，不再切分
+        for block, start in _iter_blocks(pieces, PARAGRAPH_SPLITTER, 'keep', offsets):
+            yield Chunk(block, start, start + _utf8_len(block) if offsets else 0)
+        return
+    elif method == "heading":
+        # 每个标题块合并为一个分块
+        blocks = _iter_blocks(pieces, HEADING_SPLITTER, 'strip', offsets)
+    elif method == "table":
+        blocks = _iter_blocks(pieces, TABLE_SPLITTER, 'strip', offsets)
+    elif method == "auto":
+        # 智能递归分层：先按标题分块，再对每个标题块按段落分块
+        blocks = _iter_blocks(pieces, AUTO_SPLITTER, 'auto', offsets)
+    else:
+        blocks = _iter_blocks(pieces, PARAGRAPH_SPLITTER, 'keep', offsets)
+    # 对每个块，超长才切分，绝不跨块拼接
+    for block, start in blocks:
+        if block_unit == "tokens":
+            starts = token_starts(block)
+            if len(starts) <= block_size:
+                yield Chunk(block, start, start + _utf8_len(block) if offsets else 0)
+                continue
+            windows = _snapped_window_bounds(block, starts, block_size, overlap) if snap \
+                else _iter_token_window_bounds(block, starts, block_size, overlap)
+        else:
+            if len(block) <= block_size:
+                yield Chunk(block, start, start + _utf8_len(block) if offsets else 0)
+                continue
+            windows = _snapped_window_bounds(block, None, block_size, overlap) if snap \
+                else _iter_window_bounds(block, block_size, overlap)
+        if not offsets:
+            for i, j in windows:
+                yield Chunk(block[i:j], 0, 0)
+            continue
+        # 窗口起点、终点各自单调递增，分别用游标累计字节数，整个块只编码一遍
+        start_cursor = end_cursor = (0, start)
+        for i, j in windows:
+            start_cursor = _advance(block, start_cursor, i)
+            end_cursor = _advance(block, end_cursor, j)
+            yield Chunk(block[i:j], start_cursor[1], end_cursor[1])
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode('utf-8', 'surrogatepass'))
+
+def _advance(text: str, cursor: Tuple[int, int], index: int) -> Tuple[int, int]:
+    """把 (字符位置, 字节位置) 游标前移到 index"""
+    pos, offset = cursor
+    return index, offset + _utf8_len(text[pos:index])
+
+def _stay(text: str, cursor: Tuple[int, int], index: int) -> Tuple[int, int]:
+    return index, 0
+
+def iter_normalized(pieces: Iterable[str]) -> Iterator[str]:
+    """统一换行符为 \\n，正确处理跨片段的 \\r\\n"""
+    pending_cr = False
+    for piece in pieces:
+        if not piece:
+            continue
+        if not pending_cr and '\r' not in piece:
+            yield piece
+            continue
+        if pending_cr:
+            piece = '\r' + piece
+        pending_cr = piece.endswith('\r')
+        if pending_cr:
+            piece = piece[:-1]
+        piece = piece.replace('\r\n', '\n').replace('\r', '\n')
+        if piece:
+            yield piece
+    if pending_cr:
+        yield '\n'
+
+def iter_paragraphs(pieces: Iterable[str]) -> Iterator[str]:
+    r"""按空行切分段落，结果与 re.split(r'(?:\n\s*){2,}') 后过滤空白段一致"""
+    return (block for block, _ in _iter_blocks(pieces, PARAGRAPH_SPLITTER, 'keep'))
+
+def iter_heading_blocks(pieces: Iterable[str]) -> Iterator[str]:
+    """以标题行为起点切分，产出去掉首尾空白后的各个标题块"""
+    return (block for block, _ in _iter_blocks(pieces, HEADING_SPLITTER, 'strip'))
+
+def iter_table_blocks(pieces: Iterable[str]) -> Iterator[str]:
+    """按“换行+竖线”切分，产出去掉首尾空白后的各块"""
+    return (block for block, _ in _iter_blocks(pieces, TABLE_SPLITTER, 'strip'))
+
+def iter_auto_blocks(pieces: Iterable[str]) -> Iterator[str]:
+    """先按标题分块、再在每个标题块内按段落切分，一次扫描完成"""
+    return (block for block, _ in _iter_blocks(pieces, AUTO_SPLITTER, 'auto'))
+
+def _iter_blocks(pieces: Iterable[str], splitter: re.Pattern, mode: str,
+                 offsets: bool = True) -> Iterator[Tuple[str, int]]:
+    """用预编译的分隔符单遍扫描文本流，逐个产出 (块, 块在全文中的起始字节偏移)
+
+    mode 决定块的首尾空白处理：
+    keep  —— 原样保留（段落）；
+    strip —— 去掉首尾空白（标题块、表格块）；
+    auto  —— 标题块的首尾去空白，块内段落原样保留：块首总是去掉前导空白，
+             块尾（下一个分隔是标题、段落分隔之后紧接标题行或到达文末）去掉尾随空白。
+
+    片段先累积到缓冲区，只在“换行 + 非空白字符开头的完整行”处截断处理，
+    这样任何分隔符及其前瞻判断都不会跨越截断点；跨截断点的块以片段列表暂存，
+    每个字符只被正则扫描一次。offsets 为 False 时不累计字节偏移（均返回 0）。
+    """
+    advance = _advance if offsets else _stay
+    parts: List[str] = []   # 当前块已扫描过的部分
+    carry = ''              # 截断点之后尚未扫描的文本
+    pending: List[str] = []  # 尚未找到截断点的新片段
+    # 缓冲区内的 (字符位置, 全文字节偏移) 游标，以及当前块原文起点的字节偏移
+    cursor = (0, 0)
+    block_start = 0
+    for piece in iter_normalized(pieces):
+        pending.append(piece)
+        cut = _find_cut(piece)
+        if cut is None:
+            continue
+        buf = carry + ''.join(pending)
+        limit = len(buf) - len(piece) + cut
+        pending = []
+        pos = 0
+        for match in splitter.finditer(buf):
+            if match.start() >= limit:
+                break
+            parts.append(buf[pos:match.start()])
+            block = _finish_block(parts, buf, match, mode, False, block_start, offsets)
+            if block:
+                yield block
+            parts = []
+            pos = match.end()
+            cursor = advance(buf, cursor, pos)
+            block_start = cursor[1]
+        end = max(pos, limit)
+        parts.append(buf[pos:end])
+        carry = buf[end:]
+        cursor = (0, advance(buf, cursor, end)[1])
+
+    buf = carry + ''.join(pending)
+    pos = 0
+    for match in splitter.finditer(buf):
+        parts.append(buf[pos:match.start()])
+        block = _finish_block(parts, buf, match, mode, match.end() == len(buf), block_start, offsets)
+        if block:
+            yield block
+        parts = []
+        pos = match.end()
+        cursor = advance(buf, cursor, pos)
+        block_start = cursor[1]
+    parts.append(buf[pos:])
+    block = _finish_block(parts, buf, None, mode, True, block_start, offsets)
+    if block:
+        yield block
+
+def _find_cut(piece: str) -> Optional[int]:
+    """在片段中找最靠后的截断点：换行之后、以非空白字符开头且后面还有换行（整行完整）的位置"""
+    end = piece.rfind('\n')
+    i = piece.rfind('\n', 0, end)
+    while i >= 0:
+        if not piece[i + 1].isspace():
+            return i + 1
+        i = piece.rfind('\n', 0, i)
+    return None
+
+def _finish_block(parts: List[str], buf: str, match: Optional[re.Match], mode: str, at_end: bool,
+                  raw_start: int, offsets: bool = True) -> Optional[Tuple[str, int]]:
+    """拼出当前块并按 mode 处理首尾空白，返回 (块, 起始字节偏移)；空白块返回 None"""
+    raw = ''.join(parts)
+    if not raw or raw.isspace():
+        return None
+    if mode == 'keep':
+        return raw, raw_start
+    block = raw.lstrip()
+    leading = len(raw) - len(block)
+    if (mode == 'strip' or at_end or match is None or match.lastgroup != 'paragraph'
+            or HEADING_LINE.match(buf, match.end())):
+        block = block.rstrip()
+    return block, raw_start + _utf8_len(raw[:leading]) if offsets else 0
@@ -0,0 +1,54 @@
+import os
+import re
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# tiktoken 编码名称；未安装 tiktoken 时使用正则近似计数
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# 近似分词：连续拉丁字母每 6 个算一个 token，数字每 3 位一个，其余非空白字符（中日韩文字、标点）各算一个
+_APPROX_TOKEN = re.compile(r'[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]')
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+except Exception:  # 未安装或编码数据不可用
+    _encoding = None
+    logger.info("未启用 tiktoken，token 数按正则近似计算")
+
+def count_tokens(text: str) -> int:
+    """计算文本的 token 数"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(1 for _ in _APPROX_TOKEN.finditer(text))
+
+def token_starts(text: str) -> List[int]:
+    """返回每个 token 在文本中的起始字符位置，按 token 数切分时以这些位置为边界"""
+    if not text:
+        return []
+    if _encoding is None:
+        return [m.start() for m in _APPROX_TOKEN.finditer(text)]
+    tokens = _encoding.encode(text, disallowed_special=())
+    _, offsets = _encoding.decode_with_offsets(tokens)
+    # 一个字符被拆成多个 token 时偏移相同，去重后保持递增
+    starts: List[int] = []
+    for offset in offsets:
+        offset = min(offset, len(text))
+        if not starts or offset > starts[-1]:
+            starts.append(offset)
+    if starts and starts[0] != 0:
+        starts[0] = 0
+    return starts
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断到不超过 max_tokens 个 token"""
+    if max_tokens <= 0:
+        return ''
+    starts = token_starts(text)
+    if len(starts) <= max_tokens:
+        return text
+    return text[:starts[max_tokens]]
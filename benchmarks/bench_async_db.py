@@ -0,0 +1,112 @@
+"""async 接口中数据库访问的延迟基准测试
+
+在临时数据库中写入大量分块与问答对，连续执行几次大导出（多表连接、读取全部问答对），
+期间按固定节奏发出小请求（按主键读一个分块），对比两种写法下小请求的 p50 / p99 延迟：
+  blocking  在 async 函数中直接调用 SQLite（原写法），查询期间事件循环被阻塞
+  executor  通过 AsyncDatabase 在专用数据库线程池中执行
+
+用法：python benchmarks/bench_async_db.py [分块数，默认 200000] [--exports 导出次数，默认 3]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.async_db import AsyncDatabase  # noqa: E402
+from app.models.connection import get_connection  # noqa: E402
+
+EXPORT_SQL = """
+    SELECT q.question, q.answer, s.content, f.filename
+    FROM qa_pairs q JOIN text_segments s ON s.id = q.segment_id JOIN files f ON f.id = s.file_id
+    ORDER BY q.id DESC
+"""
+LOOKUP_SQL = "SELECT id, segment_index, content FROM text_segments WHERE id = ?"
+# 小请求的到达间隔（秒）
+INTERVAL = 0.002
+
+def build(path, count):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE files (id INTEGER PRIMARY KEY, filename TEXT);
+        CREATE TABLE text_segments (id INTEGER PRIMARY KEY, file_id INTEGER, content TEXT, segment_index INTEGER);
+        CREATE TABLE qa_pairs (id INTEGER PRIMARY KEY, segment_id INTEGER, question TEXT, answer TEXT);
+        INSERT INTO files (id, filename) VALUES (1, 'big.txt');
+    """)
+    conn.executemany("INSERT INTO text_segments (file_id, content, segment_index) VALUES (1, ?, ?)",
+                     (("x" * 200, i) for i in range(count)))
+    conn.executemany("INSERT INTO qa_pairs (segment_id, question, answer) VALUES (?, 'q', ?)",
+                     ((i % count + 1, "a" * 100) for i in range(count)))
+    conn.commit()
+    conn.close()
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def measure(mode, path, count, export_count):
+    database = AsyncDatabase(path)
+
+    async def export():
+        if mode == "blocking":
+            conn = get_connection(path)
+            rows = conn.execute(EXPORT_SQL).fetchall()
+            conn.close()
+        else:
+            rows = await database.fetch_all(EXPORT_SQL)
+        return len(rows)
+
+    async def lookup(segment_id):
+        if mode == "blocking":
+            conn = get_connection(path)
+            conn.execute(LOOKUP_SQL, (segment_id,)).fetchone()
+            conn.close()
+        else:
+            await database.fetch_one(LOOKUP_SQL, (segment_id,))
+
+    async def exports():
+        for _ in range(export_count):
+            await export()
+            await asyncio.sleep(0)
+
+    # 预热：建立连接、读入页缓存
+    await export()
+    background = asyncio.create_task(exports())
+    latencies = []
+    pending = []
+    loop = asyncio.get_running_loop()
+    i = 0
+    while not background.done():
+        # 按固定节奏发出小请求，延迟从计划发出的时刻算起，包含在事件循环上排队的时间
+        scheduled = loop.time()
+        task = asyncio.create_task(lookup(i % count + 1))
+        task.add_done_callback(lambda t, scheduled=scheduled: latencies.append(loop.time() - scheduled))
+        pending.append(task)
+        i += 1
+        await asyncio.sleep(INTERVAL)
+    await asyncio.gather(background, *pending)
+    database._executor.shutdown()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("count", nargs="?", type=int, default=200000)
+    parser.add_argument("--exports", type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build(path, args.count)
+        for mode in ("blocking", "executor"):
+            start = time.perf_counter()
+            latencies = asyncio.run(measure(mode, path, args.count, args.exports))
+            elapsed = time.perf_counter() - start
+            print(f"{mode:9} 小请求 p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  "
+                  f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  max {max(latencies) * 1000:7.1f} ms  "
+                  f"（{args.exports} 次导出期间 {len(latencies)} 个小请求，共 {elapsed:.1f} s）")
+
+if __name__ == "__main__":
+    main()
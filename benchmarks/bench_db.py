@@ -0,0 +1,108 @@
+"""数据库连接开销基准测试
+
+在临时数据库中建一张与 text_segments 相近的表，对比每次新建连接与复用连接池时
+“取连接 + 一次主键查询 + 归还”的平均耗时、小事务写入的耗时，
+以及逐行 execute 与分批 executemany 写入大量分块的耗时。
+
+用法：python benchmarks/bench_db.py [查询次数，默认 5000] [--segments 分块数，默认 50000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.connection import get_connection, insert_many  # noqa: E402
+
+def fresh_connection(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def bench_queries(connect, path, count):
+    start = time.perf_counter()
+    for i in range(count):
+        conn = connect(path)
+        conn.execute("SELECT id, content FROM text_segments WHERE id = ?", (i % 1000 + 1,)).fetchone()
+        conn.close()
+    return (time.perf_counter() - start) / count * 1e6
+
+def bench_writes(connect, path, count):
+    start = time.perf_counter()
+    for i in range(count):
+        conn = connect(path)
+        conn.execute("UPDATE text_segments SET segment_index = ? WHERE id = ?", (i, i % 1000 + 1))
+        conn.commit()
+        conn.close()
+    return (time.perf_counter() - start) / count * 1e6
+
+SEGMENT_INSERT = """
+    INSERT INTO text_segments (file_id, content, segment_index, start_offset, end_offset, token_count, content_hash)
+    VALUES (?, '', ?, ?, ?, ?, ?)
+"""
+
+def segment_rows(count):
+    return [(1, i, i * 1000, i * 1000 + 1015, 250, f"{i:064x}") for i in range(count)]
+
+def bench_segment_writes(path, count, mode):
+    """mode: per_commit 每个分块新建连接并提交（原 smart_split_task 的写法），execute 单事务逐行，batched 分批"""
+    conn = get_connection(path)
+    conn.execute("DELETE FROM text_segments")
+    conn.commit()
+    rows = segment_rows(count)
+    start = time.perf_counter()
+    ids = []
+    if mode == "per_commit":
+        for row in rows:
+            single = fresh_connection(path)
+            ids.append(single.execute(SEGMENT_INSERT, row).lastrowid)
+            single.commit()
+            single.close()
+    elif mode == "execute":
+        c = conn.cursor()
+        for row in rows:
+            c.execute(SEGMENT_INSERT, row)
+            ids.append(c.lastrowid)
+    else:
+        ids = insert_many(conn.cursor(), SEGMENT_INSERT, rows)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    assert len(ids) == count
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("count", nargs="?", type=int, default=5000)
+    parser.add_argument("--segments", type=int, default=50000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.execute("""
+            CREATE TABLE text_segments (id INTEGER PRIMARY KEY AUTOINCREMENT, file_id INTEGER, content TEXT,
+                                        segment_index INTEGER, start_offset INTEGER, end_offset INTEGER,
+                                        token_count INTEGER, content_hash TEXT)
+        """)
+        conn.executemany("INSERT INTO text_segments (content, segment_index) VALUES (?, ?)",
+                         (("x" * 500, i) for i in range(1000)))
+        conn.commit()
+        conn.close()
+        print(f"每次新建连接 查询: {bench_queries(fresh_connection, path, args.count):.1f} us/次")
+        print(f"连接池      查询: {bench_queries(get_connection, path, args.count):.1f} us/次")
+        # 写入对比放在最后：连接池会把数据库切到 WAL，之后新建连接同样处于 WAL 模式
+        writes = max(1, args.count // 10)
+        print(f"连接池      写入: {bench_writes(get_connection, path, writes):.1f} us/次")
+        print(f"每次新建连接 写入: {bench_writes(fresh_connection, path, writes):.1f} us/次（WAL，synchronous 默认 FULL）")
+        # 逐个提交太慢，只写十分之一再按比例折算
+        sample = max(1, args.segments // 10)
+        per_commit = bench_segment_writes(path, sample, "per_commit") * args.segments / sample
+        print(f"{args.segments} 个分块 逐个连接提交: {per_commit:.2f} s（按 {sample} 个折算）")
+        print(f"{args.segments} 个分块 单事务逐行 execute: {bench_segment_writes(path, args.segments, 'execute'):.2f} s")
+        print(f"{args.segments} 个分块 分批 executemany: {bench_segment_writes(path, args.segments, 'batched'):.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""语义分块基准测试
+
+生成由若干话题交替组成的合成文档，统计句子切分、相邻句相似度与分块的耗时，
+以及切点落在话题交界处的比例。
+
+用法：python benchmarks/bench_semantic.py [句子数，默认 10000] [--min-tokens N] [--max-tokens N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.semantic_splitter import adjacent_similarity, semantic_split, split_sentences  # noqa: E402
+
+# 每个话题一个词表，句子由本话题的词随机组成，同一话题的句子共享用词
+TOPICS = [
+    "机器学习 模型 训练 数据 神经网络 反向传播 权重 梯度 下降 优化 算法 损失函数".split(),
+    "天气 晴朗 气温 二十五度 外出 散步 郊游 阳光 微风 多云 降雨 预报".split(),
+    "stock market fell investors interest rates bond yields rose shares trading index".split(),
+    "烹饪 红烧肉 五花肉 冰糖 焯水 糖色 小火 慢炖 酱油 八角 葱姜 出锅".split(),
+]
+
+def make_sentence(rng, topic):
+    words = rng.sample(TOPICS[topic], rng.randint(4, 8))
+    if topic == 2:
+        return " ".join(words).capitalize() + ". "
+    return "".join(words) + "。"
+
+def make_document(sentences, seed=1):
+    """生成约 sentences 句的文档，每个话题连续 5-20 句，话题之间以换行分隔"""
+    rng = random.Random(seed)
+    parts = []
+    count = 0
+    previous = -1
+    while count < sentences:
+        topic = rng.choice([t for t in range(len(TOPICS)) if t != previous])
+        previous = topic
+        run = [make_sentence(rng, topic) for _ in range(rng.randint(5, 20))]
+        parts.append("".join(run))
+        count += len(run)
+    return "\n".join(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="语义分块基准测试")
+    parser.add_argument("sentences", nargs="?", type=int, default=10_000, help="句子数")
+    parser.add_argument("--min-tokens", type=int, default=60)
+    parser.add_argument("--max-tokens", type=int, default=300)
+    args = parser.parse_args()
+
+    text = make_document(args.sentences)
+    start = time.perf_counter()
+    spans = split_sentences(text)
+    split_time = time.perf_counter() - start
+    start = time.perf_counter()
+    adjacent_similarity(text, spans)
+    similarity_time = time.perf_counter() - start
+    start = time.perf_counter()
+    chunks = semantic_split(text, args.min_tokens, args.max_tokens)
+    total_time = time.perf_counter() - start
+
+    # 切点恰好落在话题交界（换行）处的比例
+    hits = 0
+    pos = 0
+    for chunk in chunks[:-1]:
+        pos = text.index(chunk, pos) + len(chunk)
+        hits += text[pos:pos + 1] == "\n"
+    print(f"{len(text)} 字符，{len(spans)} 句，{len(chunks)} 块")
+    print(f"句子切分 {split_time:6.3f}s  相邻相似度 {similarity_time:6.3f}s  语义分块总计 {total_time:6.3f}s")
+    print(f"切点落在话题交界处 {hits / max(1, len(chunks) - 1):.0%}")
+
+if __name__ == "__main__":
+    main()
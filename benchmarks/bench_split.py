@@ -0,0 +1,146 @@
+"""分块引擎基准测试
+
+生成指定大小的合成文档（含标题、段落与表格），分别用旧的多遍实现与当前的单遍扫描实现分块，
+校验两者结果一致并输出耗时；另外给出超长块窗口吸附句子边界时的耗时。
+
+用法：python benchmarks/bench_split.py [字符数，默认 100000000] [--pieces 片段字符数]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.text_splitter import (  # noqa: E402
+    iter_chunks, parallel_split_content, split_by_length_within_block
+)
+
+METHODS = ["paragraph", "heading", "table", "auto", "default"]
+
+def legacy_split_by_length_within_block(block, block_size, overlap_rate):
+    result = []
+    overlap_rate = max(0, min(overlap_rate, 99))
+    step = int(block_size * (1 - overlap_rate / 100))
+    if step < 1:
+        step = 1
+    i = 0
+    while i < len(block):
+        sub_block = block[i:i+block_size]
+        if sub_block.strip():
+            result.append(sub_block)
+        i += step
+    return result
+
+def legacy_split_by_heading(content):
+    content = content.replace('\r\n', '\n').replace('\r', '\n')
+    pattern = r'(^#+\s.*$)'
+    lines = content.split('\n')
+    blocks = []
+    current_block = []
+    for line in lines:
+        if re.match(pattern, line.strip()):
+            if current_block:
+                blocks.append('\n'.join(current_block))
+                current_block = []
+        current_block.append(line)
+    if current_block:
+        blocks.append('\n'.join(current_block))
+    return [b.strip() for b in blocks if b.strip()]
+
+def legacy_split_content(content, method, block_size, overlap):
+    """改写前的分块实现，作为结果与耗时的基准"""
+    content = content.replace('\r\n', '\n').replace('\r', '\n')
+    paragraph_splitter = r'(?:\n\s*){2,}'
+    if method == "paragraph":
+        return [seg for seg in re.split(paragraph_splitter, content) if seg.strip()]
+    elif method == "heading":
+        blocks = legacy_split_by_heading(content)
+    elif method == "table":
+        blocks = re.split(r'\n\|', content)
+        blocks = [b.strip() for b in blocks if b.strip()]
+    elif method == "auto":
+        blocks = []
+        for hblock in legacy_split_by_heading(content):
+            blocks.extend([seg for seg in re.split(paragraph_splitter, hblock) if seg.strip()])
+    else:
+        blocks = [seg for seg in re.split(paragraph_splitter, content) if seg.strip()]
+    final_blocks = []
+    for block in blocks:
+        if len(block) <= block_size:
+            final_blocks.append(block)
+        else:
+            final_blocks.extend(legacy_split_by_length_within_block(block, block_size, overlap))
+    return final_blocks
+
+def make_document(size, seed=1):
+    """生成约 size 个字符的合成文档"""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size:
+        r = rng.random()
+        if r < 0.05:
+            part = "#" * rng.randint(1, 3) + f" 第 {total} 节\n\n"
+        elif r < 0.15:
+            part = "| 列一 | 列二 | 列三 |\n| 1 | 2 | 3 |\n"
+        else:
+            part = "这是一段测试文本，包含中文和 English words. " * rng.randint(1, 20)
+            part += "\r\n" if rng.random() < 0.1 else "\n"
+            if rng.random() < 0.7:
+                part += "\n"
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="分块引擎基准测试")
+    parser.add_argument("size", nargs="?", type=int, default=100_000_000, help="文档字符数")
+    parser.add_argument("--pieces", type=int, default=1024 * 1024, help="流式输入时每个片段的字符数")
+    parser.add_argument("--block-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=15)
+    parser.add_argument("--long-block", type=int, default=10_000_000, help="吸附测试用的单个超长块字符数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="并行分块的进程数")
+    args = parser.parse_args()
+
+    text = make_document(args.size)
+    pieces = [text[i:i + args.pieces] for i in range(0, len(text), args.pieces)]
+    print(f"文档 {len(text)} 字符，{len(pieces)} 个片段")
+    for method in METHODS:
+        start = time.perf_counter()
+        expected = legacy_split_content(text, method, args.block_size, args.overlap)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        got = list(iter_chunks(pieces, method, args.block_size, args.overlap, snap=False))
+        new_time = time.perf_counter() - start
+        start = time.perf_counter()
+        snapped = sum(1 for _ in iter_chunks(pieces, method, args.block_size, args.overlap))
+        snap_time = time.perf_counter() - start
+        status = "一致" if got == expected else "不一致"
+        print(f"{method:<10} {len(got):>8} 块  {status}  旧 {legacy_time:6.2f}s  新 {new_time:6.2f}s  "
+              f"加速 {legacy_time / new_time:5.1f}x  吸附边界 {snapped:>8} 块 {snap_time:6.2f}s")
+
+    # 没有段落分隔的超长块：全部耗时都在滑动窗口上
+    block = ("这是一段没有空行的长文本，包含中文和 English words. " * (args.long_block // 30 + 1))[:args.long_block]
+    for snap in (False, True):
+        start = time.perf_counter()
+        count = len(split_by_length_within_block(block, args.block_size, args.overlap, snap))
+        print(f"超长块 {'吸附' if snap else '定长'}  {count:>8} 块  {time.perf_counter() - start:6.2f}s")
+
+    # 整篇文档按块边界切成区域多进程分块，与单进程结果比较
+    if args.workers > 1:
+        for method in METHODS:
+            start = time.perf_counter()
+            expected = list(iter_chunks([text], method, args.block_size, args.overlap))
+            single_time = time.perf_counter() - start
+            start = time.perf_counter()
+            got = parallel_split_content(text, method, args.block_size, args.overlap, workers=args.workers)
+            parallel_time = time.perf_counter() - start
+            status = "一致" if got == expected else "不一致"
+            print(f"{method:<10} 并行 {args.workers} 进程  {status}  单进程 {single_time:6.2f}s  "
+                  f"并行 {parallel_time:6.2f}s  加速 {single_time / parallel_time:5.1f}x")
+
+if __name__ == "__main__":
+    main()
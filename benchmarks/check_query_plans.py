@@ -0,0 +1,46 @@
+"""热点查询执行计划检查
+
+按迁移建一个临时数据库（或检查指定的数据库文件），对 app/models/indexes.py 中的
+每条热点查询执行 EXPLAIN QUERY PLAN 并打印计划；任何一条在 text_segments / qa_pairs 上
+退化为全表扫描或临时自动索引时以非零状态退出，可直接用于 CI。
+
+用法：python benchmarks/check_query_plans.py [数据库文件，默认按迁移新建]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.models.indexes import HOT_QUERIES, full_scans  # noqa: E402
+from app.models.migrations import run_migrations  # noqa: E402
+
+def check(conn) -> int:
+    for name, sql, params in HOT_QUERIES:
+        print(name)
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall():
+            print(f"    {row[3]}")
+    problems = full_scans(conn)
+    for name, detail in problems:
+        print(f"未使用索引: {name}: {detail}")
+    print("全部热点查询均使用索引" if not problems else f"{len(problems)} 处全表扫描")
+    return 1 if problems else 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("database", nargs="?")
+    args = parser.parse_args()
+    if args.database:
+        return check(sqlite3.connect(args.database))
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "plans.db"))
+        run_migrations(conn)
+        status = check(conn)
+        conn.close()
+        return status
+
+if __name__ == "__main__":
+    sys.exit(main())
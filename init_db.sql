@@ -4,6 +4,7 @@ DROP TABLE IF EXISTS text_segments;
 DROP TABLE IF EXISTS qa_pairs;
 DROP TABLE IF EXISTS segments;
 DROP TABLE IF EXISTS settings;
+DROP TABLE IF EXISTS schema_version;
 
 -- files table
 CREATE TABLE files (
@@ -14,7 +15,11 @@ CREATE TABLE files (
                     file_size INTEGER NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT '待处理'
+                    status TEXT DEFAULT '待处理',
+                    file_hash TEXT,
+                    encoding TEXT,
+                    split_params TEXT,
+                    text_version INTEGER
                 );
 
 
@@ -25,6 +30,11 @@ CREATE TABLE text_segments (
                     content TEXT NOT NULL,
                     segment_index INTEGER NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    start_offset INTEGER,
+                    end_offset INTEGER,
+                    token_count INTEGER,
+                    content_hash TEXT,
+                    simhash INTEGER,
                     FOREIGN KEY (file_id) REFERENCES files (id)
                 );
 
@@ -68,6 +78,16 @@ CREATE TABLE settings (
         );
 
 -- Create indexes
+CREATE INDEX IF NOT EXISTS idx_files_file_hash ON files (file_hash);
+CREATE INDEX IF NOT EXISTS idx_files_created_at ON files (created_at);
+CREATE INDEX IF NOT EXISTS idx_text_segments_file_id_segment_index ON text_segments (file_id, segment_index);
+CREATE INDEX IF NOT EXISTS idx_qa_pairs_segment_id ON qa_pairs (segment_id);
+CREATE INDEX IF NOT EXISTS idx_qa_pairs_file_id_score ON qa_pairs (file_id, score);
+CREATE INDEX IF NOT EXISTS idx_text_segments_content_hash ON text_segments (content_hash);
+CREATE INDEX IF NOT EXISTS idx_text_segments_simhash_0 ON text_segments (((simhash >> 0) & 65535));
+CREATE INDEX IF NOT EXISTS idx_text_segments_simhash_1 ON text_segments (((simhash >> 16) & 65535));
+CREATE INDEX IF NOT EXISTS idx_text_segments_simhash_2 ON text_segments (((simhash >> 32) & 65535));
+CREATE INDEX IF NOT EXISTS idx_text_segments_simhash_3 ON text_segments (((simhash >> 48) & 65535));
 
 -- Insert test data
 
@@ -1,29 +1,52 @@
 import os
 import logging
+import asyncio
+import tarfile
+import multiprocessing
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from fastapi import FastAPI, Request, HTTPException, UploadFile, File, Form, BackgroundTasks, Body
+from fastapi import FastAPI, Request, HTTPException, Form, BackgroundTasks, Body
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse, HTMLResponse, Response, StreamingResponse
 import uvicorn
 from typing import List, Optional, Dict, Any
-from app.models.database import create_tables
+from app.models.async_db import async_db
+from app.models.connection import get_connection, insert_many, iter_batches
+from app.models.indexes import log_query_plans
+from app.models.migrations import run_migrations
+from app.models.queries import (
+    COPY_QA_SQL, DATASETS_SQL, DELETE_FILE_QA_SQL, DELETE_FILE_SEGMENTS_SQL, DELETE_SEGMENT_QA_SQL, SEGMENT_COLUMNS,
+    SEGMENT_COUNT_SQL, SEGMENT_FINGERPRINTS_SQL, SEGMENT_PAGE_SQL, SEGMENT_QA_SQL, duplicates_sql, export_sql,
+)
 from app.services.llm_service import LLMService
-from app.services.file_service import FileService
+from app.services.file_service import FileService, FileTooLargeError, MAX_UPLOAD_SIZE
+from app.services.upload_service import UploadService, UploadSessionError
 from app.utils.file_handler import FileHandler
 from app.utils.text_processor import TextProcessor
 from app.utils.validators import SplitSettings, QASettings, ExportSettings
 from app.utils.batch_processor import BatchProcessor
 from app.utils.quality_evaluator import QualityEvaluator
+from app.utils.text_extractor import (
+    iter_extracted_text, file_digest, text_cache_path, persist_extracted_text, TextSpanReader, EXTRACTOR_VERSIONS
+)
+from app.utils.text_splitter import PARALLEL_SPLIT_MIN_SIZE, chunk_hash, iter_chunks
+from app.utils.fingerprint import (
+    NEAR_DUPLICATE_DISTANCE, hamming_distance, simhash, simhash_band_sql, simhash_bands
+)
+from app.utils.split_worker import (
+    init_worker, iter_parallel_segment_rows, iter_segment_rows, split_file as split_file_worker
+)
+from app.utils.tokenizer import count_tokens, truncate_to_tokens
 from dotenv import load_dotenv
 import uuid
 from fastapi import status
-import sqlite3
 import json
-import chardet
-from docx import Document
-import PyPDF2
 import re
 from pydantic import BaseModel
 import csv, io
@@ -51,11 +74,19 @@ logging.getLogger("openai").setLevel(logging.WARNING)
 logging.getLogger("uvicorn").setLevel(logging.WARNING)
 logging.getLogger("fastapi").setLevel(logging.WARNING)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时清理一次过期的断点续传会话，之后在后台定期清理
+    cleanup = asyncio.create_task(upload_service.run_cleanup())
+    yield
+    cleanup.cancel()
+
 # 创建FastAPI应用
 app = FastAPI(
     title="Dataset-Bit",
     description="一个用于处理和生成高质量问答数据集的工具",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -76,89 +107,24 @@ templates = Jinja2Templates(directory="frontend/templates")
 # 初始化服务
 llm_service = LLMService(api_key=os.getenv("OPENAI_API_KEY"))
 file_service = FileService()
+upload_service = UploadService(file_service)
 batch_processor = BatchProcessor(llm_service)
 quality_evaluator = QualityEvaluator(llm_service)
 
-# 创建数据库表
-create_tables()
-
 # 数据库连接
 def get_db():
-    conn = sqlite3.connect('dataset_bit.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # 线程内复用的长连接，PRAGMA 在打开时已设置；close() 只是归还
+    return get_connection()
 
-# 初始化数据库
-def init_db():
+def migrate_db():
     conn = get_db()
-    c = conn.cursor()
-    
-    # 创建文件表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_size INTEGER NOT NULL,
-            upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status TEXT DEFAULT 'pending'
-        )
-    ''')
-    
-    # 创建文本片段表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS segments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER,
-            content TEXT NOT NULL,
-            segment_index INTEGER NOT NULL,
-            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (file_id) REFERENCES files (id)
-        )
-    ''')
-    
-    # 创建问答对表
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS qa_pairs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            segment_id INTEGER,
-            question TEXT NOT NULL,
-            answer TEXT NOT NULL,
-            quality_score REAL DEFAULT 0,
-            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (segment_id) REFERENCES segments (id)
-        )
-    ''')
-    
-    conn.commit()
+    # 按 schema_version 执行尚未应用的迁移，已是最新版本时不做 DDL；之后检查热点查询的执行计划
+    run_migrations(conn)
+    log_query_plans(conn)
     conn.close()
 
-# 初始化数据库
-init_db()
-
-def init_settings_table():
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            api_base TEXT,
-            api_key TEXT,
-            model_name TEXT,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            language TEXT DEFAULT 'zh',
-            theme TEXT DEFAULT 'light',
-            score_api_url TEXT,
-            score_api_key TEXT,
-            score_model_name TEXT
-        )
-    ''')
-    c.execute('SELECT COUNT(*) FROM settings')
-    if c.fetchone()[0] == 0:
-        c.execute('INSERT INTO settings (api_base, api_key, model_name, language, theme, score_api_url, score_api_key, score_model_name) VALUES ("", "", "", "zh", "light", "", "", "")')
-    conn.commit()
-    conn.close()
+# 启动时自动迁移
+migrate_db()
 
 @app.get("/", include_in_schema=False)
 async def root():
@@ -222,53 +188,257 @@ async def datasets_page(request: Request):
     """数据集管理页面"""
     return templates.TemplateResponse("datasets.html", {"request": request})
 
+# 允许上传的文件类型
+ALLOWED_FILE_TYPES = ['txt', 'md', 'docx', 'pdf']
+
+# 批量导入的压缩包大小上限（字节），压缩包内单个文件仍受 MAX_UPLOAD_SIZE 限制
+MAX_ARCHIVE_SIZE = int(os.getenv("MAX_ARCHIVE_SIZE", 2 * 1024 * 1024 * 1024))
+
+# 上传进度，按客户端传入的 upload_id 记录已从网络收到的请求体字节数；上传结束（成功或失败）后移除
+upload_progress = {}
+
+def content_length(request: Request) -> Optional[int]:
+    """请求声明的 Content-Length，没有或无法解析时为 None"""
+    try:
+        return int(request.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """上传文件"""
+async def upload_file(request: Request, upload_id: Optional[str] = None, auto_split: Optional[bool] = None):
+    """上传文件（multipart/form-data 的 file 字段）；auto_split（未指定时取 AUTO_SPLIT_ON_UPLOAD）为 true 时
+    上传后立即在后台按默认参数分块
+
+    直接读取请求体流并边收边写，Content-Length 或实际收到的数据超过 MAX_UPLOAD_SIZE 时立即以 413 中止。
+    """
     try:
-        logger.info(f"开始处理文件上传: {file.filename}")
-        
-        # 检查文件类型
-        allowed_types = ['txt', 'md', 'docx', 'pdf']
-        file_ext = file.filename.split('.')[-1].lower()
-        if file_ext not in allowed_types:
-            logger.warning(f"不支持的文件类型: {file_ext}")
-            raise HTTPException(status_code=400, detail="不支持的文件类型")
-        
-        # 保存文件
-        file_path = os.path.join("uploads", file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # 分块流式保存文件，按内容摘要存放
+        def report_progress(received):
+            if upload_id:
+                upload_progress[upload_id] = {"received": received, "status": "uploading"}
+        try:
+            saved = await file_service.save_multipart_upload(
+                request.stream(), request.headers.get("content-type", ""), content_length(request),
+                allowed_types=ALLOWED_FILE_TYPES, max_size=MAX_UPLOAD_SIZE, on_progress=report_progress
+            )
+        except FileTooLargeError as e:
+            logger.warning(f"上传文件过大: {str(e)}")
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            logger.warning(f"上传请求无效: {str(e)}")
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            if upload_id:
+                upload_progress.pop(upload_id, None)
+        filename, file_ext, file_size = saved["filename"], saved["file_type"], saved["size"]
+        file_path = file_service.store_by_digest(saved["file_path"], saved["sha256"], file_ext)
+        logger.info(f"文件已保存: {filename} -> {file_path} ({file_size} 字节)")
         
-        # 记录到数据库
-        conn = get_db()
-        c = conn.cursor()
-        file_size = os.path.getsize(file_path)
-        c.execute(
-            "INSERT INTO files (filename, file_path, file_type, file_size) VALUES (?, ?, ?, ?)",
-            (file.filename, file_path, file_ext, file_size)
-        )
-        file_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        # 记录到数据库，相同内容已处理过时复用其结果
+        file_id, reused_from = await async_db.run(lambda conn: register_upload(
+            conn.cursor(), filename, file_path, file_ext, file_size, saved["sha256"]))
+        split_queued = await asyncio.to_thread(queue_auto_split, file_id, auto_split)
         
         logger.info("文件上传处理完成")
-        return {"status": "success", "file_id": file_id, "filename": file.filename}
+        return {
+            "status": "success",
+            "file_id": file_id,
+            "filename": filename,
+            "file_size": file_size,
+            "sha256": saved["sha256"],
+            "reused_from": reused_from,
+            "split_queued": split_queued
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"文件上传失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+class UploadSessionParams(BaseModel):
+    filename: str
+    file_size: Optional[int] = None
+
+@app.post("/api/uploads")
+async def create_upload_session(params: UploadSessionParams):
+    """创建断点续传会话"""
+    file_ext = params.filename.split('.')[-1].lower()
+    if file_ext not in ALLOWED_FILE_TYPES:
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+    try:
+        session = upload_service.create_session(params.filename, file_ext, params.file_size)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {"status": "success", "upload_id": session["upload_id"], "offset": 0}
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """查询会话已接收的字节数，客户端据此续传"""
+    session = upload_service.get_session(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    return {
+        "status": "success",
+        "upload_id": upload_id,
+        "filename": session["filename"],
+        "file_size": session["file_size"],
+        "offset": session["offset"]
+    }
+
+@app.put("/api/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, request: Request, offset: Optional[int] = None):
+    """追加一段字节；起始位置取自 Content-Range（bytes start-end/total）或 offset 参数"""
+    content_range = request.headers.get("content-range")
+    if content_range:
+        match = re.match(r'bytes\s+(\d+)-\d+/(?:\d+|\*)', content_range.strip())
+        if not match:
+            raise HTTPException(status_code=400, detail="Content-Range 格式错误")
+        offset = int(match.group(1))
+    if offset is None:
+        raise HTTPException(status_code=400, detail="缺少起始偏移")
+    try:
+        received = await upload_service.append(upload_id, offset, request.stream())
+    except KeyError:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    except UploadSessionError as e:
+        return JSONResponse(status_code=409, content={"status": "error", "message": str(e), "offset": e.offset})
+    return {"status": "success", "upload_id": upload_id, "offset": received}
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_upload_session(upload_id: str, auto_split: Optional[bool] = None):
+    """合并分片并登记为正式文件"""
+    try:
+        saved = await upload_service.finalize(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    except UploadSessionError as e:
+        return JSONResponse(status_code=409, content={"status": "error", "message": str(e), "offset": e.offset})
+    file_id, reused_from = await async_db.run(lambda conn: register_upload(
+        conn.cursor(), saved["filename"], saved["file_path"], saved["file_type"], saved["size"], saved["sha256"]))
+    split_queued = await asyncio.to_thread(queue_auto_split, file_id, auto_split)
+    logger.info(f"断点续传完成: {saved['filename']} ({saved['size']} 字节)")
+    return {
+        "status": "success",
+        "file_id": file_id,
+        "filename": saved["filename"],
+        "file_size": saved["size"],
+        "sha256": saved["sha256"],
+        "reused_from": reused_from,
+        "split_queued": split_queued
+    }
+
+@app.delete("/api/uploads/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    """放弃上传会话"""
+    if not upload_service.abort(upload_id):
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    return {"status": "success"}
+
+def register_upload(c, filename, file_path, file_type, file_size, file_hash):
+    """登记上传文件，返回 (file_id, 复用的源文件id)
+
+    已有相同摘要的文件时，直接复制其分块与问答对，不再重复提取、分块和生成。
+    """
+    c.execute("""
+        SELECT f.id FROM files f
+        WHERE f.file_hash = ?
+        ORDER BY EXISTS (SELECT 1 FROM text_segments s WHERE s.file_id = f.id) DESC, f.id DESC
+        LIMIT 1
+    """, (file_hash,))
+    source = c.fetchone()
+    c.execute(
+        "INSERT INTO files (filename, file_path, file_type, file_size, file_hash) VALUES (?, ?, ?, ?, ?)",
+        (filename, file_path, file_type, file_size, file_hash)
+    )
+    file_id = c.lastrowid
+    if not source:
+        return file_id, None
+    source_id = source[0]
+    c.execute("""
+        INSERT INTO text_segments (file_id, content, segment_index, start_offset, end_offset, token_count,
+                                   content_hash, simhash)
+        SELECT ?, content, segment_index, start_offset, end_offset, token_count, content_hash, simhash
+        FROM text_segments
+        WHERE file_id = ? ORDER BY segment_index
+    """, (file_id, source_id))
+    c.execute(COPY_QA_SQL, (file_id, file_id, source_id))
+    c.execute("""
+        UPDATE files SET (status, encoding, split_params, text_version) = (
+            SELECT status, encoding, split_params, text_version FROM files WHERE id = ?
+        ) WHERE id = ?
+    """, (source_id, file_id))
+    logger.info(f"文件内容与 {source_id} 相同，已复用其分块与问答对")
+    return file_id, source_id
+
+# 生成问答时模型的上下文窗口与回答预留的 token 数
+QA_CONTEXT_TOKENS = int(os.getenv("QA_CONTEXT_TOKENS", 8192))
+QA_MAX_OUTPUT_TOKENS = int(os.getenv("QA_MAX_OUTPUT_TOKENS", 2048))
+
+def load_segments(c, segment_ids):
+    """按分块 id 读取内容、token 数与指纹，返回 {id: {"content", "token_count", "content_hash", "simhash"}}"""
+    texts = {}
+    if not segment_ids:
+        return texts
+    with TextSpanReader() as reader:
+        for i in range(0, len(segment_ids), 500):
+            batch = segment_ids[i:i + 500]
+            c.execute(f"""
+                SELECT {SEGMENT_COLUMNS}, s.content_hash, s.simhash
+                FROM text_segments s JOIN files f ON f.id = s.file_id
+                WHERE s.id IN ({','.join('?' * len(batch))})
+            """, batch)
+            for row in c.fetchall():
+                texts[row["id"]] = {"content": reader.segment_text(row), "token_count": row["token_count"],
+                                    "content_hash": row["content_hash"], "simhash": row["simhash"]}
+    return texts
+
+def find_duplicates(c, segment_id: int, content_hash: Optional[str], fingerprint: Optional[int],
+                    with_qa: bool = False, max_distance: int = NEAR_DUPLICATE_DISTANCE) -> List[Dict[str, Any]]:
+    """在全部文件的分块中查找与给定分块完全重复或近似重复的分块，完全重复在前，其余按海明距离升序
+
+    完全重复按内容摘要匹配；近似重复先用指纹各段的表达式索引取出至少有一段相同的候选，
+    再按海明距离不超过 max_distance 过滤。with_qa 为 True 时只返回已有问答对的分块。
+    """
+    conditions, params = [], [segment_id]
+    if content_hash:
+        conditions.append("content_hash = ?")
+        params.append(content_hash)
+    if fingerprint is not None:
+        for band, value in zip(simhash_band_sql(), simhash_bands(fingerprint)):
+            conditions.append(f"{band} = ?")
+            params.append(value)
+    if not conditions:
+        return []
+    c.execute(duplicates_sql(conditions, with_qa), params)
+    matches = []
+    for row in c.fetchall():
+        exact = bool(content_hash) and row["content_hash"] == content_hash
+        distance = 0 if exact else (hamming_distance(row["simhash"], fingerprint)
+                                    if row["simhash"] is not None and fingerprint is not None else None)
+        if exact or (distance is not None and distance <= max_distance):
+            matches.append({"id": row["id"], "file_id": row["file_id"], "segment_index": row["segment_index"],
+                            "exact": exact, "distance": distance})
+    matches.sort(key=lambda m: (not m["exact"], m["distance"], m["id"]))
+    return matches
+
+def fill_fingerprints(c, segment_ids) -> Dict[int, tuple]:
+    """为早期没有内容摘要或指纹的分块补算并回写，返回 {id: (内容摘要, SimHash)}"""
+    filled = {}
+    for seg_id, seg in load_segments(c, segment_ids).items():
+        filled[seg_id] = (seg["content_hash"] or chunk_hash(seg["content"]), simhash(seg["content"]))
+        c.execute("UPDATE text_segments SET content_hash=?, simhash=? WHERE id=?", (*filled[seg_id], seg_id))
+    return filled
+
+@app.get("/api/upload_progress/{upload_id}")
+async def upload_progress_api(upload_id: str):
+    return upload_progress.get(upload_id, {"received": 0, "status": "not_started"})
+
 @app.post("/api/split")
 async def split_text(file_id: int, method: str = "paragraph", min_length: int = 100, max_length: int = 2000):
     """分割文本"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        
         # 获取文件信息
-        c.execute("SELECT * FROM files WHERE id = ?", (file_id,))
-        file = c.fetchone()
+        file = await async_db.fetch_one("SELECT * FROM files WHERE id = ?", (file_id,))
         if not file:
             raise HTTPException(status_code=404, detail="文件不存在")
         
@@ -287,15 +457,10 @@ async def split_text(file_id: int, method: str = "paragraph", min_length: int =
             raise HTTPException(status_code=400, detail="不支持的分割方法")
         
         # 过滤和保存分割结果
-        for i, segment in enumerate(segments):
-            if min_length <= len(segment) <= max_length:
-                c.execute(
-                    "INSERT INTO segments (file_id, content, segment_index) VALUES (?, ?, ?)",
-                    (file_id, segment, i)
-                )
-        
-        conn.commit()
-        conn.close()
+        await async_db.executemany(
+            "INSERT INTO segments (file_id, content, segment_index) VALUES (?, ?, ?)",
+            [(file_id, segment, i) for i, segment in enumerate(segments) if min_length <= len(segment) <= max_length]
+        )
         return {"status": "success", "segments_count": len(segments)}
     except Exception as e:
         logger.error(f"文本分割失败: {str(e)}", exc_info=True)
@@ -456,18 +621,15 @@ async def get_qa_scores(qa_id: int):
 async def export_dataset(format: str = "alpaca", include_metadata: bool = True):
     """导出数据集"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        
         # 获取所有问答对
-        c.execute("""
+        rows = await async_db.fetch_all("""
             SELECT qa.*, s.content as context, f.filename
             FROM qa_pairs qa
             JOIN segments s ON qa.segment_id = s.id
             JOIN files f ON s.file_id = f.id
             ORDER BY qa.created_time DESC
         """)
-        qa_pairs = [dict(row) for row in c.fetchall()]
+        qa_pairs = [dict(row) for row in rows]
         
         # 根据格式导出
         if format == "alpaca":
@@ -502,18 +664,8 @@ async def export_dataset(format: str = "alpaca", include_metadata: bool = True):
 async def get_datasets():
     """获取所有文件清单及问答对数量"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("""
-            SELECT f.id, f.filename, COUNT(q.id) as qa_count, f.created_at as created_at
-            FROM files f
-            LEFT JOIN qa_pairs q ON f.id = q.file_id
-            GROUP BY f.id, f.filename, f.created_at
-            ORDER BY f.created_at DESC
-        """)
-        files = [dict(row) for row in c.fetchall()]
-        conn.close()
-        return files
+        rows = await async_db.fetch_all(DATASETS_SQL)
+        return [dict(row) for row in rows]
     except Exception as e:
         logger.error(f"获取文件清单失败: {str(e)}")
         raise HTTPException(status_code=500, detail="获取文件清单失败")
@@ -839,11 +991,7 @@ async def file_page(request: Request):
     """文件管理页面"""
     lang = request.query_params.get('lang') or request.cookies.get('lang') or 'zh'
     t = LANGS.get(lang, LANGS['zh'])
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM files ORDER BY created_at DESC")
-    files = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    files = [dict(row) for row in await async_db.fetch_all("SELECT * FROM files ORDER BY created_at DESC")]
     status_map = {
         '待处理': t['status_pending'],
         '已分块': t['status_chunked'],
@@ -900,141 +1048,543 @@ async def settings_page(request: Request):
 
 split_progress = {}
 
+# 后台分块的线程数（上传后自动预处理、压缩包批量导入共用）
+SPLIT_WORKERS = int(os.getenv("SPLIT_WORKERS", 4))
+split_executor = ThreadPoolExecutor(max_workers=SPLIT_WORKERS)
+# 批量分块的进程数，默认取 CPU 核数；提取与分块在子进程中完成，不与请求处理争用 GIL，
+# 结果由单独的写入线程逐个文件落库
+SPLIT_PROCESSES = int(os.getenv("SPLIT_PROCESSES", os.cpu_count() or 1))
+split_process_pool = None
+split_writer = ThreadPoolExecutor(max_workers=1)
+
+# 上传完成后是否自动按默认参数提取并分块，可在上传接口中用 auto_split 参数单独指定
+AUTO_SPLIT_ON_UPLOAD = os.getenv("AUTO_SPLIT_ON_UPLOAD", "false").lower() in ("1", "true", "yes")
+DEFAULT_SPLIT_METHOD = os.getenv("DEFAULT_SPLIT_METHOD", "auto")
+DEFAULT_SPLIT_BLOCK_SIZE = int(os.getenv("DEFAULT_SPLIT_BLOCK_SIZE", 1000))
+DEFAULT_SPLIT_OVERLAP = int(os.getenv("DEFAULT_SPLIT_OVERLAP", 15))
+# 块大小的单位：chars 按字符数，tokens 按 token 数
+DEFAULT_SPLIT_BLOCK_UNIT = os.getenv("DEFAULT_SPLIT_BLOCK_UNIT", "chars")
+# 超长块的滑动窗口是否吸附到句子边界
+DEFAULT_SPLIT_SNAP = os.getenv("DEFAULT_SPLIT_SNAP", "true").lower() in ("1", "true", "yes")
+
+# 进行中的分块任务：file_id -> (参数, Future)，相同参数的请求直接复用
+split_jobs = {}
+split_jobs_lock = threading.Lock()
+# 同一文件的分块任务串行执行，避免并发写入 text_segments
+file_split_locks = {}
+
+def split_params_key(method: str, block_size: int, overlap: int, block_unit: str = "chars",
+                     snap: bool = True) -> str:
+    """分块参数的规范化表示，保存在 files.split_params 中"""
+    return json.dumps({"method": method, "block_size": block_size, "overlap": overlap,
+                       "block_unit": block_unit, "snap": snap}, sort_keys=True)
+
+def queue_split(file_id: int, method: str, block_size: int, overlap: int, block_unit: str = "chars",
+                snap: bool = True) -> Future:
+    """把分块任务提交到后台线程池；同一文件相同参数的任务尚未结束时返回已有任务"""
+    key = split_params_key(method, block_size, overlap, block_unit, snap)
+    with split_jobs_lock:
+        job = split_jobs.get(file_id)
+        if job and job[0] == key and not job[1].done():
+            return job[1]
+        if not job or job[1].done():
+            split_progress[file_id] = {"current": 0, "total": 1, "status": "queued"}
+        future = split_executor.submit(run_split, file_id, method, block_size, overlap, block_unit, snap)
+        split_jobs[file_id] = (key, future)
+    future.add_done_callback(lambda f: _forget_split_job(file_id, f))
+    return future
+
+def _forget_split_job(file_id: int, future: Future):
+    with split_jobs_lock:
+        job = split_jobs.get(file_id)
+        if job and job[1] is future:
+            del split_jobs[file_id]
+
+def queue_auto_split(file_id: int, auto_split: Optional[bool]) -> bool:
+    """上传完成后按默认参数预处理；已复用分块结果的文件跳过，返回是否已排队"""
+    if not (AUTO_SPLIT_ON_UPLOAD if auto_split is None else auto_split):
+        return False
+    conn = get_db()
+    row = conn.execute("SELECT status FROM files WHERE id = ?", (file_id,)).fetchone()
+    conn.close()
+    if not row or row["status"] == '已分块':
+        return False
+    queue_split(file_id, DEFAULT_SPLIT_METHOD, DEFAULT_SPLIT_BLOCK_SIZE, DEFAULT_SPLIT_OVERLAP,
+                DEFAULT_SPLIT_BLOCK_UNIT, DEFAULT_SPLIT_SNAP)
+    return True
+
+def get_split_process_pool() -> ProcessPoolExecutor:
+    """首次使用时创建分块进程池，以及把子进程上报的提取进度写入 split_progress 的线程"""
+    global split_process_pool
+    with split_jobs_lock:
+        if split_process_pool is None:
+            progress_queue = multiprocessing.Queue()
+            split_process_pool = ProcessPoolExecutor(max_workers=SPLIT_PROCESSES, initializer=init_worker,
+                                                     initargs=(progress_queue,))
+            threading.Thread(target=_collect_split_progress, args=(progress_queue,), daemon=True).start()
+    return split_process_pool
+
+def _collect_split_progress(progress_queue):
+    while True:
+        file_id, done, total = progress_queue.get()
+        # 进度消息可能晚于写入完成到达，只更新仍在进行中的文件
+        if split_progress.get(file_id, {}).get("status") in ("queued", "processing"):
+            split_progress[file_id] = {"current": done, "total": total, "status": "processing"}
+
+def queue_process_split(file_id: int, method: str, block_size: int, overlap: int, block_unit: str = "chars",
+                        snap: bool = True) -> Future:
+    """与 queue_split 相同，但提取与分块在进程池中执行，写入由 split_writer 线程完成
+
+    已按相同参数分块过的文件直接返回结果为 True 的 Future；文件不存在时结果为 False。
+    """
+    key = split_params_key(method, block_size, overlap, block_unit, snap)
+    future = Future()
+    with split_jobs_lock:
+        job = split_jobs.get(file_id)
+    if job and job[0] == key and not job[1].done():
+        return job[1]
+    conn = get_db()
+    row = conn.execute("SELECT status, split_params FROM files WHERE id = ?", (file_id,)).fetchone()
+    if row and row["status"] == '已分块' and row["split_params"] == key and not job:
+        conn.close()
+        split_progress[file_id] = {"current": 1, "total": 1, "status": "done"}
+        future.set_result(True)
+        return future
+    source = _split_source(conn.cursor(), file_id) if row else None
+    conn.commit()
+    conn.close()
+    if not source:
+        split_progress[file_id] = {"current": 0, "total": 1, "status": "error"}
+        future.set_result(False)
+        return future
+    with split_jobs_lock:
+        job = split_jobs.get(file_id)
+        if job and job[0] == key and not job[1].done():
+            return job[1]
+        split_progress[file_id] = {"current": 0, "total": 1, "status": "queued"}
+        split_jobs[file_id] = (key, future)
+    future.add_done_callback(lambda f: _forget_split_job(file_id, f))
+    file_path, file_type, file_hash, encoding = source
+    computed = get_split_process_pool().submit(split_file_worker, file_id, file_path, file_type, file_hash,
+                                               encoding, method, block_size, overlap, block_unit, snap)
+    computed.add_done_callback(
+        lambda f: split_writer.submit(_write_process_split, file_id, f, key, file_type, file_hash, encoding, future))
+    return future
+
+def _write_process_split(file_id: int, computed: Future, key: str, file_type: str, file_hash: str,
+                         encoding: Optional[str], future: Future):
+    try:
+        rows, detected = computed.result()
+        with split_jobs_lock:
+            lock = file_split_locks.setdefault(file_id, threading.Lock())
+        with lock:
+            ok = _save_split(get_db(), file_id, rows, key, file_type, file_hash, encoding, detected)
+    except Exception as e:
+        logger.error(f"文件分块失败: {str(e)}", exc_info=True)
+        split_progress[file_id] = {"current": 0, "total": 1, "status": "error"}
+        ok = False
+    future.set_result(ok)
+
+def run_split(file_id: int, method: str, block_size: int, overlap: int, block_unit: str = "chars",
+              snap: bool = True) -> bool:
+    """提取并分块单个文件，结果写入 text_segments，进度记录在 split_progress[file_id]
+
+    在后台线程中执行，成功返回 True，并在 files.split_params 中记录所用参数。
+    """
+    with split_jobs_lock:
+        lock = file_split_locks.setdefault(file_id, threading.Lock())
+    with lock:
+        return _run_split(file_id, method, block_size, overlap, block_unit, snap)
+
+def load_segment_hashes(c, file_id: int) -> Dict[str, List[int]]:
+    """按内容摘要分组返回文件现有分块 {摘要: [id, ...]}，组内按 segment_index 排序
+
+    早期分块没有记录摘要，从原文或提取文本缓存读出内容后补算并回写；
+    提取文本已无法取回的分块读不出内容，归入空摘要组，不会与任何新分块匹配。
+    """
+    c.execute(f"""
+        SELECT {SEGMENT_COLUMNS}, s.content_hash
+        FROM text_segments s JOIN files f ON f.id = s.file_id
+        WHERE s.file_id = ?
+        ORDER BY s.segment_index
+    """, (file_id,))
+    groups: Dict[str, List[int]] = {}
+    with TextSpanReader() as reader:
+        for row in c.fetchall():
+            digest = row["content_hash"]
+            if digest is None:
+                try:
+                    digest = chunk_hash(reader.segment_text(row))
+                except (OSError, ValueError):
+                    groups.setdefault('', []).append(row["id"])
+                    continue
+                c.execute("UPDATE text_segments SET content_hash=? WHERE id=?", (digest, row["id"]))
+            groups.setdefault(digest, []).append(row["id"])
+    return groups
+
+def _split_source(c, file_id: int) -> Optional[tuple]:
+    """读取分块所需的文件信息 (file_path, file_type, file_hash, encoding)，文件不存在时返回 None"""
+    c.execute("SELECT file_path, file_type, file_hash, encoding FROM files WHERE id=?", (file_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    file_path, file_type, file_hash, encoding = row
+    if not file_hash:
+        # 历史文件补算摘要，之后可命中提取缓存
+        file_hash = file_digest(file_path)
+        c.execute("UPDATE files SET file_hash=? WHERE id=?", (file_hash, file_id))
+    return file_path, file_type, file_hash, encoding
+
+def _run_split(file_id: int, method: str, block_size: int, overlap: int, block_unit: str, snap: bool) -> bool:
+    split_progress[file_id] = {"current": 0, "total": 1, "status": "processing"}
+    conn = get_db()
+    source = _split_source(conn.cursor(), file_id)
+    if not source:
+        split_progress[file_id] = {"current": 0, "total": 1, "status": "error"}
+        conn.close()
+        return False
+    file_path, file_type, file_hash, encoding = source
+    # 提取与分块串成流水线：边提取边分块边写入，进度按提取量计算
+    def report_progress(done, total):
+        split_progress[file_id] = {"current": done, "total": total, "status": "processing"}
+    # 文本文件记录检测出的编码，之后重新提取时不再检测
+    detected = {}
+    cache_path = text_cache_path(file_hash, file_type)
+    size = os.path.getsize(cache_path if os.path.exists(cache_path) else file_path)
+    if SPLIT_PROCESSES > 1 and size >= PARALLEL_SPLIT_MIN_SIZE:
+        # 超大文件按块边界切成区域，在进程池中并行分块，结果按区域顺序写入
+        rows = iter_parallel_segment_rows(get_split_process_pool(), file_path, file_type, file_hash, encoding,
+                                          method, block_size, overlap, block_unit, snap,
+                                          on_progress=report_progress,
+                                          on_encoding=lambda enc: detected.update(encoding=enc))
+    else:
+        rows = iter_segment_rows(file_path, file_type, file_hash, encoding, method, block_size, overlap,
+                                 block_unit, snap, on_progress=report_progress,
+                                 on_encoding=lambda enc: detected.update(encoding=enc))
+    return _save_split(conn, file_id, rows, split_params_key(method, block_size, overlap, block_unit, snap),
+                       file_type, file_hash, encoding, detected)
+
+def _save_split(conn, file_id: int, rows, params_key: str, file_type: str, file_hash: str,
+                encoding: Optional[str], detected: dict) -> bool:
+    """写入分块结果并关闭连接；rows 为 (起始偏移, 结束偏移, token 数, 内容摘要, SimHash) 序列，可以是边算边产出的迭代器
+
+    分块引用的提取文本在提交前固定到持久目录，之后清理提取缓存或升级提取器都不影响读取。
+    """
+    c = conn.cursor()
+    count = 0
+    try:
+        # 按内容摘要与已有分块比对：内容相同的分块保留 id（及其问答对），只更新位置与偏移，
+        # 其余新分块插入，新结果中不再出现的旧分块连同问答对一并删除
+        existing = load_segment_hashes(c, file_id)
+        # 只保存分块在提取文本缓存中的字节区间，内容在读取时按偏移取回，重叠部分不再重复存储；
+        # 同时记录 token 数，生成问答时据此分配提示词预算。按批用 executemany 写入，整个结果在同一事务中提交
+        for batch in iter_batches(rows):
+            updates, inserts = [], []
+            for start, end, tokens, digest, fingerprint in batch:
+                same = existing.get(digest)
+                if same:
+                    updates.append((count, start, end, tokens, fingerprint, same.pop(0)))
+                else:
+                    inserts.append((file_id, count, start, end, tokens, digest, fingerprint))
+                count += 1
+            c.executemany("""
+                UPDATE text_segments SET content='', segment_index=?, start_offset=?, end_offset=?, token_count=?,
+                                         simhash=?
+                WHERE id=?
+            """, updates)
+            insert_many(c, """
+                INSERT INTO text_segments (file_id, content, segment_index, start_offset, end_offset,
+                                           token_count, content_hash, simhash)
+                VALUES (?, '', ?, ?, ?, ?, ?, ?)
+            """, inserts)
+        stale = [seg_id for group in existing.values() for seg_id in group]
+        for k in range(0, len(stale), 500):
+            batch = stale[k:k + 500]
+            marks = ','.join('?' * len(batch))
+            c.execute(f"DELETE FROM qa_pairs WHERE segment_id IN ({marks})", batch)
+            c.execute(f"DELETE FROM text_segments WHERE id IN ({marks})", batch)
+        persist_extracted_text(file_hash, file_type)
+    except Exception as e:
+        logger.error(f"文件分块失败: {str(e)}", exc_info=True)
+        conn.rollback()
+        conn.close()
+        split_progress[file_id] = {"current": count, "total": 1, "status": "error"}
+        return False
+    conn.commit()
+    c.execute("UPDATE files SET status='已分块', split_params=?, text_version=? WHERE id=?",
+              (params_key, EXTRACTOR_VERSIONS.get(file_type, 0), file_id))
+    # 中途改换过编码的文本文件回报 None：清空记录的编码，下次重新检测，不按单一编码解码整份文件
+    if detected.get("encoding", encoding) != encoding:
+        c.execute("UPDATE files SET encoding=? WHERE id=?", (detected["encoding"], file_id))
+    conn.commit()
+    conn.close()
+    split_progress[file_id] = {"current": count, "total": count, "status": "done"}
+    return True
+
 class SplitParams(BaseModel):
     method: str = "paragraph"
     block_size: int = 1000
     overlap: int = 15
+    block_unit: str = "chars"  # chars 或 tokens
+    snap_boundaries: bool = True  # 超长块的窗口吸附到句子边界
 
 # 在分块接口中限制block_size范围
     block_size = max(100, min(block_size, 5000))
 
 @app.post("/api/files/{file_id}/split")
-async def split_file(file_id: int, params: SplitParams, background_tasks: BackgroundTasks):
-    method = params.method
-    block_size = params.block_size
-    overlap = params.overlap
-    split_progress[file_id] = {"current": 0, "total": 1, "status": "processing"}
-    def do_split():
-        import sqlite3
-        conn = sqlite3.connect('dataset_bit.db')
-        c = conn.cursor()
-        c.execute("SELECT file_path, file_type FROM files WHERE id=?", (file_id,))
-        row = c.fetchone()
-        if not row:
-            split_progress[file_id] = {"current": 0, "total": 1, "status": "error"}
-            return
-        file_path, file_type = row
-        content = read_file_content(file_path, file_type)
-        blocks = split_content(content, method, block_size, overlap)
-        total = len(blocks)
-        split_progress[file_id] = {"current": 0, "total": total, "status": "processing"}
-        c.execute("DELETE FROM text_segments WHERE file_id=?", (file_id,))
-        for i, block in enumerate(blocks):
-            c.execute("INSERT INTO text_segments (file_id, content, segment_index) VALUES (?, ?, ?)", (file_id, block, i))
-            split_progress[file_id] = {"current": i+1, "total": total, "status": "processing"}
-        conn.commit()
-        c.execute("UPDATE files SET status='已分块' WHERE id=?", (file_id,))
-        conn.commit()
-        conn.close()
-        split_progress[file_id] = {"current": total, "total": total, "status": "done"}
-    background_tasks.add_task(do_split)
+async def split_file(file_id: int, params: SplitParams):
+    """分块文件；已按相同参数预处理过时直接返回已有分块，正在预处理时等待该任务"""
+    if params.block_unit not in ("chars", "tokens"):
+        raise HTTPException(status_code=400, detail="block_unit 只能是 chars 或 tokens")
+    row = await async_db.fetch_one("SELECT status, split_params FROM files WHERE id = ?", (file_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    key = split_params_key(params.method, params.block_size, params.overlap, params.block_unit,
+                           params.snap_boundaries)
+    with split_jobs_lock:
+        job = split_jobs.get(file_id)
+    if not job and row["status"] == '已分块' and row["split_params"] == key:
+        count = (await async_db.fetch_one(SEGMENT_COUNT_SQL, (file_id,)))[0]
+        split_progress[file_id] = {"current": count, "total": count, "status": "done"}
+        return {"status": "done", "precomputed": True}
+    queue_split(file_id, params.method, params.block_size, params.overlap, params.block_unit,
+                params.snap_boundaries)
     return {"status": "started"}
 
 @app.get("/api/files/{file_id}/split_progress")
 async def split_progress_api(file_id: int):
     return split_progress.get(file_id, {"current": 0, "total": 1, "status": "not_started"})
 
-def read_file_content(file_path, file_type):
-    if file_type in ['txt', 'md']:
+# 分块预览：结果按 (内容摘要, 文件类型, 提取器版本, 分块参数) 缓存，最多保留 PREVIEW_CACHE_SIZE 份
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", 256))
+PREVIEW_SAMPLES = int(os.getenv("PREVIEW_SAMPLES", 5))
+PREVIEW_SAMPLE_CHARS = 300
+PREVIEW_HISTOGRAM_BINS = 10
+preview_cache = OrderedDict()
+preview_cache_lock = threading.Lock()
+
+def compute_split_preview(file_path: str, file_type: str, file_hash: str, encoding: Optional[str],
+                          params: SplitParams) -> dict:
+    """按给定参数分块但不写入数据库，返回分块数、长度分布、token 估计与前几个分块示例
+
+    长度按 block_unit 计量（字符数或 token 数），直方图把 [0, block_size] 等分为若干区间，
+    超过 block_size 的（按段落、标题等整块保留的）分块计入最后一个区间。
+    """
+    lengths = []
+    token_total = token_max = 0
+    samples = []
+    pieces = iter_extracted_text(file_path, file_type, file_hash, encoding=encoding)
+    for chunk in iter_chunks(pieces, params.method, params.block_size, params.overlap, params.snap_boundaries,
+                             block_unit=params.block_unit):
+        tokens = count_tokens(chunk)
+        token_total += tokens
+        token_max = max(token_max, tokens)
+        lengths.append(tokens if params.block_unit == "tokens" else len(chunk))
+        if len(samples) < PREVIEW_SAMPLES:
+            samples.append(chunk[:PREVIEW_SAMPLE_CHARS])
+    count = len(lengths)
+    width = params.block_size / PREVIEW_HISTOGRAM_BINS
+    bins = [0] * (PREVIEW_HISTOGRAM_BINS + 1)
+    for length in lengths:
+        bins[min(int(length / width), PREVIEW_HISTOGRAM_BINS)] += 1
+    histogram = [{"min": round(i * width), "max": round((i + 1) * width), "count": bins[i]}
+                 for i in range(PREVIEW_HISTOGRAM_BINS)]
+    histogram[-1]["count"] += bins[-1]
+    histogram[-1]["max"] = max([histogram[-1]["max"]] + lengths)
+    lengths.sort()
+    return {
+        "chunk_count": count,
+        "unit": params.block_unit,
+        "length": {
+            "min": lengths[0] if count else 0,
+            "max": lengths[-1] if count else 0,
+            "mean": round(sum(lengths) / count, 1) if count else 0,
+            "median": lengths[count // 2] if count else 0,
+        },
+        "histogram": histogram,
+        "tokens": {"total": token_total, "mean": round(token_total / count, 1) if count else 0, "max": token_max},
+        "samples": samples,
+    }
+
+@app.post("/api/files/{file_id}/split/preview")
+async def preview_split(file_id: int, params: SplitParams):
+    """分块预览（试运行）：在提取文本缓存上分块并统计，不写入数据库，用于调整分块参数"""
+    if params.block_unit not in ("chars", "tokens"):
+        raise HTTPException(status_code=400, detail="block_unit 只能是 chars 或 tokens")
+    if params.block_size < 1:
+        raise HTTPException(status_code=400, detail="block_size 必须为正数")
+    source = await async_db.run(lambda conn: _split_source(conn.cursor(), file_id))
+    if not source:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    file_path, file_type, file_hash, encoding = source
+    key = (file_hash, file_type, EXTRACTOR_VERSIONS.get(file_type, 0),
+           split_params_key(params.method, params.block_size, params.overlap, params.block_unit,
+                            params.snap_boundaries))
+    with preview_cache_lock:
+        preview = preview_cache.get(key)
+        if preview is not None:
+            preview_cache.move_to_end(key)
+    cached = preview is not None
+    if not cached:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            with open(file_path, 'rb') as f:
-                raw = f.read()
-                result = chardet.detect(raw)
-                encoding = result['encoding'] or 'utf-8'
-                return raw.decode(encoding, errors='ignore')
-    elif file_type == 'docx':
-        doc = Document(file_path)
-        return '\n'.join([p.text for p in doc.paragraphs])
-    elif file_type == 'pdf':
-        reader = PyPDF2.PdfReader(file_path)
-        # 页与页之间用两个换行分隔，便于后续分段
-        return '\n\n'.join([page.extract_text() or '' for page in reader.pages])
-    else:
-        return ''
-
-def split_by_length_within_block(block, block_size, overlap_rate):
-    result = []
-    overlap_rate = max(0, min(overlap_rate, 99))
-    step = int(block_size * (1 - overlap_rate / 100))
-    if step < 1:
-        step = 1
-    i = 0
-    while i < len(block):
-        sub_block = block[i:i+block_size]
-        if sub_block.strip():
-            result.append(sub_block)
-        i += step
-    return result
-
-def split_by_heading(content):
-    # 以标题为分块起点，返回每个标题块
-    content = content.replace('\r\n', '\n').replace('\r', '\n')
-    pattern = r'(^#+\s.*$)'
-    lines = content.split('\n')
-    blocks = []
-    current_block = []
-    for line in lines:
-        if re.match(pattern, line.strip()):
-            if current_block:
-                blocks.append('\n'.join(current_block))
-                current_block = []
-        current_block.append(line)
-    if current_block:
-        blocks.append('\n'.join(current_block))
-    return [b.strip() for b in blocks if b.strip()]
-
-def split_content(content, method, block_size, overlap):
-    content = content.replace('\r\n', '\n').replace('\r', '\n')
-    paragraph_splitter = r'(?:\n\s*){2,}'
-    if method == "paragraph":
-        blocks = [seg for seg in re.split(paragraph_splitter, content) if seg.strip()]
-        return blocks  # 只保留完整段落，不再切分
-    elif method == "heading":
-        # 每个标题块合并为一个分块
-        blocks = split_by_heading(content)
-    elif method == "table":
-        blocks = re.split(r'\n\|', content)
-        blocks = [b.strip() for b in blocks if b.strip()]
-    elif method == "auto":
-        # 智能递归分层：先按标题分块，再对每个标题块按段落分块
-        heading_blocks = split_by_heading(content)
-        blocks = []
-        for hblock in heading_blocks:
-            blocks.extend([seg for seg in re.split(paragraph_splitter, hblock) if seg.strip()])
-    else:
-        blocks = [seg for seg in re.split(paragraph_splitter, content) if seg.strip()]
-    # 对每个块，超长才切分，绝不跨块拼接
-    final_blocks = []
-    for block in blocks:
-        if len(block) <= block_size:
-            final_blocks.append(block)
+            preview = await asyncio.to_thread(compute_split_preview, file_path, file_type, file_hash, encoding, params)
+        except Exception as e:
+            logger.error(f"分块预览失败: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"分块预览失败: {str(e)}")
+        with preview_cache_lock:
+            preview_cache[key] = preview
+            while len(preview_cache) > PREVIEW_CACHE_SIZE:
+                preview_cache.popitem(last=False)
+    return {"file_id": file_id, "params": params.model_dump(), "cached": cached, **preview}
+
+# 批量导入进度：解包阶段记录已保存的文件数，分块阶段记录已完成的文件数
+batch_progress = {}
+batch_progress_lock = threading.Lock()
+
+def run_batch_split(batch_id: str, file_ids: List[int], method: str, block_size: int, overlap: int,
+                    block_unit: str = "chars", snap: bool = True, queue=queue_split):
+    """把一批文件的分块任务提交到线程池（queue 为 queue_process_split 时提交到进程池），
+    汇总进度写入 batch_progress[batch_id]"""
+    batch_progress[batch_id] = {"current": 0, "total": len(file_ids), "failed": 0, "status": "splitting"}
+    if not file_ids:
+        batch_progress[batch_id]["status"] = "done"
+        return
+
+    def on_done(future):
+        with batch_progress_lock:
+            progress = batch_progress[batch_id]
+            progress["current"] += 1
+            if future.exception() or not future.result():
+                progress["failed"] += 1
+            if progress["current"] == progress["total"]:
+                progress["status"] = "done"
+
+    for file_id in file_ids:
+        queue(file_id, method, block_size, overlap, block_unit, snap).add_done_callback(on_done)
+
+@app.post("/api/upload/archive")
+async def upload_archive(request: Request, split: Optional[bool] = None,
+                         method: str = DEFAULT_SPLIT_METHOD, block_size: int = DEFAULT_SPLIT_BLOCK_SIZE,
+                         overlap: int = DEFAULT_SPLIT_OVERLAP, block_unit: str = DEFAULT_SPLIT_BLOCK_UNIT,
+                         snap_boundaries: bool = DEFAULT_SPLIT_SNAP, batch_id: Optional[str] = None):
+    """上传 zip/tar 压缩包（multipart/form-data 的 file 字段）批量导入文件
+
+    压缩包直接从请求体流写入临时文件，超过 MAX_ARCHIVE_SIZE 时立即中止；按允许的类型筛选成员，所有文件记录在同一个事务中登记；split 为 true（未指定时取 AUTO_SPLIT_ON_UPLOAD）时
+    将尚未分块的文件提交到线程池分块，通过 /api/upload/archive/{batch_id}/progress 查询整体进度。
+    """
+    batch_id = batch_id or uuid.uuid4().hex
+    split = AUTO_SPLIT_ON_UPLOAD if split is None else split
+    batch_progress[batch_id] = {"current": 0, "total": 0, "failed": 0, "status": "uploading"}
+    try:
+        try:
+            archive = await file_service.save_multipart_upload(
+                request.stream(), request.headers.get("content-type", ""), content_length(request),
+                max_size=MAX_ARCHIVE_SIZE
+            )
+        except FileTooLargeError as e:
+            batch_progress[batch_id]["status"] = "error"
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            batch_progress[batch_id]["status"] = "error"
+            raise HTTPException(status_code=400, detail=str(e))
+
+        def report_member(saved_count):
+            batch_progress[batch_id] = {"current": saved_count, "total": 0, "failed": 0, "status": "unpacking"}
+        try:
+            result = await asyncio.to_thread(
+                file_service.save_archive_members, archive["file_path"], ALLOWED_FILE_TYPES,
+                on_member=report_member
+            )
+        except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+            batch_progress[batch_id]["status"] = "error"
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            if os.path.exists(archive["file_path"]):
+                os.remove(archive["file_path"])
+
+        # 所有文件在一个事务中登记，避免逐个提交
+        def register_members(conn):
+            c = conn.cursor()
+            files = []
+            to_split = []
+            for saved in result["files"]:
+                file_id, reused_from = register_upload(c, saved["filename"], saved["file_path"],
+                                                       saved["file_type"], saved["size"], saved["sha256"])
+                files.append({
+                    "file_id": file_id,
+                    "filename": saved["filename"],
+                    "file_size": saved["size"],
+                    "sha256": saved["sha256"],
+                    "reused_from": reused_from
+                })
+                # 复用了已分块结果的文件无需再分块
+                c.execute("SELECT status FROM files WHERE id = ?", (file_id,))
+                if c.fetchone()[0] != '已分块':
+                    to_split.append(file_id)
+            return files, to_split
+        files, to_split = await async_db.run(register_members)
+        logger.info(f"压缩包导入完成: {archive['filename']}，共 {len(files)} 个文件")
+
+        if split:
+            run_batch_split(batch_id, to_split, method, block_size, overlap, block_unit, snap_boundaries)
         else:
-            final_blocks.extend(split_by_length_within_block(block, block_size, overlap))
-    return final_blocks
+            batch_progress[batch_id] = {"current": len(files), "total": len(files), "failed": 0, "status": "done"}
+        return {
+            "status": "success",
+            "batch_id": batch_id,
+            "files": files,
+            "skipped": result["skipped"],
+            "split_queued": len(to_split) if split else 0
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"压缩包导入失败: {str(e)}", exc_info=True)
+        batch_progress[batch_id]["status"] = "error"
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/upload/archive/{batch_id}/progress")
+async def batch_progress_api(batch_id: str):
+    return batch_progress.get(batch_id, {"current": 0, "total": 0, "failed": 0, "status": "not_started"})
+
+class BatchSplitParams(SplitParams):
+    file_ids: List[int]
+
+# 批量分块包含的文件，用于查询逐个文件的进度
+batch_files = {}
+
+@app.post("/api/files/split/batch")
+async def split_files_batch(params: BatchSplitParams):
+    """批量分块：各文件在进程池中并行提取与分块，每完成一个即写入数据库
+
+    已按相同参数分块过的文件直接计为完成；通过 /api/files/split/batch/{batch_id}/progress 查询进度。
+    """
+    if params.block_unit not in ("chars", "tokens"):
+        raise HTTPException(status_code=400, detail="block_unit 只能是 chars 或 tokens")
+    file_ids = list(dict.fromkeys(params.file_ids))
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="file_ids 不能为空")
+    batch_id = uuid.uuid4().hex
+    batch_files[batch_id] = file_ids
+    # 提交任务时要查询文件信息、为历史文件补算摘要，放到线程中执行，不阻塞事件循环
+    await asyncio.to_thread(run_batch_split, batch_id, file_ids, params.method, params.block_size, params.overlap,
+                            params.block_unit, params.snap_boundaries, queue=queue_process_split)
+    return {"status": "started", "batch_id": batch_id, "total": len(file_ids)}
+
+@app.get("/api/files/split/batch/{batch_id}/progress")
+async def split_batch_progress_api(batch_id: str):
+    """批量分块的整体进度，以及每个文件的进度"""
+    progress = batch_progress.get(batch_id, {"current": 0, "total": 0, "failed": 0, "status": "not_started"})
+    files = [{"file_id": file_id, **split_progress.get(file_id, {"current": 0, "total": 1, "status": "not_started"})}
+             for file_id in batch_files.get(batch_id, [])]
+    return {**progress, "files": files}
 
 @app.get("/api/files")
 async def get_files():
     """获取所有文件列表"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, filename as file_name FROM files ORDER BY id DESC")
-        files = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"files": files}
+        rows = await async_db.fetch_all("SELECT id, filename as file_name FROM files ORDER BY id DESC")
+        return {"files": [dict(row) for row in rows]}
     except Exception as e:
         logger.error(f"获取文件列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail="获取文件列表失败")
@@ -1043,33 +1593,30 @@ async def get_files():
 async def get_file_chunks(file_id: int, page: int = 1, page_size: int = 10):
     """获取文件的分块列表"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # 获取总记录数
-        cursor.execute("SELECT COUNT(*) FROM text_segments WHERE file_id = ?", (file_id,))
-        total = cursor.fetchone()[0]
-        
-        # 获取分页数据
-        offset = (page - 1) * page_size
-        cursor.execute("""
-            SELECT id, segment_index as chunk_index, content
-            FROM text_segments
-            WHERE file_id = ?
-            ORDER BY segment_index
-            LIMIT ? OFFSET ?
-        """, (file_id, page_size, offset))
-        
-        chunks = []
-        for row in cursor.fetchall():
-            chunk = dict(row)
-            content = chunk.get('content', '')
-            chunk['full_content'] = content
-            if len(content) > 95:
-                chunk['content'] = content[:95] + '...'
-            chunks.append(chunk)
-        conn.close()
+        def load_page(conn):
+            cursor = conn.cursor()
+            
+            # 获取总记录数
+            cursor.execute(SEGMENT_COUNT_SQL, (file_id,))
+            total = cursor.fetchone()[0]
+            
+            # 获取分页数据
+            offset = (page - 1) * page_size
+            cursor.execute(SEGMENT_PAGE_SQL, (file_id, page_size, offset))
+            
+            # 从提取文本缓存读取分块内容同样在数据库线程中完成
+            chunks = []
+            with TextSpanReader() as reader:
+                for row in cursor.fetchall():
+                    content = reader.segment_text(row)
+                    chunk = {"id": row["id"], "chunk_index": row["segment_index"], "content": content}
+                    chunk['full_content'] = content
+                    if len(content) > 95:
+                        chunk['content'] = content[:95] + '...'
+                    chunks.append(chunk)
+            return total, chunks
         
+        total, chunks = await async_db.run(load_page)
         return {
             "chunks": chunks,
             "total": total,
@@ -1080,26 +1627,64 @@ async def get_file_chunks(file_id: int, page: int = 1, page_size: int = 10):
         logger.error(f"获取分块列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail="获取分块列表失败")
 
+# 查重结果中每个分块最多列出的重复分块数
+DUPLICATE_MATCH_LIMIT = int(os.getenv("DUPLICATE_MATCH_LIMIT", 20))
+
+@app.get("/api/files/{file_id}/duplicates")
+async def get_file_duplicates(file_id: int, with_qa: bool = False):
+    """列出文件中与语料库内其他分块（含本文件）完全重复或近似重复的分块"""
+    try:
+        def scan(conn):
+            c = conn.cursor()
+            c.execute(SEGMENT_FINGERPRINTS_SQL, (file_id,))
+            rows = c.fetchall()
+            filled = fill_fingerprints(c, [row["id"] for row in rows
+                                           if row["content_hash"] is None or row["simhash"] is None])
+            duplicates = []
+            for row in rows:
+                digest, fingerprint = filled.get(row["id"], (row["content_hash"], row["simhash"]))
+                matches = find_duplicates(c, row["id"], digest, fingerprint, with_qa=with_qa)
+                if matches:
+                    duplicates.append({
+                        "segment_id": row["id"],
+                        "segment_index": row["segment_index"],
+                        "exact": matches[0]["exact"],
+                        "match_count": len(matches),
+                        "matches": matches[:DUPLICATE_MATCH_LIMIT]
+                    })
+            return rows, duplicates
+        
+        rows, duplicates = await async_db.run(scan)
+        return {
+            "file_id": file_id,
+            "total": len(rows),
+            "duplicate_count": len(duplicates),
+            "exact_count": sum(1 for d in duplicates if d["exact"]),
+            "duplicates": duplicates
+        }
+    except Exception as e:
+        logger.error(f"查找重复分块失败: {str(e)}")
+        raise HTTPException(status_code=500, detail="查找重复分块失败")
+
 @app.delete("/api/chunks/{chunk_id}")
 async def delete_chunk(chunk_id: int):
     try:
         logger.info(f"收到删除分块请求 chunk_id={chunk_id}")
-        conn = get_db()
-        cursor = conn.cursor()
-        # 先查找分块对应的 segment_id
-        cursor.execute("SELECT id FROM text_segments WHERE id = ?", (chunk_id,))
-        row = cursor.fetchone()
-        if not row:
-            conn.close()
-            return {"status": "error", "message": "分块不存在或已删除"}
-        segment_id = row[0]
-        # 删除 qa_pairs 表中关联的问答对
-        cursor.execute("DELETE FROM qa_pairs WHERE segment_id = ?", (segment_id,))
-        # 删除 text_segments 表中的分块
-        cursor.execute("DELETE FROM text_segments WHERE id = ?", (chunk_id,))
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        def delete(conn):
+            cursor = conn.cursor()
+            # 先查找分块对应的 segment_id
+            cursor.execute("SELECT id FROM text_segments WHERE id = ?", (chunk_id,))
+            row = cursor.fetchone()
+            if not row:
+                return 0
+            segment_id = row[0]
+            # 删除 qa_pairs 表中关联的问答对
+            cursor.execute(DELETE_SEGMENT_QA_SQL, (segment_id,))
+            # 删除 text_segments 表中的分块
+            cursor.execute("DELETE FROM text_segments WHERE id = ?", (chunk_id,))
+            return cursor.rowcount
+        
+        affected = await async_db.run(delete)
         logger.info(f"删除分块结果: affected={affected}")
         if affected == 0:
             return {"status": "error", "message": "分块不存在或已删除"}
@@ -1112,11 +1697,7 @@ async def delete_chunk(chunk_id: int):
 async def get_settings():
     """获取系统设置"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT api_base, api_key, model_name, language, theme, score_api_url, score_api_key, score_model_name FROM settings LIMIT 1")
-        row = c.fetchone()
-        conn.close()
+        row = await async_db.fetch_one("SELECT api_base, api_key, model_name, language, theme, score_api_url, score_api_key, score_model_name FROM settings LIMIT 1")
         if row:
             return {
                 "status": "success",
@@ -1161,14 +1742,10 @@ async def save_settings(request: Request):
         score_api_url = data.get('score_api_url', '')
         score_api_key = data.get('score_api_key', '')
         score_model_name = data.get('score_model_name', '')
-        conn = get_db()
-        c = conn.cursor()
-        c.execute(
+        await async_db.execute(
             "UPDATE settings SET api_base=?, api_key=?, model_name=?, language=?, theme=?, score_api_url=?, score_api_key=?, score_model_name=?, updated_at=CURRENT_TIMESTAMP WHERE id=1",
             (api_base, api_key, model_name, language, theme, score_api_url, score_api_key, score_model_name)
         )
-        conn.commit()
-        conn.close()
         return JSONResponse({"status": "success"})
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
@@ -1204,14 +1781,14 @@ async def generate_qa(data: dict):
         num_pairs = int(data.get("num_pairs", 3))
         file_id = int(data.get("file_id", 0))
         lang = data.get("lang", "zh")
+        # 重复分块的处理：none 照常生成，skip 跳过已有问答对的重复分块，reuse 复制其问答对
+        dedup = data.get("dedup", "none")
         if not segments or not num_pairs or not file_id:
             return {"status": "error", "message": "参数不完整"}
+        if dedup not in ("none", "skip", "reuse"):
+            return {"status": "error", "message": f"不支持的去重方式: {dedup}"}
         # 获取大模型设置
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT api_base, api_key, model_name FROM settings LIMIT 1")
-        row = c.fetchone()
-        conn.close()
+        row = await async_db.fetch_one("SELECT api_base, api_key, model_name FROM settings LIMIT 1")
         if not row:
             return {"status": "error", "message": "未配置大模型参数"}
         api_base, api_key, model_name = row
@@ -1223,22 +1800,74 @@ async def generate_qa(data: dict):
         openai.base_url = base_url
         import json
         total_qa = 0
-        conn = get_db()
-        c = conn.cursor()
+        skipped = reused = 0
+        def build_prompt(seg_content):
+            if lang == 'en':
+                return f"""Based on the following text, generate {num_pairs} QA pairs. Each pair should include a question and an answer.\nEnsure the questions are diverse, including both open-ended and factual ones. Answers should be accurate, complete, and based on the text.\nReturn the result in JSON format as follows:\n[{{\"question\": \"Question 1\", \"answer\": \"Answer 1\"}}, {{\"question\": \"Question 2\", \"answer\": \"Answer 2\"}}]\n\nText:\n{seg_content}\n\nPlease reply in English."""
+            return f"""基于以下文本内容，生成{num_pairs}个问答对。每个问答对应包含问题和答案。\n请确保问题多样化，包括开放性问题和事实性问题。答案应该准确、完整且基于文本内容。\n请以JSON格式返回结果，格式为：\n[{{\"question\": \"问题1\", \"answer\": \"答案1\"}}, {{\"question\": \"问题2\", \"answer\": \"答案2\"}}]\n\n文本内容：\n{seg_content}"""
+        # 提示词预算：模板开销只算一次，分块的 token 数取自 text_segments.token_count
+        prompt_overhead = count_tokens(build_prompt(''))
+        input_budget = QA_CONTEXT_TOKENS - QA_MAX_OUTPUT_TOKENS - prompt_overhead
+        # 带 id 的分块按 id 从库中读取内容，不依赖前端回传的文本
+        segment_ids = [seg.get('id') for seg in segments if isinstance(seg, dict) and seg.get('id')]
+        def load(conn):
+            c = conn.cursor()
+            stored_segments = load_segments(c, segment_ids)
+            fingerprints = {seg_id: (seg["content_hash"], seg["simhash"]) for seg_id, seg in stored_segments.items()}
+            if dedup != "none":
+                fingerprints.update(fill_fingerprints(c, [seg_id for seg_id, (digest, fingerprint) in fingerprints.items()
+                                                          if digest is None or fingerprint is None]))
+            return stored_segments, fingerprints
+        stored_segments, fingerprints = await async_db.run(load)
+        def resolve_duplicate(conn, segment_id):
+            """重复分块按 dedup 处理，返回复用的问答对数；不是重复分块时返回 None"""
+            c = conn.cursor()
+            matches = find_duplicates(c, segment_id, *fingerprints[segment_id], with_qa=True)
+            if not matches:
+                return None
+            if dedup != "reuse":
+                return 0
+            c.execute("""
+                INSERT INTO qa_pairs (segment_id, question, answer, file_id, score)
+                SELECT ?, question, answer, ?, score FROM qa_pairs WHERE segment_id = ? ORDER BY id
+            """, (segment_id, file_id, matches[0]["id"]))
+            return c.rowcount
         for seg in segments:
+            seg_tokens = None
             if isinstance(seg, dict):
                 segment_id = seg.get('id', 0)
-                seg_content = seg.get('content', '')
+                stored = stored_segments.get(segment_id)
+                if stored:
+                    seg_content, seg_tokens = stored["content"], stored["token_count"]
+                else:
+                    seg_content = seg.get('content', '')
             else:
                 segment_id = 0
                 seg_content = seg
-            if lang == 'en':
-                prompt = f"""Based on the following text, generate {num_pairs} QA pairs. Each pair should include a question and an answer.\nEnsure the questions are diverse, including both open-ended and factual ones. Answers should be accurate, complete, and based on the text.\nReturn the result in JSON format as follows:\n[{{\"question\": \"Question 1\", \"answer\": \"Answer 1\"}}, {{\"question\": \"Question 2\", \"answer\": \"Answer 2\"}}]\n\nText:\n{seg_content}\n\nPlease reply in English."""
-            else:
-                prompt = f"""基于以下文本内容，生成{num_pairs}个问答对。每个问答对应包含问题和答案。\n请确保问题多样化，包括开放性问题和事实性问题。答案应该准确、完整且基于文本内容。\n请以JSON格式返回结果，格式为：\n[{{\"question\": \"问题1\", \"answer\": \"答案1\"}}, {{\"question\": \"问题2\", \"answer\": \"答案2\"}}]\n\n文本内容：\n{seg_content}"""
-            completion = openai.chat.completions.create(
+            if dedup != "none" and segment_id in fingerprints:
+                # 语料中已有问答对的重复分块（包括本次请求中先生成的）不再调用模型
+                copied = await async_db.run(resolve_duplicate, segment_id)
+                if copied is not None:
+                    if dedup == "reuse":
+                        total_qa += copied
+                        reused += 1
+                    else:
+                        skipped += 1
+                    continue
+            if seg_tokens is None:
+                seg_tokens = count_tokens(seg_content)
+            if seg_tokens > input_budget:
+                # 超出上下文窗口的分块截断后再生成
+                logger.warning(f"分块 {segment_id} 共 {seg_tokens} tokens，超出预算 {input_budget}，已截断")
+                seg_content = truncate_to_tokens(seg_content, input_budget)
+                seg_tokens = input_budget
+            prompt = build_prompt(seg_content)
+            # 模型调用是阻塞的网络请求，放到线程中执行，避免卡住事件循环
+            completion = await asyncio.to_thread(
+                openai.chat.completions.create,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
+                max_tokens=max(1, min(QA_MAX_OUTPUT_TOKENS, QA_CONTEXT_TOKENS - prompt_overhead - seg_tokens)),
                 timeout=30
             )
             content = completion.choices[0].message.content.strip()
@@ -1251,12 +1880,12 @@ async def generate_qa(data: dict):
                     qa_list = json.loads(match.group(0))
                 else:
                     continue
-            for qa in qa_list:
-                c.execute("INSERT INTO qa_pairs (segment_id, question, answer, file_id, score) VALUES (?, ?, ?, ?, ?)", (segment_id, qa.get("question", ""), qa.get("answer", ""), file_id, 1))
-                total_qa += 1
-        conn.commit()
-        conn.close()
-        return {"status": "success", "count": total_qa}
+            # 每个分块的问答对一次批量写入并提交，之后的重复分块查重时能看到；
+            # 不在模型调用期间持有写事务，其他请求的写入不必等待整批生成结束
+            qa_rows = [(segment_id, qa.get("question", ""), qa.get("answer", ""), file_id, 1) for qa in qa_list]
+            total_qa += len(await async_db.run(lambda conn: insert_many(
+                conn.cursor(), "INSERT INTO qa_pairs (segment_id, question, answer, file_id, score) VALUES (?, ?, ?, ?, ?)", qa_rows)))
+        return {"status": "success", "count": total_qa, "skipped": skipped, "reused": reused}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -1279,19 +1908,8 @@ def export_datasets(ids: Optional[str] = None, format: str = 'alpaca', type: str
         conn = get_db()
         c = conn.cursor()
         # 查询所有选中文件的问答对，增加score过滤
-        placeholders = ','.join('?' * len(file_ids))
-        sql = f"""
-            SELECT q.question, q.answer, f.filename, q.score 
-            FROM qa_pairs q
-            JOIN files f ON q.file_id = f.id
-            WHERE q.file_id IN ({placeholders})
-        """
-        params = file_ids
-        if score_filter > 0:
-            sql += " AND q.score >= ?"
-            params = file_ids + [score_filter]
-        sql += " ORDER BY f.id, q.id"
-        c.execute(sql, params)
+        params = file_ids + [score_filter] if score_filter > 0 else file_ids
+        c.execute(export_sql(len(file_ids), with_score=score_filter > 0), params)
         rows = c.fetchall()
         conn.close()
         # 格式化数据
@@ -1372,43 +1990,18 @@ def export_datasets(ids: Optional[str] = None, format: str = 'alpaca', type: str
         logger.error(f"导出数据集失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def migrate_add_file_id_to_qa_pairs():
-    conn = get_db()
-    c = conn.cursor()
-    # 检查file_id字段是否已存在
-    c.execute("PRAGMA table_info(qa_pairs)")
-    columns = [row[1] for row in c.fetchall()]
-    if 'file_id' not in columns:
-        c.execute("ALTER TABLE qa_pairs ADD COLUMN file_id INTEGER")
-        conn.commit()
-    # 补全历史数据：通过segment_id查segments表，写入file_id
-    c.execute("SELECT id, segment_id FROM qa_pairs WHERE file_id IS NULL OR file_id=''")
-    qa_rows = c.fetchall()
-    for qa_id, segment_id in qa_rows:
-        if segment_id:
-            c.execute("SELECT file_id FROM segments WHERE id=?", (segment_id,))
-            row = c.fetchone()
-            if row and row[0]:
-                c.execute("UPDATE qa_pairs SET file_id=? WHERE id=?", (row[0], qa_id))
-    conn.commit()
-    conn.close()
-
-# 启动时自动迁移
-migrate_add_file_id_to_qa_pairs()
-
 @app.post("/api/files/{file_id}/delete")
 async def delete_file(file_id: int):
     try:
-        conn = get_db()
-        c = conn.cursor()
-        # 删除 qa_pairs 表中相关数据
-        c.execute("DELETE FROM qa_pairs WHERE file_id=?", (file_id,))
-        # 删除 text_segments 表中相关数据
-        c.execute("DELETE FROM text_segments WHERE file_id=?", (file_id,))
-        # 删除 files 表中相关数据
-        c.execute("DELETE FROM files WHERE id=?", (file_id,))
-        conn.commit()
-        conn.close()
+        def delete(conn):
+            c = conn.cursor()
+            # 删除 qa_pairs 表中相关数据
+            c.execute(DELETE_FILE_QA_SQL, (file_id,))
+            # 删除 text_segments 表中相关数据
+            c.execute(DELETE_FILE_SEGMENTS_SQL, (file_id,))
+            # 删除 files 表中相关数据
+            c.execute("DELETE FROM files WHERE id=?", (file_id,))
+        await async_db.run(delete)
         return {"status": "success", "message": "文件及相关数据已删除"}
     except Exception as e:
         logger.error(f"删除文件失败: {str(e)}")
@@ -1417,14 +2010,11 @@ async def delete_file(file_id: int):
 @app.get("/api/chunks/{segment_id}/qa")
 async def get_chunk_qa(segment_id: int):
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT id, question, answer, score FROM qa_pairs WHERE segment_id=? ORDER BY id ASC", (segment_id,))
+        rows = await async_db.fetch_all(SEGMENT_QA_SQL, (segment_id,))
         qa_list = [
             {"id": row[0], "question": row[1], "answer": row[2], "score": row[3]}
-            for row in c.fetchall()
+            for row in rows
         ]
-        conn.close()
         return {"status": "success", "data": qa_list, "count": len(qa_list)}
     except Exception as e:
         logger.error(f"获取分块问答对失败: {str(e)}")
@@ -1437,11 +2027,7 @@ async def update_qa(qa_id: int, data: dict):
         answer = data.get("answer", "").strip()
         if not question or not answer:
             return {"status": "error", "message": "问题和答案不能为空"}
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("UPDATE qa_pairs SET question=?, answer=? WHERE id=?", (question, answer, qa_id))
-        conn.commit()
-        conn.close()
+        await async_db.execute("UPDATE qa_pairs SET question=?, answer=? WHERE id=?", (question, answer, qa_id))
         return {"status": "success"}
     except Exception as e:
         logger.error(f"更新问答对失败: {str(e)}")
@@ -1450,11 +2036,7 @@ async def update_qa(qa_id: int, data: dict):
 @app.post("/api/qa/{qa_id}/delete")
 async def delete_qa(qa_id: int):
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("DELETE FROM qa_pairs WHERE id=?", (qa_id,))
-        conn.commit()
-        conn.close()
+        await async_db.execute("DELETE FROM qa_pairs WHERE id=?", (qa_id,))
         return {"status": "success"}
     except Exception as e:
         logger.error(f"删除问答对失败: {str(e)}")
@@ -1464,11 +2046,7 @@ async def delete_qa(qa_id: int):
 async def get_qa_score(qa_id: int):
     """获取单个问答对的评分"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT score FROM qa_pairs WHERE id=?", (qa_id,))
-        row = c.fetchone()
-        conn.close()
+        row = await async_db.fetch_one("SELECT score FROM qa_pairs WHERE id=?", (qa_id,))
         if row is not None:
             return {"status": "success", "score": row[0]}
         else:
@@ -1484,11 +2062,7 @@ async def set_qa_score(qa_id: int, data: dict = Body(...)):
         score = data.get("score")
         if score is None or not (1 <= int(score) <= 5):
             return {"status": "error", "message": "分数必须为1-5"}
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("UPDATE qa_pairs SET score=? WHERE id=?", (int(score), qa_id))
-        conn.commit()
-        conn.close()
+        await async_db.execute("UPDATE qa_pairs SET score=? WHERE id=?", (int(score), qa_id))
         return {"status": "success"}
     except Exception as e:
         logger.error(f"人工评分失败: {str(e)}")
@@ -1502,22 +2076,20 @@ async def auto_score_qa_pairs(data: dict = Body(...)):
         if not qa_ids:
             return {"status": "error", "message": "缺少问答对ID列表"}
         # 获取评分模型参数
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT score_api_url, score_api_key, score_model_name FROM settings LIMIT 1")
-        row = c.fetchone()
+        row = await async_db.fetch_one("SELECT score_api_url, score_api_key, score_model_name FROM settings LIMIT 1")
         if not row:
             return {"status": "error", "message": "未配置评分模型参数"}
         score_api_url, score_api_key, score_model_name = row
         # 获取所有问答对内容
-        c.execute(f"SELECT id, question, answer FROM qa_pairs WHERE id IN ({','.join(['?']*len(qa_ids))})", qa_ids)
-        qa_list = c.fetchall()
+        qa_list = await async_db.fetch_all(f"SELECT id, question, answer FROM qa_pairs WHERE id IN ({','.join(['?']*len(qa_ids))})", qa_ids)
         results = []
+        scores = []
         client = OpenAI(api_key=score_api_key, base_url=score_api_url)
         for qa in qa_list:
             qa_id, question, answer = qa
             try:
-                response = client.chat.completions.create(
+                response = await asyncio.to_thread(
+                    client.chat.completions.create,
                     model=score_model_name,
                     messages=[
                         {"role": "system", "content": "你是一个专业的评分助手，请根据提示词给出1-5分"},
@@ -1535,7 +2107,7 @@ async def auto_score_qa_pairs(data: dict = Body(...)):
                     return None
                 score = extract_score(score_str)
                 if score is not None and 1 <= score <= 5:
-                    c.execute("UPDATE qa_pairs SET score=? WHERE id=?", (score, qa_id))
+                    scores.append((score, qa_id))
                     results.append({"qa_id": qa_id, "score": score, "raw": score_str})
                 else:
                     logger.warning(f"评分无效(qa_id={qa_id}): {score_str}")
@@ -1543,8 +2115,8 @@ async def auto_score_qa_pairs(data: dict = Body(...)):
             except Exception as e:
                 logger.error(f"自动评分失败: {str(e)}")
                 results.append({"qa_id": qa_id, "score": None, "error": str(e)})
-        conn.commit()
-        conn.close()
+        # 评分结果在全部模型调用结束后一次写入
+        await async_db.executemany("UPDATE qa_pairs SET score=? WHERE id=?", scores)
         return {"status": "success", "results": results}
     except Exception as e:
         logger.error(f"自动评分接口异常: {str(e)}")
@@ -1557,15 +2129,13 @@ async def batch_delete_chunks(data: dict = Body(...)):
         ids = data.get("ids", [])
         if not ids:
             return {"status": "error", "message": "缺少分块ID列表"}
-        conn = get_db()
-        c = conn.cursor()
-        for chunk_id in ids:
+        def delete(conn):
+            rows = [(chunk_id,) for chunk_id in ids]
             # 删除 qa_pairs 表中关联的问答对
-            c.execute("DELETE FROM qa_pairs WHERE segment_id = ?", (chunk_id,))
+            conn.executemany(DELETE_SEGMENT_QA_SQL, rows)
             # 删除 text_segments 表中的分块
-            c.execute("DELETE FROM text_segments WHERE id = ?", (chunk_id,))
-        conn.commit()
-        conn.close()
+            conn.executemany("DELETE FROM text_segments WHERE id = ?", rows)
+        await async_db.run(delete)
         return {"status": "success", "message": "批量删除完成"}
     except Exception as e:
         logger.error(f"批量删除分块失败: {str(e)}")
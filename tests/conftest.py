@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测试直接从仓库根目录导入 app 包
+sys.path.insert(0, ROOT)
+# 必须在导入 app 之前设置：默认数据库指向临时目录，测试不会改动仓库下的 dataset_bit.db
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="dataset-bit-test-"), "dataset_bit.db")
+
+@pytest.fixture(scope="session")
+def main_module():
+    """导入 main（启动时迁移 DATABASE_PATH 指向的临时库）；静态文件目录按仓库根目录解析"""
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    return main
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "test.db")
+
+@pytest.fixture
+def text_dirs(tmp_path, monkeypatch):
+    """提取文本的缓存目录与持久目录都放到临时目录，返回 (缓存目录, 持久目录)"""
+    from app.utils import text_extractor
+    cache_dir, store_dir = str(tmp_path / "cache"), str(tmp_path / "text")
+    monkeypatch.setattr(text_extractor, "TEXT_CACHE_DIR", cache_dir)
+    monkeypatch.setattr(text_extractor, "TEXT_STORE_DIR", store_dir)
+    return cache_dir, store_dir
@@ -0,0 +1,56 @@
+import pytest
+
+from app.models.connection import get_connection, insert_many, iter_batches
+
+SCHEMAS = {
+    "rowid": "CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)",
+    "autoincrement": "CREATE TABLE items (id INTEGER PRIMARY KEY AUTOINCREMENT, value TEXT)",
+}
+
+def make_table(path, schema):
+    conn = get_connection(path)
+    conn.execute(SCHEMAS[schema])
+    # 已有数据中留出空洞：删除偶数 id，再插入并删除一个大 id
+    conn.executemany("INSERT INTO items (id, value) VALUES (?, ?)", [(i, f"old-{i}") for i in range(1, 51)])
+    conn.execute("DELETE FROM items WHERE id % 2 = 0")
+    conn.execute("INSERT INTO items (id, value) VALUES (5000, 'high')")
+    conn.execute("DELETE FROM items WHERE id = 5000")
+    conn.execute("INSERT INTO items (id, value) VALUES (700, 'kept')")
+    conn.commit()
+    return conn
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+def test_insert_many_returns_ids_of_inserted_rows_in_order(db_path, schema):
+    conn = make_table(db_path, schema)
+    values = [f"new-{i}" for i in range(2500)]
+    progress = []
+    ids = insert_many(conn.cursor(), "INSERT INTO items (value) VALUES (?)", ((v,) for v in values),
+                      batch_size=1000, on_batch=progress.append)
+    conn.commit()
+
+    assert progress == [1000, 2000, 2500]
+    assert len(ids) == len(set(ids)) == len(values)
+    stored = dict(conn.execute("SELECT id, value FROM items WHERE value LIKE 'new-%'").fetchall())
+    assert sorted(stored) == sorted(ids)
+    assert [stored[i] for i in ids] == values
+    conn.close()
+
+def test_insert_many_continues_after_rows_inserted_between_batches(db_path):
+    conn = make_table(db_path, "rowid")
+    c = conn.cursor()
+    first = insert_many(c, "INSERT INTO items (value) VALUES (?)", [("a",), ("b",)], batch_size=1)
+    c.execute("INSERT INTO items (value) VALUES ('other')")
+    second = insert_many(c, "INSERT INTO items (value) VALUES (?)", [("c",), ("d",), ("e",)], batch_size=2)
+    conn.commit()
+    values = [conn.execute("SELECT value FROM items WHERE id = ?", (i,)).fetchone()[0] for i in first + second]
+    assert values == ["a", "b", "c", "d", "e"]
+    conn.close()
+
+def test_insert_many_with_no_rows(db_path):
+    conn = make_table(db_path, "rowid")
+    assert insert_many(conn.cursor(), "INSERT INTO items (value) VALUES (?)", []) == []
+    conn.close()
+
+def test_iter_batches_splits_iterators():
+    assert [len(b) for b in iter_batches(iter(range(2500)), 1000)] == [1000, 1000, 500]
+    assert list(iter_batches([], 10)) == []
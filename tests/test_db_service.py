@@ -0,0 +1,26 @@
+from app.models.connection import WRITE_BATCH_SIZE, get_connection
+from app.services.db_service import DBService
+
+def test_save_text_segments_returns_ids_in_input_order_across_batches(db_path):
+    service = DBService(db_path)
+    file_id = service.save_file("a.txt", "a.txt", "txt", 1)
+    # 已有分块的 id 中留出空洞
+    first = service.save_text_segments(file_id, [f"old-{i}" for i in range(10)])
+    conn = get_connection(db_path)
+    conn.execute("DELETE FROM text_segments WHERE id IN (?, ?, ?)", (first[2], first[5], first[-1]))
+    conn.commit()
+    conn.close()
+
+    segments = [f"段落 {i}" for i in range(WRITE_BATCH_SIZE * 2 + 500)]
+    progress = []
+    ids = service.save_text_segments(file_id, segments, start_index=7, on_progress=progress.append)
+
+    assert progress == [WRITE_BATCH_SIZE, WRITE_BATCH_SIZE * 2, len(segments)]
+    assert len(set(ids)) == len(segments)
+    assert not set(ids) & set(first)
+    conn = get_connection(db_path)
+    stored = {row["id"]: (row["content"], row["segment_index"]) for row in conn.execute(
+        "SELECT id, content, segment_index FROM text_segments WHERE content LIKE '段落%'")}
+    conn.close()
+    assert sorted(stored) == sorted(ids)
+    assert [stored[i] for i in ids] == [(segment, i + 7) for i, segment in enumerate(segments)]
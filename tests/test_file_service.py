@@ -0,0 +1,83 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.file_service import FileService, FileTooLargeError
+
+BOUNDARY = "test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+def multipart_body(filename: str, content: bytes, field: str = "file") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f"Content-Disposition: form-data; name=\"note\"\r\n\r\nhello\r\n"
+        f"--{BOUNDARY}\r\n"
+        f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+async def chunked(body: bytes, size: int = 1000):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+def save(service, body, **kwargs):
+    return asyncio.run(service.save_multipart_upload(chunked(body), CONTENT_TYPE, **kwargs))
+
+def test_saves_file_field_from_stream(tmp_path):
+    service = FileService(str(tmp_path))
+    content = os.urandom(50000)
+    progress = []
+    saved = save(service, multipart_body("数据.txt", content), on_progress=progress.append)
+    assert saved["filename"] == "数据.txt"
+    assert saved["file_type"] == "txt"
+    assert saved["size"] == len(content)
+    assert saved["sha256"] == hashlib.sha256(content).hexdigest()
+    with open(saved["file_path"], "rb") as f:
+        assert f.read() == content
+    # 进度按收到的请求体字节数上报
+    assert progress[-1] == len(multipart_body("数据.txt", content))
+
+def test_rejects_declared_length_without_reading(tmp_path):
+    service = FileService(str(tmp_path))
+
+    async def never_read():
+        raise AssertionError("超限的请求体不应被读取")
+        yield b""
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(service.save_multipart_upload(never_read(), CONTENT_TYPE, content_length=10 ** 9, max_size=1000))
+
+def test_aborts_stream_past_limit(tmp_path):
+    service = FileService(str(tmp_path))
+    with pytest.raises(FileTooLargeError):
+        save(service, multipart_body("a.txt", b"x" * 5000), max_size=4000)
+    # 中止时删除写了一半的临时文件
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+def test_rejects_disallowed_type_and_missing_field(tmp_path):
+    service = FileService(str(tmp_path))
+    with pytest.raises(ValueError, match="不支持的文件类型"):
+        save(service, multipart_body("a.exe", b"x"), allowed_types=["txt"])
+    with pytest.raises(ValueError, match="缺少上传文件字段"):
+        save(service, multipart_body("a.txt", b"x", field="other"))
+
+def test_upload_endpoint_streams_past_limit_to_413(main_module, tmp_path, monkeypatch):
+    service = FileService(str(tmp_path))
+    monkeypatch.setattr(main_module, "file_service", service)
+    monkeypatch.setattr(main_module, "MAX_UPLOAD_SIZE", 4000)
+    body = multipart_body("a.txt", b"x" * 20000)
+
+    def stream():
+        # 分块发送且不带 Content-Length，只能在接收过程中发现超限
+        for i in range(0, len(body), 1000):
+            yield body[i:i + 1000]
+
+    response = TestClient(main_module.app).post("/api/upload?upload_id=u1", content=stream(),
+                                                headers={"content-type": CONTENT_TYPE})
+    assert response.status_code == 413
+    # 写了一半的临时文件已删除，也没有存入按摘要存放的位置
+    assert os.listdir(tmp_path) == []
+    assert "u1" not in main_module.upload_progress
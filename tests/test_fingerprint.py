@@ -0,0 +1,139 @@
+import json
+import random
+
+import openai
+from fastapi.testclient import TestClient
+
+from app.models.connection import get_connection
+from app.models.migrations import run_migrations
+from app.utils.fingerprint import (
+    NEAR_DUPLICATE_DISTANCE, SIMHASH_BITS, hamming_distance, simhash, simhash_band_sql, simhash_bands,
+)
+from app.utils.text_splitter import chunk_hash
+
+FOOTER = ("Copyright 2024 ACME Corporation. All rights reserved. This document is confidential "
+          "and may not be distributed without written permission.")
+NEAR_FOOTER = FOOTER.replace("2024", "2025")
+OTHER = "SQLite stores integers in up to eight bytes and reuses freed pages for later inserts."
+
+def test_simhash_ignores_case_and_whitespace_layout():
+    assert simhash(FOOTER) == simhash("  " + FOOTER.upper().replace(" ", "\n\t "))
+    assert simhash("") == simhash("   ") == 0
+
+def test_near_duplicates_are_close_and_unrelated_text_is_far():
+    assert 0 < hamming_distance(simhash(FOOTER), simhash(NEAR_FOOTER)) <= NEAR_DUPLICATE_DISTANCE
+    assert hamming_distance(simhash(FOOTER), simhash(OTHER)) > NEAR_DUPLICATE_DISTANCE
+
+def test_fingerprint_fits_sqlite_integer_and_bands_match_sql():
+    conn = get_connection(":memory:")
+    rng = random.Random(0)
+    values = [simhash(FOOTER), simhash(OTHER), -1, -(1 << (SIMHASH_BITS - 1)), (1 << (SIMHASH_BITS - 1)) - 1]
+    values += [rng.randrange(-(1 << 63), 1 << 63) for _ in range(100)]
+    for value in values:
+        assert -(1 << 63) <= value < 1 << 63
+        sql = "SELECT " + ", ".join(simhash_band_sql("?")).replace("?", str(value))
+        assert list(conn.execute(sql).fetchone()) == simhash_bands(value)
+    conn.close()
+
+def test_find_duplicates_orders_exact_before_near_and_filters_by_qa(main_module, db_path):
+    conn = get_connection(db_path)
+    run_migrations(conn)
+    c = conn.cursor()
+    file_id = c.execute("""
+        INSERT INTO files (filename, file_path, file_type, file_size) VALUES ('a.txt', 'a.txt', 'txt', 1)
+    """).lastrowid
+    ids = {}
+    for i, (name, text) in enumerate([("target", FOOTER), ("exact", FOOTER), ("near", NEAR_FOOTER),
+                                      ("other", OTHER)]):
+        ids[name] = c.execute("""
+            INSERT INTO text_segments (file_id, content, segment_index, content_hash, simhash) VALUES (?, ?, ?, ?, ?)
+        """, (file_id, text, i, chunk_hash(text), simhash(text))).lastrowid
+    c.execute("INSERT INTO qa_pairs (segment_id, file_id, question, answer) VALUES (?, ?, 'q', 'a')",
+              (ids["near"], file_id))
+
+    matches = main_module.find_duplicates(c, ids["target"], chunk_hash(FOOTER), simhash(FOOTER))
+    assert [(m["id"], m["exact"]) for m in matches] == [(ids["exact"], True), (ids["near"], False)]
+    assert matches[0]["distance"] == 0 and 0 < matches[1]["distance"] <= NEAR_DUPLICATE_DISTANCE
+    with_qa = main_module.find_duplicates(c, ids["target"], chunk_hash(FOOTER), simhash(FOOTER), with_qa=True)
+    assert [m["id"] for m in with_qa] == [ids["near"]]
+    assert main_module.find_duplicates(c, ids["other"], chunk_hash(OTHER), simhash(OTHER)) == []
+    conn.rollback()
+    conn.close()
+
+def add_doc(path, tag, footer):
+    path.write_text("\n\n".join([f"{tag} paragraph {i} covers topic {tag}{i} in its own words." for i in range(3)]
+                                 + [footer]), encoding="utf-8")
+    conn = get_connection()
+    file_id = conn.execute("""
+        INSERT INTO files (filename, file_path, file_type, file_size) VALUES (?, ?, 'txt', 1)
+    """, (path.name, str(path))).lastrowid
+    conn.commit()
+    conn.close()
+    return file_id
+
+def segment_ids(file_id):
+    conn = get_connection()
+    ids = [row[0] for row in conn.execute(
+        "SELECT id FROM text_segments WHERE file_id = ? ORDER BY segment_index", (file_id,))]
+    conn.close()
+    return ids
+
+def qa_counts(file_id):
+    conn = get_connection()
+    counts = dict(conn.execute(
+        "SELECT segment_id, COUNT(*) FROM qa_pairs WHERE file_id = ? GROUP BY segment_id", (file_id,)).fetchall())
+    conn.close()
+    return counts
+
+class FakeCompletion:
+    def __init__(self, content):
+        message = type("Message", (), {"content": content})
+        self.choices = [type("Choice", (), {"message": message})]
+
+def test_generate_qa_skips_or_reuses_near_duplicate_segments(main_module, tmp_path, text_dirs, monkeypatch):
+    a = add_doc(tmp_path / "a.txt", "alpha", FOOTER)
+    b = add_doc(tmp_path / "b.txt", "beta", FOOTER)
+    c = add_doc(tmp_path / "c.txt", "gamma", NEAR_FOOTER)
+    for file_id in (a, b, c):
+        assert main_module.run_split(file_id, "paragraph", 200, 0)
+    conn = get_connection()
+    conn.execute("""
+        INSERT OR REPLACE INTO settings (id, api_base, api_key, model_name) VALUES (1, 'http://llm.test', 'k', 'm')
+    """)
+    conn.commit()
+    conn.close()
+    calls = []
+    def create(**kwargs):
+        calls.append(kwargs["messages"][-1]["content"])
+        return FakeCompletion(json.dumps([{"question": f"q{len(calls)}", "answer": "a"}]))
+    monkeypatch.setattr(openai.chat.completions, "create", create)
+    monkeypatch.setattr(openai, "api_key", openai.api_key)
+    monkeypatch.setattr(openai, "base_url", openai.base_url)
+    client = TestClient(main_module.app)
+
+    def generate(file_id, dedup):
+        return client.post("/api/generate-qa", json={
+            "segments": [{"id": i} for i in segment_ids(file_id)], "num_pairs": 1, "file_id": file_id, "dedup": dedup,
+        }).json()
+
+    duplicates = client.get(f"/api/files/{c}/duplicates").json()
+    assert duplicates["duplicate_count"] == 1 and duplicates["exact_count"] == 0
+    assert {m["file_id"] for d in duplicates["duplicates"] for m in d["matches"]} == {a, b}
+    assert client.get(f"/api/files/{c}/duplicates", params={"with_qa": True}).json()["duplicate_count"] == 0
+
+    assert generate(a, "none")["count"] == 4 and len(calls) == 4
+    # b 的页脚与 a 完全相同：复制 a 已生成的问答对，不再调用模型
+    result = generate(b, "reuse")
+    assert (result["count"], result["reused"], result["skipped"], len(calls)) == (4, 1, 0, 7)
+    assert all(FOOTER not in prompt for prompt in calls[4:])
+    conn = get_connection()
+    questions = [row[0] for row in conn.execute(
+        "SELECT question FROM qa_pairs WHERE segment_id IN (?, ?) ORDER BY id", (segment_ids(a)[-1], segment_ids(b)[-1]))]
+    conn.close()
+    assert questions == ["q4", "q4"]
+    # c 的页脚只差一个年份（近似重复）：跳过，不生成也不复制
+    result = generate(c, "skip")
+    assert (result["count"], result["reused"], result["skipped"], len(calls)) == (3, 0, 1, 10)
+    assert segment_ids(c)[-1] not in qa_counts(c)
+    assert sorted(qa_counts(c)) == segment_ids(c)[:-1]
+    assert generate(c, "bad")["status"] == "error"
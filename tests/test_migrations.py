@@ -0,0 +1,113 @@
+import pytest
+
+from app.models import migrations
+from app.models.connection import get_connection
+from app.models.migrations import LATEST_VERSION, run_migrations, schema_version
+
+# 早期 init_db.sql 建出的表：缺少偏移、摘要、文本版本等列，问答对的 file_id 为空
+OLD_SCHEMA = """
+    CREATE TABLE files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT '待处理'
+    );
+    CREATE TABLE text_segments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        segment_index INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE qa_pairs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        segment_id INTEGER NOT NULL,
+        question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        file_id INTEGER,
+        score INTEGER
+    );
+    CREATE TABLE segments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER,
+        content TEXT NOT NULL,
+        segment_index INTEGER NOT NULL,
+        created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO files (id, filename, file_path, file_type, file_size) VALUES (1, 'a.txt', 'a.txt', 'txt', 1);
+    INSERT INTO files (id, filename, file_path, file_type, file_size) VALUES (2, 'b.txt', 'b.txt', 'txt', 1);
+    INSERT INTO text_segments (id, file_id, content, segment_index) VALUES (10, 1, 'x', 0);
+    INSERT INTO segments (id, file_id, content, segment_index) VALUES (20, 2, 'y', 0);
+    INSERT INTO qa_pairs (id, segment_id, question, answer) VALUES (1, 10, 'q1', 'a1');
+    INSERT INTO qa_pairs (id, segment_id, question, answer) VALUES (2, 20, 'q2', 'a2');
+    INSERT INTO qa_pairs (id, segment_id, question, answer, file_id) VALUES (3, 10, 'q3', 'a3', 2);
+"""
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def objects(conn):
+    return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+
+def test_fresh_database_reaches_latest_version(db_path):
+    conn = get_connection(db_path)
+    assert run_migrations(conn) == [1, 2, 3, 4]
+    assert schema_version(conn) == LATEST_VERSION == 4
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {"idx_text_segments_file_id_segment_index", "idx_qa_pairs_segment_id",
+            "idx_qa_pairs_file_id_score", "idx_files_created_at"} <= indexes
+    conn.close()
+
+def test_second_run_executes_no_ddl(db_path):
+    conn = get_connection(db_path)
+    run_migrations(conn)
+    before = objects(conn)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        assert run_migrations(conn) == []
+    finally:
+        conn.set_trace_callback(None)
+    assert statements and all(s.lstrip().upper().startswith("SELECT") for s in statements)
+    assert objects(conn) == before
+    conn.close()
+
+def test_old_database_gains_columns_and_qa_file_id(db_path):
+    conn = get_connection(db_path)
+    conn.executescript(OLD_SCHEMA)
+    assert run_migrations(conn) == [1, 2, 3, 4]
+    assert {"file_hash", "encoding", "split_params", "text_version"} <= columns(conn, "files")
+    assert {"start_offset", "end_offset", "token_count", "content_hash", "simhash"} <= columns(conn, "text_segments")
+    # 分块在 text_segments 中按其 file_id，只在旧 segments 表中时按旧表，已有的 file_id 保持不变
+    assert [tuple(row) for row in conn.execute("SELECT id, file_id FROM qa_pairs ORDER BY id")] == [(1, 1), (2, 2), (3, 2)]
+    assert conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 1
+    conn.close()
+
+def test_failed_migration_rolls_back_with_its_version(db_path, monkeypatch):
+    conn = get_connection(db_path)
+    run_migrations(conn)
+
+    def broken(c):
+        c.execute("CREATE TABLE half_done (id INTEGER)")
+        c.execute("INSERT INTO files (filename, file_path, file_type, file_size) VALUES ('x', 'x', 'txt', 1)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [(5, "broken", broken)])
+    monkeypatch.setattr(migrations, "LATEST_VERSION", 5)
+    with pytest.raises(RuntimeError):
+        run_migrations(conn)
+    assert not conn.in_transaction
+    assert schema_version(conn) == 4
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone()
+    assert conn.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+
+    # 修复后下次启动重试同一编号
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:-1] + [(5, "fixed", lambda c: None)])
+    assert run_migrations(conn) == [5]
+    assert schema_version(conn) == 5
+    conn.close()
@@ -0,0 +1,20 @@
+from app.models import indexes
+from app.models.connection import get_connection
+from app.models.indexes import full_scans
+from app.models.migrations import run_migrations
+
+def test_hot_queries_use_indexes(db_path):
+    conn = get_connection(db_path)
+    run_migrations(conn)
+    assert full_scans(conn) == []
+    conn.close()
+
+def test_full_scan_through_alias_is_reported(db_path, monkeypatch):
+    conn = get_connection(db_path)
+    run_migrations(conn)
+    monkeypatch.setattr(indexes, "HOT_QUERIES", [
+        ("按问题查找", "SELECT qa.id FROM qa_pairs qa WHERE qa.question = ?", ("",)),
+        ("按文件名查找", "SELECT f.id FROM files AS f WHERE f.filename = ?", ("",)),
+    ])
+    assert full_scans(conn) == [("按问题查找", "SCAN qa")]
+    conn.close()
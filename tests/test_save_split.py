@@ -0,0 +1,129 @@
+import os
+import shutil
+
+from app.models.connection import get_connection
+from app.models.migrations import run_migrations
+from app.models.queries import SEGMENT_COLUMNS
+from app.utils import text_extractor
+from app.utils.text_extractor import TextSpanReader, text_cache_path
+
+COUNT = 2500
+FILE_HASH = "ab" * 32
+
+def split_rows(digests, step):
+    return [(i * step, i * step + step, 5, digest, i) for i, digest in enumerate(digests)]
+
+def segments(path, file_id):
+    conn = get_connection(path)
+    rows = conn.execute("""
+        SELECT id, segment_index, start_offset, end_offset, content_hash FROM text_segments
+        WHERE file_id = ? ORDER BY segment_index
+    """, (file_id,)).fetchall()
+    conn.close()
+    return rows
+
+def test_save_split_updates_matching_segments_and_inserts_new_ones(main_module, db_path, text_dirs):
+    conn = get_connection(db_path)
+    run_migrations(conn)
+    file_id = conn.execute("""
+        INSERT INTO files (filename, file_path, file_type, file_size, file_hash) VALUES ('a.txt', 'a.txt', 'txt', 1, ?)
+    """, (FILE_HASH,)).lastrowid
+    conn.commit()
+    cache_path = text_cache_path(FILE_HASH, "txt")
+    os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, "w", encoding="utf-8") as f:
+        f.write("x" * COUNT * 20)
+
+    first = [f"d{i}" for i in range(COUNT)]
+    assert main_module._save_split(get_connection(db_path), file_id, iter(split_rows(first, 10)),
+                                   "k1", "txt", FILE_HASH, None, {})
+    saved = segments(db_path, file_id)
+    assert [row["content_hash"] for row in saved] == first
+    assert [row["segment_index"] for row in saved] == list(range(COUNT))
+    ids = {row["content_hash"]: row["id"] for row in saved}
+
+    conn = get_connection(db_path)
+    conn.executemany("INSERT INTO qa_pairs (segment_id, file_id, question, answer) VALUES (?, ?, 'q', 'a')",
+                     [(ids["d3"], file_id), (ids["d4"], file_id)])
+    conn.commit()
+    conn.close()
+
+    # 每三个分块替换一个：每批中更新与插入交错，被替换的旧分块（如 d4）成为过期分块
+    second = [f"d{i}" if i % 3 != 1 else f"n{i}" for i in range(COUNT)]
+    assert main_module._save_split(get_connection(db_path), file_id, iter(split_rows(second, 20)),
+                                   "k2", "txt", FILE_HASH, None, {})
+    saved = segments(db_path, file_id)
+    assert [row["content_hash"] for row in saved] == second
+    assert [(row["segment_index"], row["start_offset"], row["end_offset"]) for row in saved] == \
+        [(i, i * 20, i * 20 + 20) for i in range(COUNT)]
+    for row in saved:
+        if row["content_hash"].startswith("d"):
+            assert row["id"] == ids[row["content_hash"]]
+    assert len({row["id"] for row in saved}) == COUNT
+
+    conn = get_connection(db_path)
+    qa_segments = [row[0] for row in conn.execute("SELECT segment_id FROM qa_pairs")]
+    assert qa_segments == [ids["d3"]]
+    status, params = conn.execute("SELECT status, split_params FROM files WHERE id = ?", (file_id,)).fetchone()
+    assert (status, params) == ("已分块", "k2")
+    conn.close()
+    assert main_module.split_progress[file_id] == {"current": COUNT, "total": COUNT, "status": "done"}
+
+def read_segments(file_id):
+    conn = get_connection()
+    rows = conn.execute(f"""
+        SELECT {SEGMENT_COLUMNS} FROM text_segments s JOIN files f ON f.id = s.file_id
+        WHERE s.file_id = ? ORDER BY s.segment_index
+    """, (file_id,)).fetchall()
+    conn.close()
+    with TextSpanReader() as reader:
+        return [reader.segment_text(row) for row in rows]
+
+def test_saved_segments_survive_cache_loss_and_extractor_upgrade(main_module, tmp_path, text_dirs, monkeypatch):
+    source = tmp_path / "doc.txt"
+    source.write_text("第一段内容。\n\n第二段内容。\n\n第三段内容。", encoding="utf-8")
+    conn = get_connection()
+    file_id = conn.execute("""
+        INSERT INTO files (filename, file_path, file_type, file_size) VALUES ('doc.txt', ?, 'txt', 1)
+    """, (str(source),)).lastrowid
+    conn.commit()
+    conn.close()
+    assert main_module.run_split(file_id, "paragraph", 100, 0)
+    expected = read_segments(file_id)
+    assert expected == ["第一段内容。", "第二段内容。", "第三段内容。"]
+
+    # 清空提取缓存并升级提取器版本：已保存的分块仍从持久目录读出原来的内容
+    shutil.rmtree(text_dirs[0])
+    monkeypatch.setitem(text_extractor.EXTRACTOR_VERSIONS, "txt", text_extractor.EXTRACTOR_VERSIONS["txt"] + 1)
+    assert read_segments(file_id) == expected
+    assert not os.path.exists(text_dirs[0])
+
+def add_file(path):
+    conn = get_connection()
+    file_id = conn.execute("""
+        INSERT INTO files (filename, file_path, file_type, file_size) VALUES (?, ?, 'txt', 1)
+    """, (os.path.basename(path), str(path))).lastrowid
+    conn.commit()
+    conn.close()
+    return file_id
+
+def stored_encoding(file_id):
+    conn = get_connection()
+    encoding = conn.execute("SELECT encoding FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+    conn.close()
+    return encoding
+
+def test_split_stores_encoding_only_when_one_codec_decodes_the_whole_file(main_module, tmp_path, text_dirs):
+    prefix = "前缀内容。" * (text_extractor.ENCODING_SAMPLE_SIZE // 10)
+    mixed = tmp_path / "mixed.txt"
+    mixed.write_bytes(prefix.encode("utf-8") + "\n\n国标编码的结尾。".encode("gbk"))
+    gbk = tmp_path / "gbk.txt"
+    gbk.write_bytes("国标编码的内容。".encode("gbk"))
+    mixed_id, gbk_id = add_file(mixed), add_file(gbk)
+
+    assert main_module.run_split(mixed_id, "paragraph", 100000, 0)
+    assert main_module.run_split(gbk_id, "paragraph", 1000, 0)
+    # UTF-8 前缀之后改用 gb18030：不记录编码，下次重新检测，而不是把整份文件按 gb18030 解码
+    assert stored_encoding(mixed_id) is None
+    assert read_segments(mixed_id)[-1] == "国标编码的结尾。"
+    assert stored_encoding(gbk_id) == "gb18030"
@@ -0,0 +1,23 @@
+import numpy as np
+
+from app.utils.semantic_splitter import adjacent_similarity, semantic_split, split_sentences
+
+def test_length_changing_lowercase_keeps_features_aligned():
+    # 'İ'.lower() 是两个码点；逐句特征仍须取自各句自己的字符
+    text = "İİİİ。猫喜欢吃鱼。猫喜欢吃鱼。狗喜欢啃骨头。"
+    reference = text.replace("İ", "i")
+    assert len("İ".lower()) == 2
+    assert split_sentences(text) == split_sentences(reference)
+    np.testing.assert_allclose(adjacent_similarity(text, split_sentences(text)),
+                               adjacent_similarity(reference, split_sentences(reference)))
+
+def test_identical_sentences_are_most_similar():
+    text = "İstanbul 很大。猫喜欢吃鱼。猫喜欢吃鱼。狗喜欢啃骨头。"
+    similarity = adjacent_similarity(text, split_sentences(text), window=1)
+    assert np.argmax(similarity) == 1
+    assert similarity[1] > 0.99
+
+def test_semantic_split_covers_all_sentences():
+    text = "İ 开头的句子。" + "第一段讲猫。猫喜欢鱼。" * 5 + "第二段讲狗。狗喜欢骨头。" * 5
+    chunks = semantic_split(text, min_tokens=5, max_tokens=40)
+    assert "".join(chunks).replace(" ", "") == text.replace(" ", "")
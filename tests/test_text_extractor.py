@@ -0,0 +1,23 @@
+from app.utils.text_extractor import ENCODING_SAMPLE_SIZE, iter_file_text
+
+PREFIX = "前缀内容。" * (ENCODING_SAMPLE_SIZE // 10)
+SUFFIX = "后面是国标编码的内容。"
+
+def extract(path, encoding=None):
+    reported = []
+    text = ''.join(iter_file_text(str(path), "txt", encoding=encoding, on_encoding=reported.append))
+    return text, reported
+
+def test_single_encoding_is_reported(tmp_path):
+    utf8 = tmp_path / "utf8.txt"
+    utf8.write_bytes(PREFIX.encode("utf-8"))
+    gbk = tmp_path / "gbk.txt"
+    gbk.write_bytes(SUFFIX.encode("gbk") * 200)
+    assert extract(utf8) == (PREFIX, ["utf-8"])
+    assert extract(gbk) == (SUFFIX * 200, ["gb18030"])
+
+def test_switching_encoding_midway_reports_none(tmp_path):
+    path = tmp_path / "mixed.txt"
+    path.write_bytes(PREFIX.encode("utf-8") + SUFFIX.encode("gbk"))
+    # UTF-8 前缀之后改用 gb18030 解码，内容完整，但任何单一编码都不能正确解码整份文件
+    assert extract(path) == (PREFIX + SUFFIX, [None])
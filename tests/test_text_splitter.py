@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from app.utils.text_splitter import SENTENCE_ENDINGS, SNAP_MIN_RATIO, _snapped_window_bounds, _window_step
+from app.utils.tokenizer import token_starts
+
+def reference_bounds(block, starts, block_size, overlap_rate):
+    """按定义逐个边界线性查找的吸附窗口，作为对照"""
+    char_pos = list(range(len(block) + 1)) if starts is None else starts + [len(block)]
+    size = len(char_pos) - 1
+    bounds = [k for k in range(1, size) if block[char_pos[k] - 1] in SENTENCE_ENDINGS]
+    overlap_size = block_size - _window_step(block_size, overlap_rate)
+    min_size = int(block_size * SNAP_MIN_RATIO)
+    result = []
+    begin = 0
+    while True:
+        limit = begin + block_size
+        if limit >= size:
+            end = size
+        else:
+            candidates = [b for b in bounds if begin + min_size < b <= limit]
+            end = candidates[-1] if candidates else limit
+        i, j = char_pos[begin], char_pos[end]
+        if block[i:j].strip():
+            result.append((i, j))
+        if end >= size:
+            return result
+        nxt = max(end - overlap_size, begin + 1)
+        candidates = [b for b in bounds if nxt <= b <= end]
+        begin = candidates[0] if candidates else nxt
+
+def random_text(rng, length):
+    density = rng.random()
+    return ''.join(rng.choice("ab 中文🙂" + SENTENCE_ENDINGS) if rng.random() < density else rng.choice("xyz ")
+                   for _ in range(length))
+
+@pytest.mark.parametrize("seed", range(20))
+def test_snapped_windows_match_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        text = random_text(rng, rng.randint(0, 300))
+        block_size, overlap = rng.randint(1, 50), rng.randint(0, 99)
+        assert list(_snapped_window_bounds(text, None, block_size, overlap)) == \
+            reference_bounds(text, None, block_size, overlap)
+        starts = token_starts(text)
+        assert list(_snapped_window_bounds(text, starts, block_size, overlap)) == \
+            reference_bounds(text, starts, block_size, overlap)
+
+def test_window_ends_snap_to_sentence_end():
+    text = "第一句。第二句话比较长一些。" * 10
+    bounds = list(_snapped_window_bounds(text, None, 20, 0))
+    assert all(text[end - 1] == "。" for _, end in bounds)
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(text)
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from app.services.file_service import FileService
+from app.services.upload_service import UploadService
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+def expire(path, age):
+    old = time.time() - age
+    os.utime(path, (old, old))
+
+def start_session(service, data=b"partial"):
+    upload_id = service.create_session("a.txt", "txt", 100)["upload_id"]
+    asyncio.run(service.append(upload_id, 0, chunks(data)))
+    return upload_id
+
+def session_files(service):
+    return sorted(os.listdir(service.session_dir))
+
+def test_cleanup_removes_expired_meta_and_part_files(tmp_path):
+    service = UploadService(FileService(str(tmp_path / "uploads")), ttl=60)
+    expired = start_session(service)
+    active = start_session(service)
+    for ext in (".json", ".part"):
+        expire(os.path.join(service.session_dir, expired + ext), 3600)
+    # 会话信息已丢失的残留分片同样按 TTL 清理
+    orphan = os.path.join(service.session_dir, "0" * 32 + ".part")
+    open(orphan, "wb").close()
+    expire(orphan, 3600)
+
+    assert service.cleanup_expired() == 2
+    assert session_files(service) == [active + ".json", active + ".part"]
+    assert service.get_session(expired) is None
+    assert service.get_session(active)["offset"] == len(b"partial")
+
+def test_app_startup_cleans_expired_sessions_without_new_uploads(main_module, tmp_path, monkeypatch):
+    service = UploadService(FileService(str(tmp_path / "uploads")), ttl=60)
+    expired = start_session(service)
+    for ext in (".json", ".part"):
+        expire(os.path.join(service.session_dir, expired + ext), 3600)
+    monkeypatch.setattr(main_module, "upload_service", service)
+
+    with TestClient(main_module.app):
+        deadline = time.time() + 5
+        while session_files(service) and time.time() < deadline:
+            time.sleep(0.01)
+    assert session_files(service) == []